@@ -14,6 +14,13 @@ class AgenteAvaliador(BaseAgent):
     Foco: Rubrica ENEM ou avaliação geral
     """
     
+    config_id = "avaliador"
+    max_tokens = 2500
+    temperatura = 0.5
+    combinavel = True
+    
+    dependencias = ("gramatical", "logica", "estrutural")
+    
     def __init__(self):
         super().__init__(
             nome="Avaliador",
@@ -86,45 +93,35 @@ Retorne SEMPRE um JSON no seguinte formato:
     "sugestoes_melhoria": ["varie os conectivos", "fortaleça a proposta de intervenção"]
 }"""
     
-    async def analisar(
+    def montar_pedido(
         self,
         texto: str,
         tema: str,
         contexto: Dict[str, Any],
         analises_anteriores: Optional[Dict[str, Any]] = None
-    ) -> AvaliacaoFinal:
-        """
-        Analisa e pontua o texto
-        
-        Args:
-            texto: Texto da redação
-            tema: Tema da redação
-            contexto: Contexto adicional
-            analises_anteriores: Análises dos outros agentes (se disponível)
-        """
-        
-        user_prompt = self._formatar_texto_analise(texto, tema)
+    ) -> str:
+        pedido = ""
         
         # Se houver análises anteriores, incluir no contexto
         if analises_anteriores:
-            user_prompt += "\n\nANÁLISES ANTERIORES (use como referência):\n"
+            pedido += "ANÁLISES ANTERIORES (use como referência):\n"
             if "gramatical" in analises_anteriores:
-                user_prompt += f"Gramática: Nota {analises_anteriores['gramatical'].nota}\n"
+                pedido += f"Gramática: Nota {analises_anteriores['gramatical'].nota}\n"
             if "logica" in analises_anteriores:
-                user_prompt += f"Lógica: Nota {analises_anteriores['logica'].nota}\n"
+                pedido += f"Lógica: Nota {analises_anteriores['logica'].nota}\n"
             if "estrutural" in analises_anteriores:
-                user_prompt += f"Estrutura: Nota {analises_anteriores['estrutural'].nota}\n"
+                pedido += f"Estrutura: Nota {analises_anteriores['estrutural'].nota}\n"
+            pedido += "\n"
         
         tipo_redacao = contexto.get("tipo", "dissertativa")
         
         if tipo_redacao == "enem":
-            user_prompt += "\n\nAvalie esta redação segundo as 5 COMPETÊNCIAS DO ENEM."
+            pedido += "Avalie esta redação segundo as 5 COMPETÊNCIAS DO ENEM."
         else:
-            user_prompt += "\n\nAvalie esta redação de forma GERAL."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.5)
-        dados = resposta["content"]
-        
+            pedido += "Avalie esta redação de forma GERAL."
+        return pedido
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> AvaliacaoFinal:
         # Converter competências ENEM se existirem
         competencias = None
         if dados.get("competencias_enem"):
@@ -141,6 +138,29 @@ Retorne SEMPRE um JSON no seguinte formato:
             pontos_fracos=dados.get("pontos_fracos", []),
             sugestoes_melhoria=dados.get("sugestoes_melhoria", [])
         )
+    
+    async def analisar(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> AvaliacaoFinal:
+        """
+        Analisa e pontua o texto
+        
+        Args:
+            texto: Texto da redação
+            tema: Tema da redação
+            contexto: Contexto adicional
+            analises_anteriores: Análises dos outros agentes (se disponível)
+        """
+        
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto, analises_anteriores)
+        
+        resposta = await self._gerar_resposta(user_prompt)
+        return self.converter_resposta(resposta["content"])
 
 
 # Instância global do agente
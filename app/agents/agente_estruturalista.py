@@ -3,7 +3,7 @@ Agente 3: O Estruturalista (Structure & Flow)
 Disponível apenas no plano Premium
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from app.agents.base_agent import BaseAgent
 from app.schemas.redacao import AnaliseEstrutural, ProblemaEstrutural
 
@@ -14,6 +14,10 @@ class AgenteEstruturalista(BaseAgent):
     Foco: Conectivos, parágrafos e estrutura dissertativo-argumentativa
     """
     
+    config_id = "estruturalista"
+    max_tokens = 2000
+    temperatura = 0.3
+    
     def __init__(self):
         super().__init__(
             nome="Estruturalista",
@@ -80,15 +84,16 @@ Retorne SEMPRE um JSON no seguinte formato:
     "feedback_geral": "Análise da estrutura e coesão"
 }"""
     
-    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> AnaliseEstrutural:
-        """Analisa aspectos estruturais e de coesão do texto"""
-        
-        user_prompt = self._formatar_texto_analise(texto, tema)
-        user_prompt += "\n\nAnalise a ESTRUTURA e COESÃO deste texto."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.3)
-        dados = resposta["content"]
-        
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        return "Analise a ESTRUTURA e COESÃO deste texto."
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> AnaliseEstrutural:
         # Converter para schema Pydantic
         problemas = [
             ProblemaEstrutural(**problema) for problema in dados.get("problemas", [])
@@ -104,6 +109,15 @@ Retorne SEMPRE um JSON no seguinte formato:
             problemas=problemas,
             feedback_geral=dados["feedback_geral"]
         )
+    
+    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> AnaliseEstrutural:
+        """Analisa aspectos estruturais e de coesão do texto"""
+        
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto)
+        
+        resposta = await self._gerar_resposta(user_prompt)
+        return self.converter_resposta(resposta["content"])
 
 
 # Instância global do agente
@@ -3,9 +3,37 @@ Agente 1: O Gramático (Syntax & Style)
 Disponível no plano Free e Premium
 """
 
-from typing import Dict, Any, List
-from app.agents.base_agent import BaseAgent
+import asyncio
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import settings
+from app.agents.base_agent import BaseAgent, CallbackItemAgente
 from app.schemas.redacao import AnaliseGramatical, ErroGramatical
+from app.services.cache_paragrafos import cache_paragrafos_gramatica
+from app.utils.texto import spans_paragrafos
+
+
+# Faixas do SISTEMA DE PONTUAÇÃO do prompt: (mín. de erros, máx. de erros, nota no mín., nota no máx.)
+FAIXAS_NOTA = [
+    (0, 0, 10.0, 10.0),
+    (1, 2, 9.0, 8.0),
+    (3, 5, 7.5, 6.0),
+    (6, 10, 5.5, 4.0),
+]
+
+
+def nota_por_total_erros(total_erros: int) -> float:
+    """
+    Nota determinística a partir da quantidade de erros, na escala do prompt do Gramático
+    (usada quando a análise é montada a partir de partes, sem uma nota única do LLM)
+    """
+    for minimo, maximo, nota_minimo, nota_maximo in FAIXAS_NOTA:
+        if minimo <= total_erros <= maximo:
+            if maximo == minimo:
+                return nota_minimo
+            return round(nota_minimo + (nota_maximo - nota_minimo) * (total_erros - minimo) / (maximo - minimo), 2)
+    # Mais de 10 erros: 3.5 caindo 0.5 por erro
+    return max(0.0, 3.5 - 0.5 * (total_erros - 11))
 
 
 class AgenteGramatico(BaseAgent):
@@ -14,6 +42,12 @@ class AgenteGramatico(BaseAgent):
     Foco: Ortografia, regência, crase, pontuação e vícios de linguagem
     """
     
+    config_id = "gramatico"
+    max_tokens = 3000
+    temperatura = 0.3
+    combinavel = True
+    campos_stream = {"erros": "erro_gramatical"}
+    
     def __init__(self):
         super().__init__(
             nome="Gramático",
@@ -66,15 +100,22 @@ Retorne SEMPRE um JSON no seguinte formato:
     "feedback_geral": "Análise geral do texto"
 }"""
     
-    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> AnaliseGramatical:
-        """Analisa aspectos gramaticais do texto"""
-        
-        user_prompt = self._formatar_texto_analise(texto, tema)
-        user_prompt += "\n\nAnalise TODOS os aspectos gramaticais e estilísticos deste texto."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.3)
-        dados = resposta["content"]
-        
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        return "Analise TODOS os aspectos gramaticais e estilísticos deste texto."
+    
+    def montar_pedido_fatia(self) -> str:
+        return (
+            "Este é um TRECHO (um ou mais parágrafos) de uma redação maior. "
+            "Analise TODOS os aspectos gramaticais e estilísticos apenas deste trecho."
+        )
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> AnaliseGramatical:
         # Converter para schema Pydantic
         erros = [
             ErroGramatical(**erro) for erro in dados.get("erros", [])
@@ -87,6 +128,235 @@ Retorne SEMPRE um JSON no seguinte formato:
             vicios_linguagem=dados.get("vicios_linguagem", []),
             feedback_geral=dados["feedback_geral"]
         )
+    
+    def converter_item(self, caminho: Tuple[str, ...], dados: Dict[str, Any]) -> ErroGramatical:
+        return ErroGramatical(**dados)
+    
+    @property
+    def versao_prompt(self) -> str:
+        """Identifica o prompt do agente nas chaves do cache de parágrafos"""
+        return hashlib.sha256(self.get_system_prompt().encode("utf-8")).hexdigest()[:12]
+    
+    def fatias(self, texto: str, paragrafos: List[Tuple[int, int]], indices: List[int]) -> List[Tuple[int, int, List[int]]]:
+        """
+        Agrupa os parágrafos `indices` em fatias de parágrafos consecutivos para análise em paralelo.
+        Uma fatia é fechada ao atingir GRAMMAR_SHARD_MIN_CHARS (parágrafos curtos são agrupados).
+        
+        Returns:
+            (inicio, fim, índices dos parágrafos) de cada fatia
+        """
+        fatias: List[Tuple[int, int, List[int]]] = []
+        for indice in indices:
+            inicio, fim = paragrafos[indice]
+            if (
+                fatias and fatias[-1][2][-1] == indice - 1
+                and fatias[-1][1] - fatias[-1][0] < settings.GRAMMAR_SHARD_MIN_CHARS
+            ):
+                fatias[-1] = (fatias[-1][0], fim, fatias[-1][2] + [indice])
+            else:
+                fatias.append((inicio, fim, [indice]))
+        return fatias
+    
+    def _fatiar(self, texto: str) -> bool:
+        """Textos curtos (ou sharding desligado) vão numa chamada só"""
+        return settings.GRAMMAR_SHARDING_ENABLED and len(texto) >= settings.GRAMMAR_SHARDING_MIN_TEXT_CHARS
+    
+    async def combinavel_para(self, texto: str) -> bool:
+        """
+        Fica fora do painel combinado quando o caminho próprio é melhor que uma chamada
+        com o texto inteiro: texto em fatias ou com todos os parágrafos no cache
+        """
+        if self._fatiar(texto):
+            return False
+        paragrafos = spans_paragrafos(texto) or [(0, len(texto))]
+        return len(await self._buscar_cache(texto, paragrafos)) < len(paragrafos)
+    
+    async def guardar_parte_combinada(self, texto: str, analise: AnaliseGramatical):
+        """Análise do texto inteiro feita no painel: vai para o cache de parágrafos"""
+        paragrafos = spans_paragrafos(texto) or [(0, len(texto))]
+        self._ancorar(texto, analise)
+        await self._guardar_cache(texto, paragrafos, 0, list(range(len(paragrafos))), analise)
+    
+    @staticmethod
+    def _ancorar(trecho: str, analise: AnaliseGramatical):
+        """Posição de cada erro relativa ao trecho (mantém a já informada se bater com o texto)"""
+        for erro in analise.erros:
+            if (
+                erro.posicao_inicio is not None and erro.posicao_fim is not None
+                and 0 <= erro.posicao_inicio < erro.posicao_fim <= len(trecho)
+                and trecho[erro.posicao_inicio:erro.posicao_fim] == erro.trecho
+            ):
+                continue
+            posicao = trecho.find(erro.trecho) if erro.trecho else -1
+            if posicao != -1:
+                erro.posicao_inicio, erro.posicao_fim = posicao, posicao + len(erro.trecho)
+            else:
+                erro.posicao_inicio = erro.posicao_fim = None
+    
+    def juntar_fatias(self, partes: List[Tuple[int, str, AnaliseGramatical]]) -> AnaliseGramatical:
+        """
+        Junta as análises das fatias: erros com posição no texto completo,
+        total_erros recontado e nota determinística pela escala do prompt
+        """
+        erros: List[ErroGramatical] = []
+        vicios: List[str] = []
+        feedbacks: List[str] = []
+        for inicio, trecho, parte in sorted(partes, key=lambda p: p[0]):
+            self._ancorar(trecho, parte)
+            for erro in parte.erros:
+                if erro.posicao_inicio is not None:
+                    erro.posicao_inicio += inicio
+                    erro.posicao_fim += inicio
+                erros.append(erro)
+            vicios.extend(v for v in parte.vicios_linguagem if v not in vicios)
+            if parte.feedback_geral and parte.feedback_geral not in feedbacks:
+                feedbacks.append(parte.feedback_geral)
+        
+        return AnaliseGramatical(
+            nota=nota_por_total_erros(len(erros)),
+            erros=erros,
+            total_erros=len(erros),
+            vicios_linguagem=vicios,
+            feedback_geral=" ".join(feedbacks) or "Texto analisado a partir de parágrafos já corrigidos anteriormente."
+        )
+    
+    async def _buscar_cache(self, texto: str, paragrafos: List[Tuple[int, int]]) -> Dict[int, AnaliseGramatical]:
+        """Análises em cache dos parágrafos (índice -> análise com posições relativas ao parágrafo)"""
+        if cache_paragrafos_gramatica is None:
+            return {}
+        modelo = self._config_llm()["model"] or settings.LLM_MODEL
+        em_cache: Dict[int, AnaliseGramatical] = {}
+        for indice, (inicio, fim) in enumerate(paragrafos):
+            entrada = await cache_paragrafos_gramatica.buscar(texto[inicio:fim], modelo, self.versao_prompt)
+            if entrada is not None:
+                em_cache[indice] = AnaliseGramatical(
+                    nota=nota_por_total_erros(len(entrada["erros"])),
+                    erros=entrada["erros"],
+                    total_erros=len(entrada["erros"]),
+                    vicios_linguagem=entrada["vicios_linguagem"],
+                    feedback_geral=entrada["feedback_geral"]
+                )
+        return em_cache
+    
+    async def _guardar_cache(
+        self,
+        texto: str,
+        paragrafos: List[Tuple[int, int]],
+        inicio: int,
+        indices: List[int],
+        analise: AnaliseGramatical
+    ):
+        """
+        Guarda os erros de cada parágrafo de um trecho analisado (`analise` ancorada no trecho).
+        Erros sem posição ou atravessando parágrafos impedem o cache: não há como atribuí-los.
+        """
+        if cache_paragrafos_gramatica is None:
+            return
+        por_paragrafo: Dict[int, List[ErroGramatical]] = {indice: [] for indice in indices}
+        for erro in analise.erros:
+            if erro.posicao_inicio is None:
+                return
+            indice = next((
+                i for i in indices
+                if paragrafos[i][0] <= inicio + erro.posicao_inicio and inicio + erro.posicao_fim <= paragrafos[i][1]
+            ), None)
+            if indice is None:
+                return
+            deslocamento = inicio - paragrafos[indice][0]
+            por_paragrafo[indice].append(erro.model_copy(update={
+                "posicao_inicio": erro.posicao_inicio + deslocamento,
+                "posicao_fim": erro.posicao_fim + deslocamento
+            }))
+        
+        # Vícios e feedback só são do parágrafo quando o trecho tinha um parágrafo só
+        unico = len(indices) == 1
+        modelo = self._config_llm()["model"] or settings.LLM_MODEL
+        for indice, erros in por_paragrafo.items():
+            p_inicio, p_fim = paragrafos[indice]
+            await cache_paragrafos_gramatica.guardar(
+                texto[p_inicio:p_fim], modelo, self.versao_prompt, erros,
+                analise.vicios_linguagem if unico else [],
+                analise.feedback_geral if unico else ""
+            )
+    
+    async def _analisar_fatias(
+        self,
+        texto: str,
+        tema: str,
+        paragrafos: List[Tuple[int, int]],
+        fatias: List[Tuple[int, int, List[int]]],
+        ao_receber_item: Optional[CallbackItemAgente] = None
+    ) -> List[Tuple[int, str, AnaliseGramatical]]:
+        """Analisa as fatias concorrentemente (partes ancoradas em cada fatia)"""
+        print(f"[AGENT] {self.nome}: {len(fatias)} fatias em paralelo ({len(texto)} caracteres)")
+        
+        async def analisar_fatia(inicio: int, fim: int, indices: List[int]) -> Tuple[int, str, AnaliseGramatical]:
+            trecho = texto[inicio:fim]
+            user_prompt = self._formatar_texto_analise(trecho, tema) + "\n\n" + self.montar_pedido_fatia()
+            # Respostas das fatias são bem menores: histórico próprio para não reduzir
+            # o orçamento das chamadas com o texto inteiro
+            resposta = await self._gerar_resposta(
+                user_prompt, ao_receber_item=ao_receber_item, chave_orcamento=f"{self.config_id}_fatia"
+            )
+            parte = self.converter_resposta(resposta["content"])
+            self._ancorar(trecho, parte)
+            # Resposta do failover não entra no cache do modelo principal
+            if not resposta.get("failover"):
+                await self._guardar_cache(texto, paragrafos, inicio, indices, parte)
+            return inicio, trecho, parte
+        
+        tarefas = [asyncio.create_task(analisar_fatia(*fatia)) for fatia in fatias]
+        try:
+            return list(await asyncio.gather(*tarefas))
+        except BaseException:
+            # Uma fatia falhou (ou a análise foi cancelada): não deixar chamadas órfãs
+            for tarefa in tarefas:
+                tarefa.cancel()
+            raise
+    
+    async def analisar(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        ao_receber_item: Optional[CallbackItemAgente] = None
+    ) -> AnaliseGramatical:
+        """
+        Analisa aspectos gramaticais do texto.
+        Parágrafos já analisados vêm do cache; nos textos longos os demais
+        são analisados em fatias paralelas.
+        """
+        paragrafos = spans_paragrafos(texto) or [(0, len(texto))]
+        em_cache = await self._buscar_cache(texto, paragrafos)
+        faltantes = [i for i in range(len(paragrafos)) if i not in em_cache]
+        
+        partes = [(paragrafos[i][0], texto[paragrafos[i][0]:paragrafos[i][1]], analise) for i, analise in em_cache.items()]
+        if em_cache:
+            print(f"[AGENT] {self.nome}: {len(em_cache)} de {len(paragrafos)} paragrafos no cache")
+        
+        if not faltantes or self._fatiar(texto):
+            if ao_receber_item:
+                # Erros do cache são repassados de imediato, com posição no texto completo
+                for inicio, _, analise in partes:
+                    for erro in analise.erros:
+                        await ao_receber_item(self.campos_stream["erros"], erro.model_copy(update={
+                            "posicao_inicio": erro.posicao_inicio + inicio,
+                            "posicao_fim": erro.posicao_fim + inicio
+                        }))
+            if faltantes:
+                fatias = self.fatias(texto, paragrafos, faltantes)
+                partes += await self._analisar_fatias(texto, tema, paragrafos, fatias, ao_receber_item)
+            return self.juntar_fatias(partes)
+        
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto)
+        
+        resposta = await self._gerar_resposta(user_prompt, ao_receber_item=ao_receber_item)
+        analise = self.converter_resposta(resposta["content"])
+        if not resposta.get("failover"):
+            self._ancorar(texto, analise)
+            await self._guardar_cache(texto, paragrafos, 0, list(range(len(paragrafos))), analise)
+        return analise
 
 
 # Instância global do agente
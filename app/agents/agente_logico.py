@@ -3,8 +3,8 @@ Agente 2: O Lógico (Coherence & Argumentation)
 Disponível apenas no plano Premium
 """
 
-from typing import Dict, Any, List
-from app.agents.base_agent import BaseAgent
+from typing import Dict, Any, List, Optional, Tuple
+from app.agents.base_agent import BaseAgent, CallbackItemAgente
 from app.schemas.redacao import AnaliseLogica, ProblemaLogico
 
 
@@ -14,6 +14,11 @@ class AgenteLogico(BaseAgent):
     Foco: Tese, argumentos, falácias e coerência lógica
     """
     
+    config_id = "logico"
+    max_tokens = 2000
+    temperatura = 0.4
+    campos_stream = {"problemas": "problema_logico"}
+    
     def __init__(self):
         super().__init__(
             nome="Lógico",
@@ -70,15 +75,16 @@ Retorne SEMPRE um JSON no seguinte formato:
     "feedback_geral": "Análise completa da argumentação"
 }"""
     
-    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> AnaliseLogica:
-        """Analisa aspectos lógicos e argumentativos do texto"""
-        
-        user_prompt = self._formatar_texto_analise(texto, tema)
-        user_prompt += "\n\nAnalise a LÓGICA e ARGUMENTAÇÃO deste texto com rigor filosófico."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.4)
-        dados = resposta["content"]
-        
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        return "Analise a LÓGICA e ARGUMENTAÇÃO deste texto com rigor filosófico."
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> AnaliseLogica:
         # Converter para schema Pydantic
         problemas = [
             ProblemaLogico(**problema) for problema in dados.get("problemas", [])
@@ -93,6 +99,24 @@ Retorne SEMPRE um JSON no seguinte formato:
             falacias_detectadas=dados.get("falacias_detectadas", []),
             feedback_geral=dados["feedback_geral"]
         )
+    
+    def converter_item(self, caminho: Tuple[str, ...], dados: Dict[str, Any]) -> ProblemaLogico:
+        return ProblemaLogico(**dados)
+    
+    async def analisar(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        ao_receber_item: Optional[CallbackItemAgente] = None
+    ) -> AnaliseLogica:
+        """Analisa aspectos lógicos e argumentativos do texto"""
+        
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto)
+        
+        resposta = await self._gerar_resposta(user_prompt, ao_receber_item=ao_receber_item)
+        return self.converter_resposta(resposta["content"])
 
 
 # Instância global do agente
@@ -3,13 +3,41 @@ Agente Base - Classe abstrata para todos os agentes
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Tuple, Optional, Callable, Awaitable
+import logging
+from app.config import settings
 from app.services.llm_service import llm_service
+from app.services.llm_resilience import ErroLLM
+from app.services.orcamento_tokens import orcamento_saida
+
+logger = logging.getLogger(__name__)
+
+# Recebe (evento, item convertido) durante a geração — ver BaseAgent.campos_stream
+CallbackItemAgente = Callable[[str, Any], Awaitable[None]]
 
 
 class BaseAgent(ABC):
     """Classe base para todos os agentes"""
     
+    # Etapas do orquestrador cujos resultados o agente consome
+    # (recebidos em `analises_anteriores`). Vazio = agente independente.
+    dependencias: Tuple[str, ...] = ()
+    
+    # Identificador do agente em LLM_AGENT_CONFIG
+    config_id: str = ""
+    # Padrões do agente (model/max_tokens None = padrões globais do LLMService)
+    modelo: Optional[str] = None
+    max_tokens: Optional[int] = None
+    temperatura: float = 0.7
+    
+    # Agente pode ser fundido com outros numa única chamada (PainelCombinado);
+    # exige montar_pedido() e converter_resposta()
+    combinavel: bool = False
+    
+    # Arrays da resposta enviados item a item enquanto o LLM gera (campo do JSON -> nome do evento);
+    # exige converter_item() e um parâmetro `ao_receber_item` em analisar()
+    campos_stream: Dict[str, str] = {}
+    
     def __init__(self, nome: str, descricao: str):
         self.nome = nome
         self.descricao = descricao
@@ -35,31 +63,131 @@ class BaseAgent(ABC):
         """
         pass
     
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Instrução da tarefa (enviada após o texto da redação)"""
+        raise NotImplementedError
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> Any:
+        """Converte o JSON do LLM no schema de resultado do agente"""
+        raise NotImplementedError
+    
+    async def combinavel_para(self, texto: str) -> bool:
+        """Se o agente entra no painel combinado para este texto (padrão: `combinavel`)"""
+        return self.combinavel
+    
+    async def guardar_parte_combinada(self, texto: str, resultado: Any):
+        """Recebe a parte do agente vinda do painel combinado (ex.: para alimentar caches próprios)"""
+        pass
+    
+    def caminhos_stream(self) -> Dict[Tuple[str, ...], str]:
+        """Caminho no JSON de cada array de `campos_stream` -> nome do evento"""
+        return {(campo,): evento for campo, evento in self.campos_stream.items()}
+    
+    def converter_item(self, caminho: Tuple[str, ...], dados: Any) -> Any:
+        """Converte um elemento de um array de `campos_stream` no schema do item"""
+        raise NotImplementedError
+    
+    def montar_requisicao(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Prompts e parâmetros da chamada do agente (usado no envio em lote ao Batch API)"""
+        config = self._config_llm()
+        return {
+            "model": config["model"] or settings.LLM_MODEL,
+            "system_prompt": self.get_system_prompt(),
+            "user_prompt": self._formatar_texto_analise(texto, tema) + "\n\n"
+                + self.montar_pedido(texto, tema, contexto, analises_anteriores),
+            "max_tokens": config["max_tokens"],
+            "temperature": config["temperature"],
+        }
+    
+    def _config_llm(self) -> Dict[str, Any]:
+        """Modelo, max_tokens e temperatura do agente (LLM_AGENT_CONFIG sobrepõe os padrões)"""
+        config = settings.LLM_AGENT_CONFIG.get(self.config_id, {})
+        return {
+            "model": config.get("model", self.modelo),
+            "max_tokens": config.get("max_tokens", self.max_tokens) or settings.LLM_MAX_TOKENS,
+            "temperature": config.get("temperature", self.temperatura),
+        }
+    
     async def _gerar_resposta(
         self,
         user_prompt: str,
-        temperature: float = 0.7,
-        json_mode: bool = True
+        temperature: Optional[float] = None,
+        json_mode: bool = True,
+        ao_receber_item: Optional[CallbackItemAgente] = None,
+        chave_orcamento: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Gera resposta usando o LLM
         
         Args:
             user_prompt: Prompt do usuário
-            temperature: Temperatura do modelo
+            temperature: Temperatura do modelo (None = configuração do agente)
             json_mode: Se deve retornar JSON
+            ao_receber_item: Recebe os itens de `campos_stream` conforme são gerados
+            chave_orcamento: Histórico do orçamento adaptativo (None = config_id do agente);
+                chamadas de tamanho bem diferente do usual devem ter histórico próprio
             
         Returns:
             Resposta do LLM
         """
         system_prompt = self.get_system_prompt()
+        config = self._config_llm()
+        teto = config["max_tokens"]
         
-        return await self.llm_service.generate(
+        chave_orcamento = chave_orcamento or self.config_id
+        max_tokens = teto
+        if settings.LLM_ADAPTIVE_BUDGET_ENABLED:
+            max_tokens = orcamento_saida.sugerir(chave_orcamento, teto)
+        
+        parametros = dict(
             system_prompt=system_prompt,
             user_prompt=user_prompt,
-            temperature=temperature,
-            json_mode=json_mode
+            temperature=temperature if temperature is not None else config["temperature"],
+            json_mode=json_mode,
+            model=config["model"]
         )
+        
+        if ao_receber_item:
+            eventos = self.caminhos_stream()
+            # Retentativas recomeçam a resposta: itens já repassados não são repetidos
+            repassados: Dict[Tuple[str, ...], int] = {}
+            
+            async def repassar_item(caminho: Tuple[str, ...], indice: int, dados: Any):
+                if indice < repassados.get(caminho, 0):
+                    return
+                repassados[caminho] = indice + 1
+                try:
+                    item = self.converter_item(caminho, dados)
+                except Exception as e:
+                    logger.debug(f"[{self.nome}] Item invalido no stream ({str(e)})")
+                    return
+                await ao_receber_item(eventos[caminho], item)
+            
+            parametros.update(caminhos_stream=list(eventos), ao_receber_item=repassar_item)
+        
+        try:
+            resposta = await self.llm_service.generate(max_tokens=max_tokens, **parametros)
+        except ErroLLM as e:
+            # Orçamento adaptativo cortou a resposta: refaz com o teto do agente
+            if not e.truncada or max_tokens >= teto:
+                raise
+            logger.warning(f"[{self.nome}] Resposta truncada com {max_tokens} tokens, refazendo com {teto}")
+            resposta = await self.llm_service.generate(max_tokens=teto, **parametros)
+        
+        orcamento_saida.registrar(chave_orcamento, resposta.get("completion_tokens"))
+        return resposta
     
     def _formatar_texto_analise(self, texto: str, tema: str) -> str:
         """Formata o texto para análise"""
@@ -2,7 +2,7 @@
 Funcionalidades Premium Adicionais
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from app.agents.base_agent import BaseAgent
 from app.schemas.redacao import (
     RepertorioSociocultural,
@@ -14,6 +14,10 @@ from app.schemas.redacao import (
 class AnalisadorRepertorio(BaseAgent):
     """Analisa repertório sociocultural (Premium)"""
     
+    config_id = "repertorio"
+    max_tokens = 1500
+    temperatura = 0.4
+    
     def __init__(self):
         super().__init__(
             nome="Analisador de Repertório",
@@ -51,23 +55,37 @@ Retorne JSON:
     "feedback": "Análise geral"
 }"""
     
-    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> RepertorioSociocultural:
-        user_prompt = self._formatar_texto_analise(texto, tema)
-        user_prompt += "\n\nIdentifique e avalie o REPERTÓRIO SOCIOCULTURAL usado."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.4)
-        dados = resposta["content"]
-        
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        return "Identifique e avalie o REPERTÓRIO SOCIOCULTURAL usado."
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> RepertorioSociocultural:
         return RepertorioSociocultural(
             citacoes_identificadas=dados.get("citacoes_identificadas", []),
             uso_adequado=dados.get("uso_adequado", True),
             feedback=dados["feedback"]
         )
+    
+    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> RepertorioSociocultural:
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto)
+        
+        resposta = await self._gerar_resposta(user_prompt)
+        return self.converter_resposta(resposta["content"])
 
 
 class GeradorReescrita(BaseAgent):
     """Gera reescritas comparativas (Premium)"""
     
+    config_id = "reescrita"
+    max_tokens = 2000
+    temperatura = 0.6
+    
     def __init__(self):
         super().__init__(
             nome="Gerador de Reescrita",
@@ -96,22 +114,36 @@ Retorne JSON:
     ]
 }"""
     
-    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> List[ReescritaComparativa]:
-        user_prompt = self._formatar_texto_analise(texto, tema)
-        user_prompt += "\n\nIdentifique 2-3 trechos problemáticos e REESCREVA-OS de forma exemplar."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.6)
-        dados = resposta["content"]
-        
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        return "Identifique 2-3 trechos problemáticos e REESCREVA-OS de forma exemplar."
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> List[ReescritaComparativa]:
         return [
             ReescritaComparativa(**reescrita)
             for reescrita in dados.get("reescritas", [])
         ]
+    
+    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> List[ReescritaComparativa]:
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto)
+        
+        resposta = await self._gerar_resposta(user_prompt)
+        return self.converter_resposta(resposta["content"])
 
 
 class ModoSocraticoGenerator(BaseAgent):
     """Gera perguntas socráticas (Premium Exclusive)"""
     
+    config_id = "socratico"
+    max_tokens = 800
+    temperatura = 0.7
+    
     def __init__(self):
         super().__init__(
             nome="Modo Socrático",
@@ -145,16 +177,26 @@ Retorne JSON:
     ]
 }"""
     
-    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> ModeSocratico:
-        user_prompt = self._formatar_texto_analise(texto, tema)
-        user_prompt += "\n\nFaça 3-5 PERGUNTAS SOCRÁTICAS para ajudar o aluno a melhorar o texto."
-        
-        resposta = await self._gerar_resposta(user_prompt, temperature=0.7)
-        dados = resposta["content"]
-        
+    def montar_pedido(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        analises_anteriores: Optional[Dict[str, Any]] = None
+    ) -> str:
+        return "Faça 3-5 PERGUNTAS SOCRÁTICAS para ajudar o aluno a melhorar o texto."
+    
+    def converter_resposta(self, dados: Dict[str, Any]) -> ModeSocratico:
         return ModeSocratico(
             perguntas=dados.get("perguntas", [])
         )
+    
+    async def analisar(self, texto: str, tema: str, contexto: Dict[str, Any]) -> ModeSocratico:
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        user_prompt += "\n\n" + self.montar_pedido(texto, tema, contexto)
+        
+        resposta = await self._gerar_resposta(user_prompt)
+        return self.converter_resposta(resposta["content"])
 
 
 # Instâncias globais
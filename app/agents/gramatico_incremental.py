@@ -0,0 +1,242 @@
+"""
+Reanálise incremental de redações revisadas
+O Gramático roda só nos parágrafos alterados e reaproveita os erros dos demais
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.agents.base_agent import BaseAgent, CallbackItemAgente
+from app.agents.agente_gramatico import nota_por_total_erros
+from app.schemas.redacao import AnaliseGramatical, ErroGramatical
+
+logger = logging.getLogger(__name__)
+
+# Expressões citadas entre aspas e referências a parágrafos ("parágrafo 2", "2º parágrafo")
+# nos vícios e no feedback: é o que liga esses textos livres a um parágrafo
+_CITACAO = re.compile(r"[\"“'‘]([^\"”'’]{2,}?)[\"”'’]")
+_REFERENCIA_PARAGRAFO = re.compile(
+    r"(?P<antes>par[áa]grafos?\s+)(?P<numero>\d+)|(?P<numero_ordinal>\d+)(?P<depois>\s*[º°ª]\s*par[áa]grafo)",
+    re.IGNORECASE
+)
+_FIM_FRASE = re.compile(r"(?<=[.!?])\s+")
+
+
+class DiffRevisao:
+    """
+    Diferença por parágrafo entre a redação anterior e a revisão.
+    `mapa` liga cada parágrafo inalterado da revisão (índice 0-based) ao da anterior.
+    """
+
+    def __init__(
+        self,
+        texto_anterior: str,
+        texto: str,
+        spans_anteriores: List[Tuple[int, int]],
+        spans: List[Tuple[int, int]],
+        mapa: Dict[int, int]
+    ):
+        self.texto_anterior = texto_anterior
+        self.texto = texto
+        self.spans_anteriores = spans_anteriores
+        self.spans = spans
+        self.mapa = mapa
+        self._inverso = {anterior: novo for novo, anterior in mapa.items()}
+
+        # Parágrafos novos/reescritos da revisão e parágrafos removidos da anterior
+        self.alterados = [i for i in range(len(spans)) if i not in mapa]
+        self.removidos = [i for i in range(len(spans_anteriores)) if i not in self._inverso]
+
+    @property
+    def sem_alteracoes(self) -> bool:
+        return not self.alterados and not self.removidos
+
+    @property
+    def proporcao_alterada(self) -> float:
+        """
+        Fração do texto (em caracteres de parágrafo) escrita, reescrita ou removida
+        (um parágrafo reescrito conta uma vez: maior entre o novo e o removido)
+        """
+        alterado = sum(self.spans[i][1] - self.spans[i][0] for i in self.alterados)
+        removido = sum(self.spans_anteriores[i][1] - self.spans_anteriores[i][0] for i in self.removidos)
+        total = max(
+            sum(fim - inicio for inicio, fim in self.spans),
+            sum(fim - inicio for inicio, fim in self.spans_anteriores)
+        )
+        return min(1.0, max(alterado, removido) / total) if total else 1.0
+
+    def paragrafo_novo(self, indice_anterior: int) -> Optional[int]:
+        """Índice na revisão de um parágrafo inalterado da anterior (None se mudou/saiu)"""
+        return self._inverso.get(indice_anterior)
+
+    def remapear(self, inicio: int, fim: int) -> Optional[Tuple[int, int]]:
+        """
+        Converte uma posição do texto anterior para a revisão.
+        None se o trecho não está inteiro num parágrafo inalterado.
+        """
+        for indice, (p_inicio, p_fim) in enumerate(self.spans_anteriores):
+            if p_inicio <= inicio and fim <= p_fim:
+                novo = self.paragrafo_novo(indice)
+                if novo is None:
+                    return None
+                deslocamento = self.spans[novo][0] - p_inicio
+                return inicio + deslocamento, fim + deslocamento
+        return None
+
+    def localizar_em_alterados(self, trecho: str) -> Optional[Tuple[int, int]]:
+        """Posição do trecho na revisão, procurando só nos parágrafos alterados"""
+        if not trecho:
+            return None
+        for indice in self.alterados:
+            p_inicio, p_fim = self.spans[indice]
+            posicao = self.texto.find(trecho, p_inicio, p_fim)
+            if posicao != -1:
+                return posicao, posicao + len(trecho)
+        return None
+
+    def em_inalterados(self, trecho: str, ignorar_caixa: bool = False) -> bool:
+        if not trecho:
+            return False
+        paragrafos = (self.texto[self.spans[i][0]:self.spans[i][1]] for i in self.mapa)
+        if ignorar_caixa:
+            return any(trecho.lower() in paragrafo.lower() for paragrafo in paragrafos)
+        return any(trecho in paragrafo for paragrafo in paragrafos)
+
+
+class GramaticoIncremental(BaseAgent):
+    """
+    Etapa "gramatical" de uma revisão: chama o Gramático só com os parágrafos
+    alterados e junta os erros com os da análise anterior (posições remapeadas).
+    Sem parágrafos alterados, nenhuma chamada ao LLM é feita.
+    """
+
+    def __init__(self, gramatico: BaseAgent, diff: DiffRevisao, analise_anterior: AnaliseGramatical):
+        super().__init__(
+            nome=f"{gramatico.nome} (revisão)",
+            descricao="Reanálise gramatical dos parágrafos alterados"
+        )
+        self.gramatico = gramatico
+        self.diff = diff
+        self.analise_anterior = analise_anterior
+
+    def get_system_prompt(self) -> str:
+        return self.gramatico.get_system_prompt()
+
+    def caminhos_stream(self) -> Dict[Tuple[str, ...], str]:
+        return self.gramatico.caminhos_stream()
+
+    def converter_item(self, caminho: Tuple[str, ...], dados: Any) -> Any:
+        return self.gramatico.converter_item(caminho, dados)
+
+    @staticmethod
+    def _renumerar(frase: str, numerar) -> Optional[str]:
+        """
+        Troca os números das referências a parágrafos por `numerar(n)` (1-based).
+        None se alguma referência não tem correspondente.
+        """
+        sem_correspondente = False
+
+        def trocar(m: re.Match) -> str:
+            nonlocal sem_correspondente
+            numero = m.group("numero") or m.group("numero_ordinal")
+            novo = numerar(int(numero))
+            if novo is None:
+                sem_correspondente = True
+                return m.group(0)
+            if m.group("numero"):
+                return f"{m.group('antes')}{novo}"
+            return f"{novo}{m.group('depois')}"
+
+        renumerada = _REFERENCIA_PARAGRAFO.sub(trocar, frase)
+        return None if sem_correspondente else renumerada
+
+    def _da_anterior(self, frase: str) -> Optional[str]:
+        """
+        Vício/frase de feedback da análise anterior, se ligado só a parágrafos inalterados
+        (com as referências renumeradas para a revisão). Frases sem citação nem referência
+        a parágrafo podem falar de qualquer trecho e não são trazidas.
+        """
+        citacoes = _CITACAO.findall(frase)
+        if not citacoes and not _REFERENCIA_PARAGRAFO.search(frase):
+            return None
+        if not all(self.diff.em_inalterados(citacao, ignorar_caixa=True) for citacao in citacoes):
+            return None
+
+        def numerar(n: int) -> Optional[int]:
+            novo = self.diff.paragrafo_novo(n - 1)
+            return novo + 1 if novo is not None else None
+        return self._renumerar(frase, numerar)
+
+    def _do_parcial(self, frase: str) -> str:
+        """Vício/feedback da análise dos trechos alterados, com as referências na numeração da revisão"""
+        alterados = self.diff.alterados
+
+        def numerar(n: int) -> Optional[int]:
+            return alterados[n - 1] + 1 if 1 <= n <= len(alterados) else None
+        return self._renumerar(frase, numerar) or frase
+
+    def _erros_reaproveitados(self) -> List[ErroGramatical]:
+        """Erros da análise anterior que estão em parágrafos inalterados"""
+        erros = []
+        for erro in self.analise_anterior.erros:
+            if erro.posicao_inicio is not None and erro.posicao_fim is not None:
+                span = self.diff.remapear(erro.posicao_inicio, erro.posicao_fim)
+                if span:
+                    erros.append(erro.model_copy(update={"posicao_inicio": span[0], "posicao_fim": span[1]}))
+            elif self.diff.em_inalterados(erro.trecho):
+                # Sem posição (trecho não localizado na época): mantém se ainda aparece no texto
+                erros.append(erro.model_copy())
+        return erros
+
+    async def analisar(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        ao_receber_item: Optional[CallbackItemAgente] = None
+    ) -> AnaliseGramatical:
+        """Analisa os parágrafos alterados e monta a análise gramatical da revisão"""
+        anterior = self.analise_anterior
+        erros = self._erros_reaproveitados()
+        if self.diff.sem_alteracoes:
+            vicios = list(anterior.vicios_linguagem)
+            feedback = anterior.feedback_geral
+        else:
+            # Só o que se refere a parágrafos inalterados continua valendo
+            vicios = [v for v in map(self._da_anterior, anterior.vicios_linguagem) if v]
+            frases = [f for f in map(self._da_anterior, _FIM_FRASE.split(anterior.feedback_geral.strip())) if f]
+            feedback = " ".join(frases)
+
+        if self.diff.alterados:
+            trechos = "\n\n".join(texto[inicio:fim] for inicio, fim in (self.diff.spans[i] for i in self.diff.alterados))
+            print(f"[REVISAO] Gramatico em {len(self.diff.alterados)} de {len(self.diff.spans)} paragrafos")
+            parcial = await self.gramatico.analisar(trechos, tema, contexto, ao_receber_item=ao_receber_item)
+
+            for erro in parcial.erros:
+                # Posições do Gramático são relativas aos trechos concatenados: valem só se relocalizadas
+                span = self.diff.localizar_em_alterados(erro.trecho)
+                erro.posicao_inicio, erro.posicao_fim = span if span else (None, None)
+                erros.append(erro)
+            for vicio in map(self._do_parcial, parcial.vicios_linguagem):
+                if vicio not in vicios:
+                    vicios.append(vicio)
+            feedback = " ".join(f for f in (feedback, self._do_parcial(parcial.feedback_geral)) if f)
+
+        if not feedback:
+            feedback = "Os parágrafos removidos saíram da análise; os demais mantêm a avaliação anterior."
+
+        erros.sort(key=lambda e: e.posicao_inicio if e.posicao_inicio is not None else len(texto))
+
+        # Nota anterior (do LLM) ajustada pela variação na escala de erros do prompt
+        variacao = nota_por_total_erros(len(erros)) - nota_por_total_erros(len(anterior.erros))
+        nota = min(10.0, max(0.0, round(anterior.nota + variacao, 2)))
+
+        logger.info(f"[REVISAO] Erros gramaticais: {len(anterior.erros)} -> {len(erros)}, nota {anterior.nota} -> {nota}")
+        return AnaliseGramatical(
+            nota=nota,
+            erros=erros,
+            total_erros=len(erros),
+            vicios_linguagem=vicios,
+            feedback_geral=feedback
+        )
@@ -3,12 +3,19 @@ Orquestrador de Agentes - Sistema Multiagentes
 Coordena a execução dos agentes baseado no plano do usuário
 """
 
+import asyncio
+import difflib
 import time
 import re
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 from datetime import datetime
 
+from app.config import settings
+from app.agents.base_agent import BaseAgent
+from app.agents.painel_combinado import PainelCombinado
+from app.agents.gramatico_incremental import DiffRevisao, GramaticoIncremental
 from app.agents.agente_gramatico import agente_gramatico
+from app.utils.texto import spans_paragrafos
 from app.agents.agente_logico import agente_logico
 from app.agents.agente_estruturalista import agente_estruturalista
 from app.agents.agente_avaliador import agente_avaliador
@@ -17,8 +24,32 @@ from app.agents.funcionalidades_premium import (
     gerador_reescrita,
     modo_socratico
 )
-from app.schemas.redacao import AnaliseCompleta, RedacaoSubmit, TrechoMelhoria
+from app.schemas.redacao import AnaliseCompleta, AnaliseLogica, RedacaoSubmit, TrechoMelhoria
 from app.schemas.usuario import PlanoEnum
+from app.services.coalescimento import coalescedor_analises
+
+
+# Campo da AnaliseCompleta preenchido por cada etapa
+CAMPOS_ETAPAS = {
+    "gramatical": "analise_gramatical",
+    "logica": "analise_logica",
+    "estrutural": "analise_estrutural",
+    "repertorio": "repertorio_sociocultural",
+    "reescrita": "reescritas_comparativas",
+    "socratico": "modo_socratico",
+    "avaliacao": "avaliacao_final",
+}
+
+# Callback chamado a cada etapa concluída: (nome_da_etapa, resultado)
+# (a detecção de fuga ao tema é reportada como "fuga_ao_tema")
+CallbackEtapa = Callable[[str, Any], Awaitable[None]]
+
+# Callback chamado a cada item transmitido por um agente durante a geração:
+# (evento, item), ex.: ("erro_gramatical", ErroGramatical) — ver BaseAgent.campos_stream
+CallbackItem = Callable[[str, Any], Awaitable[None]]
+
+# Redação anterior de uma revisão: (texto anterior, análise anterior)
+BaseRevisao = Tuple[str, AnaliseCompleta]
 
 
 class OrquestradorAgentes:
@@ -39,7 +70,10 @@ class OrquestradorAgentes:
         self,
         redacao: RedacaoSubmit,
         plano_usuario: PlanoEnum,
-        redacao_id: str
+        redacao_id: str,
+        ao_concluir_etapa: Optional[CallbackEtapa] = None,
+        ao_receber_item: Optional[CallbackItem] = None,
+        base_revisao: Optional[BaseRevisao] = None
     ) -> AnaliseCompleta:
         """
         Analisa uma redação usando os agentes apropriados
@@ -48,10 +82,47 @@ class OrquestradorAgentes:
             redacao: Dados da redação
             plano_usuario: Plano do usuário (free, premium, b2b)
             redacao_id: ID da redação
+            ao_concluir_etapa: Chamado com cada resultado assim que a etapa termina (streaming)
+            ao_receber_item: Chamado com cada erro/problema assim que o agente o gera (já posicionado no texto)
+            base_revisao: Texto e análise da versão anterior, se a redação é uma revisão
+                (reanálise incremental por parágrafo)
             
         Returns:
             Análise completa estruturada
         """
+        if ao_concluir_etapa or ao_receber_item or not settings.COALESCE_ENABLED:
+            # Streaming: cada cliente precisa dos próprios eventos, sem coalescimento
+            return await self._analisar(
+                redacao, plano_usuario, redacao_id, ao_concluir_etapa, ao_receber_item, base_revisao
+            )
+
+        # Pedidos idênticos simultâneos (duplo clique, retry do frontend) compartilham a execução
+        chave = coalescedor_analises.gerar_chave(
+            redacao.texto,
+            redacao.tema,
+            redacao.tipo.value,
+            plano_usuario.value,
+            redacao.referencias_esperadas or [],
+            (base_revisao[0], base_revisao[1].model_dump_json()) if base_revisao else None
+        )
+        analise_completa, compartilhada = await coalescedor_analises.executar(
+            chave, lambda: self._analisar(redacao, plano_usuario, redacao_id, base_revisao=base_revisao)
+        )
+        if compartilhada:
+            # Cópia com o ID desta redação (o resultado pertence a quem iniciou)
+            return analise_completa.model_copy(update={"redacao_id": redacao_id}, deep=True)
+        return analise_completa
+
+    async def _analisar(
+        self,
+        redacao: RedacaoSubmit,
+        plano_usuario: PlanoEnum,
+        redacao_id: str,
+        ao_concluir_etapa: Optional[CallbackEtapa] = None,
+        ao_receber_item: Optional[CallbackItem] = None,
+        base_revisao: Optional[BaseRevisao] = None
+    ) -> AnaliseCompleta:
+        """Executa a análise (sem coalescimento)"""
         inicio = time.time()
         total_tokens = 0
         
@@ -62,61 +133,58 @@ class OrquestradorAgentes:
             "referencias_esperadas": redacao.referencias_esperadas or []
         }
         
-        # === AGENTE 1: GRAMÁTICO (SEMPRE DISPONÍVEL) ===
-        print(f"[AGENT] Executando Agente Gramatico...")
-        analise_gramatical = await self.agente_gramatico.analisar(texto, tema, contexto)
-        
         # === DETECÇÃO DE FUGA AO TEMA (SEMPRE DISPONÍVEL) ===
         fuga_tema_result = await self._detectar_fuga_tema(texto, tema, contexto)
+        if ao_concluir_etapa:
+            await ao_concluir_etapa("fuga_ao_tema", fuga_tema_result)
         
-        # === AGENTES PREMIUM ===
-        analise_logica = None
-        analise_estrutural = None
-        repertorio = None
-        reescritas = None
-        modo_socratico_result = None
-        
-        if plano_usuario in [PlanoEnum.PREMIUM, PlanoEnum.B2B]:
-            print(f"[PREMIUM] Executando analises PREMIUM...")
-            
-            # Agente 2: Lógico
-            print(f"[AGENT] Executando Agente Logico...")
-            analise_logica = await self.agente_logico.analisar(texto, tema, contexto)
-            
-            # Agente 3: Estruturalista
-            print(f"[AGENT] Executando Agente Estruturalista...")
-            analise_estrutural = await self.agente_estruturalista.analisar(texto, tema, contexto)
-            
-            # Repertório Sociocultural
-            print(f"📚 Analisando Repertório Sociocultural...")
-            repertorio = await self.analisador_repertorio.analisar(texto, tema, contexto)
-            
-            # Reescrita Comparativa
-            print(f"✍️  Gerando Reescritas Comparativas...")
-            reescritas = await self.gerador_reescrita.analisar(texto, tema, contexto)
-            
-            # Modo Socrático (Premium Exclusive)
-            print(f"🤔 Gerando Perguntas Socráticas...")
-            modo_socratico_result = await self.modo_socratico.analisar(texto, tema, contexto)
-        
-        # === AGENTE 4: AVALIADOR (HÍBRIDO) ===
-        print(f"[AGENT] Executando Agente Avaliador...")
-        
-        # Passar análises anteriores para o avaliador
-        analises_anteriores = {
-            "gramatical": analise_gramatical
-        }
-        if analise_logica:
-            analises_anteriores["logica"] = analise_logica
-        if analise_estrutural:
-            analises_anteriores["estrutural"] = analise_estrutural
-        
-        avaliacao_final = await self.agente_avaliador.analisar(
-            texto, tema, contexto, analises_anteriores
+        # === ETAPAS DOS AGENTES (executadas em paralelo respeitando dependências) ===
+        etapas = self._montar_etapas(plano_usuario)
+        reaproveitadas: Dict[str, Any] = {}
+        if base_revisao:
+            etapas, reaproveitadas = self._etapas_revisao(etapas, texto, *base_revisao)
+        etapas = await self._combinar_etapas(etapas, plano_usuario, texto)
+        resultados = await self._executar_etapas(
+            etapas, texto, tema, contexto, ao_concluir_etapa, ao_receber_item, reaproveitadas
         )
         
         # === COMPILAR ANÁLISE COMPLETA ===
         tempo_total = time.time() - inicio
+        analise_completa = self.compor_analise(
+            redacao_id=redacao_id,
+            plano_usuario=plano_usuario,
+            texto=texto,
+            resultados=resultados,
+            fuga_tema_result=fuga_tema_result,
+            tempo_total=tempo_total,
+            total_tokens=total_tokens
+        )
+        
+        print(f"[OK] Analise concluida em {tempo_total:.2f}s")
+        
+        return analise_completa
+
+    def compor_analise(
+        self,
+        redacao_id: str,
+        plano_usuario: PlanoEnum,
+        texto: str,
+        resultados: Dict[str, Any],
+        fuga_tema_result: Dict[str, Any],
+        tempo_total: float,
+        total_tokens: int = 0
+    ) -> AnaliseCompleta:
+        """
+        Monta a AnaliseCompleta a partir dos resultados das etapas
+        (usado também pelo processamento em lote, que obtém os resultados do Batch API)
+        """
+        analise_gramatical = resultados["gramatical"]
+        analise_logica = resultados.get("logica")
+        analise_estrutural = resultados.get("estrutural")
+        repertorio = resultados.get("repertorio")
+        reescritas = resultados.get("reescrita")
+        modo_socratico_result = resultados.get("socratico")
+        avaliacao_final = resultados["avaliacao"]
 
         # === TRECHOS PARA MELHORIA (para destaque no frontend) ===
         trechos_melhoria = self._gerar_trechos_melhoria(
@@ -125,7 +193,7 @@ class OrquestradorAgentes:
             analise_logica=analise_logica
         )
         
-        analise_completa = AnaliseCompleta(
+        return AnaliseCompleta(
             redacao_id=redacao_id,
             plano_usuario=plano_usuario.value,
             
@@ -153,26 +221,230 @@ class OrquestradorAgentes:
             data_analise=datetime.now(),
             tokens_utilizados=total_tokens if total_tokens > 0 else None
         )
+
+    def _montar_etapas(self, plano_usuario: PlanoEnum) -> Dict[str, BaseAgent]:
+        """
+        Define quais agentes rodam para o plano do usuário.
+        As dependências entre etapas são declaradas por cada agente (`dependencias`).
+        """
+        # Agente 1: Gramático (sempre disponível)
+        etapas: Dict[str, BaseAgent] = {
+            "gramatical": self.agente_gramatico,
+        }
         
-        print(f"[OK] Analise concluida em {tempo_total:.2f}s")
+        # Agentes Premium
+        if plano_usuario in [PlanoEnum.PREMIUM, PlanoEnum.B2B]:
+            etapas.update({
+                "logica": self.agente_logico,
+                "estrutural": self.agente_estruturalista,
+                "repertorio": self.analisador_repertorio,
+                "reescrita": self.gerador_reescrita,
+                "socratico": self.modo_socratico,
+            })
         
-        return analise_completa
+        # Agente 4: Avaliador (híbrido) - aguarda as análises das quais depende
+        etapas["avaliacao"] = self.agente_avaliador
+        return etapas
+
+    async def _combinar_etapas(
+        self,
+        etapas: Dict[str, BaseAgent],
+        plano_usuario: PlanoEnum,
+        texto: str
+    ) -> Dict[str, BaseAgent]:
+        """
+        Nos planos de PAINEL_COMBINADO_PLANOS funde as etapas compatíveis numa só chamada.
+        Uma etapa só entra no painel se todas as suas dependências do plano também entrarem
+        e se o agente aceitar este texto (ex.: o Gramático fica fora quando vai em fatias).
+        """
+        if plano_usuario.value not in settings.PAINEL_COMBINADO_PLANOS:
+            return etapas
+        
+        grupo: Dict[str, BaseAgent] = {}
+        for nome, agente in etapas.items():
+            if (
+                all(d in grupo or d not in etapas for d in agente.dependencias)
+                and await agente.combinavel_para(texto)
+            ):
+                grupo[nome] = agente
+        if len(grupo) < 2:
+            return etapas
+        
+        combinadas = {nome: agente for nome, agente in etapas.items() if nome not in grupo}
+        combinadas["painel"] = PainelCombinado(grupo)
+        return combinadas
+
+    async def _executar_etapas(
+        self,
+        etapas: Dict[str, BaseAgent],
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        ao_concluir_etapa: Optional[CallbackEtapa] = None,
+        ao_receber_item: Optional[CallbackItem] = None,
+        prontas: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Executa as etapas como um DAG: agentes independentes rodam concorrentemente
+        e cada agente com dependências inicia assim que elas terminam.
+        Se informado, `ao_concluir_etapa` recebe cada resultado na ordem em que ficam prontos
+        e `ao_receber_item` os itens transmitidos pelos agentes durante a geração.
+        `prontas` traz resultados já disponíveis (ex.: reaproveitados de uma revisão).
+        
+        Returns:
+            Dict nome_da_etapa -> resultado do agente
+        """
+        tarefas: Dict[str, asyncio.Task] = {}
+        prontas = prontas or {}
+        if ao_concluir_etapa:
+            for nome, resultado in prontas.items():
+                await ao_concluir_etapa(nome, resultado)
+        
+        # Etapas fundidas no painel combinado: resultado sai da tarefa "painel"
+        painel = etapas.get("painel")
+        no_painel = set(painel.etapas) if isinstance(painel, PainelCombinado) else set()
+
+        async def repassar_item(evento: str, item: Any):
+            # Posição no texto resolvida item a item, para o destaque aparecer já no stream
+            self._posicionar_item(texto, item)
+            await ao_receber_item(evento, item)
+
+        async def executar(nome: str, agente: BaseAgent) -> Any:
+            # Dependências que não fazem parte do plano são ignoradas
+            anteriores = {}
+            for dependencia in agente.dependencias:
+                if dependencia in prontas:
+                    anteriores[dependencia] = prontas[dependencia]
+                elif dependencia in tarefas:
+                    anteriores[dependencia] = await tarefas[dependencia]
+                elif dependencia in no_painel:
+                    anteriores[dependencia] = (await tarefas["painel"])[dependencia]
+            
+            extras = {}
+            if ao_receber_item and agente.caminhos_stream():
+                extras["ao_receber_item"] = repassar_item
+            
+            print(f"[AGENT] Executando {agente.nome}...")
+            if agente.dependencias:
+                resultado = await agente.analisar(texto, tema, contexto, anteriores, **extras)
+            else:
+                resultado = await agente.analisar(texto, tema, contexto, **extras)
+            
+            if ao_concluir_etapa:
+                if nome == "painel":
+                    for parte in painel.etapas:
+                        await ao_concluir_etapa(parte, resultado[parte])
+                else:
+                    await ao_concluir_etapa(nome, resultado)
+            return resultado
+
+        for nome, agente in etapas.items():
+            tarefas[nome] = asyncio.create_task(executar(nome, agente))
+
+        try:
+            resultados = await asyncio.gather(*tarefas.values())
+        except BaseException:
+            # Uma etapa falhou (ou a análise foi cancelada): não deixar agentes órfãos
+            for tarefa in tarefas.values():
+                tarefa.cancel()
+            raise
+
+        resultados_por_etapa = dict(zip(tarefas.keys(), resultados))
+        if no_painel:
+            resultados_por_etapa.update(resultados_por_etapa.pop("painel"))
+        resultados_por_etapa.update(prontas)
+        return resultados_por_etapa
+
+    def diff_paragrafos(self, texto_anterior: str, texto: str) -> DiffRevisao:
+        """Compara duas versões da redação parágrafo a parágrafo (ver _paragraph_spans)"""
+        spans_anteriores = self._paragraph_spans(texto_anterior)
+        spans = self._paragraph_spans(texto)
+        anteriores = [texto_anterior[inicio:fim] for inicio, fim in spans_anteriores]
+        novos = [texto[inicio:fim] for inicio, fim in spans]
+
+        mapa: Dict[int, int] = {}
+        for bloco in difflib.SequenceMatcher(None, anteriores, novos, autojunk=False).get_matching_blocks():
+            for k in range(bloco.size):
+                mapa[bloco.b + k] = bloco.a + k
+        return DiffRevisao(texto_anterior, texto, spans_anteriores, spans, mapa)
+
+    def _etapas_revisao(
+        self,
+        etapas: Dict[str, BaseAgent],
+        texto: str,
+        texto_anterior: str,
+        analise_anterior: AnaliseCompleta
+    ) -> Tuple[Dict[str, BaseAgent], Dict[str, Any]]:
+        """
+        Ajusta as etapas de uma revisão:
+        - "gramatical" vira GramaticoIncremental (só parágrafos alterados);
+        - etapas de texto inteiro reaproveitam o resultado anterior se a alteração for
+          pequena (até REVISION_REANALYSIS_RATIO) e nenhuma dependência tiver mudado.
+        
+        Returns:
+            (etapas a executar, resultados reaproveitados por etapa)
+        """
+        diff = self.diff_paragrafos(texto_anterior, texto)
+        pequena = diff.proporcao_alterada <= settings.REVISION_REANALYSIS_RATIO
+        print(
+            f"[REVISAO] {len(diff.alterados)} paragrafos alterados, {len(diff.removidos)} removidos "
+            f"({diff.proporcao_alterada:.0%} do texto)"
+        )
+
+        executar: Dict[str, BaseAgent] = {}
+        reaproveitadas: Dict[str, Any] = {}
+        # Etapas cujo resultado muda nesta revisão (invalidam quem depende delas)
+        mudaram = set()
+        for nome, agente in etapas.items():
+            if nome == "gramatical":
+                # Sem parágrafos alterados não há chamada ao LLM (só remapeia os erros)
+                executar[nome] = GramaticoIncremental(agente, diff, analise_anterior.analise_gramatical)
+                if not diff.sem_alteracoes:
+                    mudaram.add(nome)
+                continue
+
+            anterior = getattr(analise_anterior, CAMPOS_ETAPAS[nome], None)
+            dependencias_mudaram = any(d in mudaram for d in agente.dependencias)
+            if anterior is not None and pequena and not dependencias_mudaram:
+                reaproveitadas[nome] = self._reaproveitar_resultado(anterior, diff)
+            else:
+                executar[nome] = agente
+                mudaram.add(nome)
+        return executar, reaproveitadas
+
+    def _reaproveitar_resultado(self, resultado: Any, diff: DiffRevisao) -> Any:
+        """
+        Copia um resultado da análise anterior para a revisão, remapeando as posições
+        dos problemas (os que estavam em parágrafos alterados são descartados)
+        """
+        if not isinstance(resultado, AnaliseLogica):
+            return resultado.model_copy(deep=True) if hasattr(resultado, "model_copy") else resultado
+
+        problemas = []
+        for problema in resultado.problemas:
+            if problema.posicao_inicio is not None and problema.posicao_fim is not None:
+                span = diff.remapear(problema.posicao_inicio, problema.posicao_fim)
+                if not span:
+                    continue
+                paragrafo = next(
+                    (i + 1 for i, (inicio, fim) in enumerate(diff.spans) if inicio <= span[0] < fim),
+                    problema.paragrafo
+                )
+                problemas.append(problema.model_copy(update={
+                    "posicao_inicio": span[0], "posicao_fim": span[1], "paragrafo": paragrafo
+                }))
+            else:
+                novo = diff.paragrafo_novo(problema.paragrafo - 1) if problema.paragrafo else None
+                if novo is not None:
+                    problemas.append(problema.model_copy(update={"paragrafo": novo + 1}))
+        return resultado.model_copy(update={"problemas": problemas}, deep=True)
 
     def _paragraph_spans(self, texto: str) -> List[Tuple[int, int]]:
         """
         Retorna spans (inicio,fim) de parágrafos (1-based no frontend/agentes).
         Considera parágrafos separados por linha em branco.
         """
-        spans: List[Tuple[int, int]] = []
-        start = 0
-        for m in re.finditer(r'\n\s*\n+', texto):
-            end = m.start()
-            if texto[start:end].strip():
-                spans.append((start, end))
-            start = m.end()
-        if texto[start:].strip():
-            spans.append((start, len(texto)))
-        return spans
+        return spans_paragrafos(texto)
 
     def _find_span(self, texto: str, trecho: str, paragrafo: Optional[int] = None) -> Optional[Tuple[int, int]]:
         """
@@ -210,6 +482,27 @@ class OrquestradorAgentes:
 
         return None
 
+    def _posicionar_item(self, texto: str, item: Any):
+        """Preenche posicao_inicio/posicao_fim de um erro ou problema a partir do trecho citado"""
+        paragrafo = getattr(item, "paragrafo", None)
+        span = self._find_span(texto, getattr(item, "trecho", ""), paragrafo=paragrafo)
+        if not span:
+            return
+        inicio, fim = span
+        item.posicao_inicio = inicio
+        item.posicao_fim = fim
+        item.trecho = texto[inicio:fim]
+
+    def _posicao_conhecida(self, texto: str, item: Any) -> Optional[Tuple[int, int]]:
+        """Posição já preenchida no item, se ainda corresponde ao trecho (ex.: remapeada numa revisão)"""
+        inicio = getattr(item, "posicao_inicio", None)
+        fim = getattr(item, "posicao_fim", None)
+        if inicio is None or fim is None or not (0 <= inicio < fim <= len(texto)):
+            return None
+        if texto[inicio:fim] != getattr(item, "trecho", None):
+            return None
+        return inicio, fim
+
     def _dedupe_and_limit(self, trechos: List[TrechoMelhoria], limite: int = 25) -> List[TrechoMelhoria]:
         """Ordena por posição, remove overlaps simples e limita quantidade."""
         trechos_sorted = sorted(trechos, key=lambda t: (t.inicio, t.fim))
@@ -239,7 +532,7 @@ class OrquestradorAgentes:
         # Gramática
         try:
             for erro in getattr(analise_gramatical, "erros", []) or []:
-                span = self._find_span(texto, getattr(erro, "trecho", ""))
+                span = self._posicao_conhecida(texto, erro) or self._find_span(texto, getattr(erro, "trecho", ""))
                 if not span:
                     continue
                 inicio, fim = span
@@ -270,7 +563,10 @@ class OrquestradorAgentes:
             try:
                 for problema in getattr(analise_logica, "problemas", []) or []:
                     par = getattr(problema, "paragrafo", None)
-                    span = self._find_span(texto, getattr(problema, "trecho", ""), paragrafo=par)
+                    span = (
+                        self._posicao_conhecida(texto, problema)
+                        or self._find_span(texto, getattr(problema, "trecho", ""), paragrafo=par)
+                    )
                     if not span:
                         continue
                     inicio, fim = span
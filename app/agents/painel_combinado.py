@@ -0,0 +1,94 @@
+"""
+Painel Combinado: funde agentes compatíveis numa única chamada ao LLM
+A redação e os prompts são enviados uma vez e a resposta é separada por agente
+"""
+
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from app.agents.base_agent import BaseAgent, CallbackItemAgente
+
+logger = logging.getLogger(__name__)
+
+
+class PainelCombinado(BaseAgent):
+    """
+    Executa várias etapas do orquestrador numa chamada só, com um JSON combinado
+    ({"<etapa>": <JSON do agente>, ...}). Usado nos planos de PAINEL_COMBINADO_PLANOS.
+    """
+
+    config_id = "painel"
+
+    def __init__(self, etapas: Dict[str, BaseAgent]):
+        super().__init__(
+            nome="Painel Combinado",
+            descricao="Agentes " + ", ".join(agente.nome for agente in etapas.values()) + " numa só chamada"
+        )
+        # Em ordem de dependência (o orquestrador monta o grupo nessa ordem)
+        self.etapas = etapas
+
+        # Teto de saída = soma das partes; temperatura = a mais conservadora
+        self.max_tokens = sum(agente._config_llm()["max_tokens"] for agente in etapas.values())
+        self.temperatura = min(agente._config_llm()["temperature"] for agente in etapas.values())
+
+    def get_system_prompt(self) -> str:
+        partes = []
+        for nome, agente in self.etapas.items():
+            partes.append(f'=== PARTE "{nome}" ({agente.nome}) ===\n{agente.get_system_prompt()}')
+
+        formato = ", ".join(f'"{nome}": {{...JSON da parte {nome}...}}' for nome in self.etapas)
+        return (
+            "Você fará, numa única resposta, o trabalho de vários especialistas da banca.\n"
+            "Cada PARTE abaixo descreve um especialista e o formato JSON da sua resposta.\n"
+            "Partes posteriores devem considerar a análise feita nas partes anteriores.\n\n"
+            + "\n\n".join(partes)
+            + f"\n\nRetorne UM ÚNICO JSON com uma chave por parte: {{{formato}}}"
+        )
+
+    def caminhos_stream(self) -> Dict[Tuple[str, ...], str]:
+        """Arrays transmitidos de cada parte, sob a chave da parte"""
+        return {
+            (nome,) + caminho: evento
+            for nome, agente in self.etapas.items()
+            for caminho, evento in agente.caminhos_stream().items()
+        }
+
+    def converter_item(self, caminho: Tuple[str, ...], dados: Any) -> Any:
+        return self.etapas[caminho[0]].converter_item(caminho[1:], dados)
+
+    async def analisar(
+        self,
+        texto: str,
+        tema: str,
+        contexto: Dict[str, Any],
+        ao_receber_item: Optional[CallbackItemAgente] = None
+    ) -> Dict[str, Any]:
+        """
+        Analisa o texto com todas as partes e retorna Dict etapa -> resultado do agente
+        """
+        user_prompt = self._formatar_texto_analise(texto, tema)
+        for nome, agente in self.etapas.items():
+            user_prompt += f'\n\nPARTE "{nome}": ' + agente.montar_pedido(texto, tema, contexto)
+
+        resposta = await self._gerar_resposta(user_prompt, ao_receber_item=ao_receber_item)
+        dados = resposta["content"]
+
+        resultados: Dict[str, Any] = {}
+        for nome, agente in self.etapas.items():
+            try:
+                resultados[nome] = agente.converter_resposta(dados[nome])
+            except Exception as e:
+                # Parte ausente/inválida: refaz só ela com a chamada individual do agente
+                logger.warning(f"[PAINEL] Parte '{nome}' invalida ({str(e)}), chamando {agente.nome} separadamente")
+                print(f"[PAINEL] Parte '{nome}' invalida, chamando {agente.nome} separadamente")
+                if agente.dependencias:
+                    anteriores = {d: resultados[d] for d in agente.dependencias if d in resultados}
+                    resultados[nome] = await agente.analisar(texto, tema, contexto, anteriores)
+                else:
+                    resultados[nome] = await agente.analisar(texto, tema, contexto)
+                continue
+            # Resposta do failover não alimenta os caches do modelo principal
+            if not resposta.get("failover"):
+                await agente.guardar_parte_combinada(texto, resultados[nome])
+
+        return resultados
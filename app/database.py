@@ -1,34 +1,47 @@
 """
-Configuração do banco de dados PostgreSQL
+Configuração do banco de dados PostgreSQL (SQLAlchemy assíncrono + asyncpg)
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
-# Criar engine do SQLAlchemy
-engine = create_engine(
-    settings.DATABASE_URL,
+
+def _url_assincrona(database_url: str) -> str:
+    """Converte a URL do Postgres (postgresql:// ou +psycopg2) para o driver asyncpg"""
+    url = make_url(database_url)
+    if url.drivername in ("postgresql", "postgresql+psycopg2", "postgres"):
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+# Criar engine assíncrona do SQLAlchemy
+engine = create_async_engine(
+    _url_assincrona(settings.DATABASE_URL),
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE
 )
 
-# Criar sessão
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Criar sessão (expire_on_commit=False: objetos continuam legíveis após o commit
+# sem disparar I/O implícito, que não é permitido em sessões assíncronas)
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 # Base para os modelos
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """
     Dependency para obter sessão do banco de dados
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
@@ -18,6 +18,12 @@ from app.routers import redacao, usuario, analise
 from app.config import settings
 from app.middleware.asgi_json_cleaner import ASGIJSONCleaner
 from app.services.redacao_worker import worker
+from app.services.processador_lotes import processador_lotes, lote_habilitado
+from app.services.controle_admissao import controle_admissao
+from app.services.coalescimento import coalescedor_analises
+from app.services.cache_paragrafos import cache_paragrafos_gramatica
+from app.services.llm_service import llm_service
+from app.services.orcamento_tokens import orcamento_saida
 
 # Configurar logging
 logging.basicConfig(
@@ -38,16 +44,25 @@ async def lifespan(app: FastAPI):
     print(f"Modo: {settings.ENVIRONMENT}")
     
     # Iniciar worker de processamento de redações
-    logger.info("[MAIN] Iniciando worker de processamento de redações...")
-    print("[MAIN] Iniciando worker de processamento de redações...")
-    worker.start()
+    # (em produção o worker pode rodar em processo próprio: python -m app.worker)
+    if settings.WORKER_EMBEDDED:
+        logger.info("[MAIN] Iniciando worker de processamento de redações...")
+        print("[MAIN] Iniciando worker de processamento de redações...")
+        worker.start()
+        if lote_habilitado():
+            print("[MAIN] Iniciando processador de lotes (Batch API)...")
+            processador_lotes.start()
+    else:
+        print("[MAIN] Worker embutido desativado (WORKER_EMBEDDED=False)")
     
     yield
     
     # Parar worker ao encerrar
-    logger.info("[MAIN] Parando worker de processamento de redações...")
-    print("[MAIN] Parando worker de processamento de redações...")
-    worker.stop()
+    if settings.WORKER_EMBEDDED:
+        logger.info("[MAIN] Parando worker de processamento de redações...")
+        print("[MAIN] Parando worker de processamento de redações...")
+        processador_lotes.stop()
+        await worker.drenar(settings.WORKER_DRAIN_TIMEOUT)
     print("Encerrando aplicacao...")
 
 
@@ -89,7 +104,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     """
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=exc.headers  # Ex.: Retry-After do controle de admissão
     )
 
 # Exception handler para erros de validação JSON
@@ -170,7 +186,15 @@ async def health_check():
     """Verificação de saúde da API"""
     return {
         "status": "healthy",
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "llm_cache": llm_service.cache.estatisticas() if llm_service.cache else None,
+        "llm_circuitos": llm_service.estado_circuitos(),
+        "llm_chaves": llm_service.estado_chaves(),
+        "llm_orcamento_saida": orcamento_saida.estatisticas(),
+        "llm_rate_limit": llm_service.limitador.estatisticas() if llm_service.limitador else None,
+        "admissao": controle_admissao.estatisticas(),
+        "coalescimento": coalescedor_analises.estatisticas(),
+        "cache_paragrafos_gramatica": cache_paragrafos_gramatica.estatisticas() if cache_paragrafos_gramatica else None
     }
 
 @app.post("/test-json", tags=["Test"])
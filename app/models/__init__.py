@@ -5,6 +5,9 @@ Modelos do banco de dados
 from app.models.usuario import Usuario
 from app.models.redacao import Redacao
 from app.models.analise import Analise
+from app.models.lote_analise import LoteAnalise
+from app.models.chave_idempotencia import ChaveIdempotencia
+from app.models.balde_taxa import BaldeTaxa
 
-__all__ = ["Usuario", "Redacao", "Analise"]
+__all__ = ["Usuario", "Redacao", "Analise", "LoteAnalise", "ChaveIdempotencia", "BaldeTaxa"]
 
@@ -0,0 +1,20 @@
+"""
+Modelo do balde de taxa das chamadas ao LLM (limite de RPM/TPM compartilhado entre processos)
+"""
+
+from sqlalchemy import Column, String, Float
+
+from app.database import Base
+
+
+class BaldeTaxa(Base):
+    """Saldo de requisições e tokens de uma rota/chave do provider"""
+    __tablename__ = "baldes_taxa_llm"
+    
+    chave = Column(String, primary_key=True)  # provider:modelo:chave
+    requisicoes = Column(Float, nullable=False)
+    tokens = Column(Float, nullable=False)
+    atualizado_em = Column(Float, nullable=False)  # Epoch (relógio do Postgres)
+    
+    def __repr__(self):
+        return f"<BaldeTaxa(chave={self.chave})>"
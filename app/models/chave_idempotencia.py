@@ -0,0 +1,36 @@
+"""
+Modelo de Chave de Idempotência (header Idempotency-Key das submissões)
+"""
+
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, JSON, UniqueConstraint
+from datetime import datetime
+import uuid
+
+from app.database import Base
+
+
+class ChaveIdempotencia(Base):
+    """Resposta de uma submissão guardada pela chave enviada pelo cliente"""
+    __tablename__ = "chaves_idempotencia"
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "rota", "chave", name="uq_chaves_idempotencia_usuario_rota_chave"),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    usuario_id = Column(String, ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False)
+    rota = Column(String, nullable=False)
+    chave = Column(String, nullable=False)
+    
+    # Hash do corpo da requisição: a mesma chave com outro conteúdo é recusada
+    impressao = Column(String, nullable=False)
+    
+    # Resposta original (None enquanto a primeira requisição ainda está em execução)
+    status_code = Column(Integer, nullable=True)
+    resposta = Column(JSON, nullable=True)  # {"corpo": ..., "headers": {...}}
+    
+    # Timestamps
+    data_criacao = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expira_em = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<ChaveIdempotencia(rota={self.rota}, chave={self.chave})>"
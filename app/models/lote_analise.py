@@ -0,0 +1,53 @@
+"""
+Modelo de Lote de Análise (processamento offline via Batch API do provider)
+"""
+
+from sqlalchemy import Column, String, Date, DateTime, JSON
+from datetime import datetime
+import uuid
+import enum
+
+from app.database import Base
+
+
+class FaseLoteEnum(str, enum.Enum):
+    """Fase do lote: agentes independentes primeiro, avaliador depois (depende deles)"""
+    ETAPAS = "etapas"
+    AVALIACAO = "avaliacao"
+
+
+class StatusLoteEnum(str, enum.Enum):
+    """Status do lote"""
+    ENVIADO = "enviado"
+    CONCLUIDO = "concluido"
+    ERRO = "erro"
+
+
+class LoteAnalise(Base):
+    """Lote de redações B2B enviado ao Batch API"""
+    __tablename__ = "lotes_analise"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    
+    # Batch no provider (muda a cada fase)
+    provider_batch_id = Column(String, nullable=True)
+    fase = Column(String, default=FaseLoteEnum.ETAPAS.value, nullable=False)
+    status = Column(String, default=StatusLoteEnum.ENVIADO.value, nullable=False, index=True)
+    
+    # Reivindicação do envio da fase (o upload roda fora de transação); None = ninguém enviando
+    enviando_desde = Column(DateTime, nullable=True)
+    
+    # Redações do lote e respostas (JSON bruto) já obtidas: {redacao_id: {etapa: dados}}
+    redacao_ids = Column(JSON, nullable=False)
+    resultados = Column(JSON, nullable=False, default=dict)
+    tokens_utilizados = Column(JSON, nullable=False, default=dict)  # {redacao_id: tokens}
+    
+    # Dia (UTC) das reservas de cota das redações, para devolver as que saem sem análise
+    dia_cota = Column(Date, nullable=True)
+    
+    # Timestamps
+    data_criacao = Column(DateTime, default=datetime.utcnow, nullable=False)
+    data_atualizacao = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<LoteAnalise(id={self.id}, fase={self.fase}, status={self.status})>"
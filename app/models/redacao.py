@@ -2,7 +2,7 @@
 Modelo de Redação
 """
 
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -43,6 +43,22 @@ class Redacao(Base):
     # Status
     status = Column(SQLEnum(StatusRedacaoEnum), default=StatusRedacaoEnum.PENDENTE)
     
+    # Agendamento: a redação só é elegível para o worker a partir deste momento
+    # (ex.: usuário atingiu o limite diário e aguarda o reset da cota)
+    agendado_para = Column(DateTime, nullable=True, index=True)
+    
+    # Lease do worker: quem está processando e até quando a reivindicação vale.
+    # Leases expiradas (processo morto) são devolvidas à fila pelo worker.
+    processado_por = Column(String, nullable=True)
+    lease_expira_em = Column(DateTime, nullable=True, index=True)
+    tentativas = Column(Integer, default=0, nullable=False, server_default="0")
+    
+    # Lote do Batch API em que a redação está sendo processada (B2B offline)
+    lote_id = Column(String, ForeignKey("lotes_analise.id", ondelete="SET NULL"), nullable=True, index=True)
+    
+    # Revisão: redação anterior da qual esta é uma nova versão (reanálise incremental)
+    revisao_de = Column(String, ForeignKey("redacoes.id", ondelete="SET NULL"), nullable=True, index=True)
+    
     # Timestamps
     data_submissao = Column(DateTime, default=datetime.utcnow, nullable=False)
     data_atualizacao = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
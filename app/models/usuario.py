@@ -2,7 +2,7 @@
 Modelo de Usuário
 """
 
-from sqlalchemy import Column, String, Integer, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Date, DateTime, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -31,6 +31,7 @@ class Usuario(Base):
     # Controle de uso
     correcoes_realizadas_hoje = Column(Integer, default=0)
     limite_diario = Column(Integer, default=5)
+    data_contador = Column(Date)  # Dia (UTC) a que se refere correcoes_realizadas_hoje
     
     # Timestamps
     data_criacao = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -2,23 +2,33 @@
 Rotas de análise (análise de redações - funcionalidade principal)
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks
-from typing import Optional
+from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Optional, Set, Tuple
+import asyncio
+import json
+import time
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 import traceback
 import logging
 
 from app.schemas.redacao import AnaliseCompleta, RedacaoSubmit
 from app.schemas.usuario import TokenData, PlanoEnum
 from app.services.auth_service import get_current_user
-from app.agents.orquestrador import orquestrador
+from app.agents.orquestrador import orquestrador, CAMPOS_ETAPAS
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.usuario import Usuario
 from app.models.redacao import Redacao, StatusRedacaoEnum
 from app.models.analise import Analise
-from sqlalchemy.orm import Session
+from app.services.analise_service import analise_completa_do_modelo, carregar_base_revisao, criar_analise
+from app.services.cota_service import correcoes_hoje, devolver_cota_diaria, reservar_cota_diaria
+from app.services.controle_admissao import controle_admissao
+from app.services.idempotencia import gerenciador_idempotencia
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -26,51 +36,61 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("/analises/analisar", response_model=AnaliseCompleta)
-async def analisar_redacao(
+async def _preparar_analise(
     redacao: RedacaoSubmit,
-    background_tasks: BackgroundTasks,
-    current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+    current_user: TokenData,
+    db: AsyncSession
+) -> Tuple[Usuario, Redacao, date]:
     """
-    Analisa uma redação usando o sistema multiagentes
+    Valida usuário e texto, reserva uma vaga de análise síncrona e uma análise da
+    cota do dia e cria a redação em ANALISANDO. A vaga deve ser devolvida com
+    controle_admissao.liberar_sincrona ao fim da análise e a cota com
+    devolver_cota_diaria se a análise falhar.
     
-    - **Free**: Análise gramatical + Detecção de fuga ao tema + Nota geral
-    - **Premium**: Análise completa com todos os agentes + Funcionalidades extras
+    Returns:
+        (usuário, redação criada, dia da reserva da cota)
     """
-    try:
-        logger.info(f"[ANALISE] Iniciando analise para usuario: {current_user.usuario_id}")
-        print(f"[ANALISE] Iniciando analise para usuario: {current_user.usuario_id}")
-        
-        # Obter dados do usuário
-        usuario = db.query(Usuario).filter(Usuario.id == current_user.usuario_id).first()
-        
-        if not usuario:
-            logger.error(f"[ANALISE] Usuario nao encontrado: {current_user.usuario_id}")
-            print(f"[ANALISE] Usuario nao encontrado: {current_user.usuario_id}")
+    # Obter dados do usuário
+    usuario = await db.scalar(select(Usuario).where(Usuario.id == current_user.usuario_id))
+    
+    if not usuario:
+        logger.error(f"[ANALISE] Usuario nao encontrado: {current_user.usuario_id}")
+        print(f"[ANALISE] Usuario nao encontrado: {current_user.usuario_id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuário não encontrado"
+        )
+    
+    # Verificar limite diário (a reserva atômica acontece junto com a criação da redação)
+    if correcoes_hoje(usuario) >= usuario.limite_diario:
+        logger.warning(f"[ANALISE] Limite diario atingido para usuario: {current_user.usuario_id}")
+        print(f"[ANALISE] Limite diario atingido para usuario: {current_user.usuario_id}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Limite diário de {usuario.limite_diario} análises atingido. "
+                   f"Considere fazer upgrade para Premium!"
+        )
+    
+    # Validações
+    if len(redacao.texto) < 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="O texto deve ter no mínimo 100 caracteres"
+        )
+    
+    # Revisão: a redação anterior precisa ser do próprio usuário
+    if redacao.revisao_de:
+        anterior = await db.scalar(select(Redacao.usuario_id).where(Redacao.id == redacao.revisao_de))
+        if anterior != current_user.usuario_id:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail="Usuário não encontrado"
-            )
-        
-        # Verificar limite diário
-        if usuario.correcoes_realizadas_hoje >= usuario.limite_diario:
-            logger.warning(f"[ANALISE] Limite diario atingido para usuario: {current_user.usuario_id}")
-            print(f"[ANALISE] Limite diario atingido para usuario: {current_user.usuario_id}")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Limite diário de {usuario.limite_diario} análises atingido. "
-                       f"Considere fazer upgrade para Premium!"
-            )
-        
-        # Validações
-        if len(redacao.texto) < 100:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="O texto deve ter no mínimo 100 caracteres"
+                detail="Redação anterior (revisao_de) não encontrada"
             )
-        
+    
+    # Backpressure: sem vaga para o plano, recusa com 429 + Retry-After
+    controle_admissao.reservar_sincrona(usuario.plano)
+    
+    try:
         # Criar registro de redação
         redacao_id = str(uuid.uuid4())
         logger.info(f"[ANALISE] Criando redacao: {redacao_id}")
@@ -83,65 +103,157 @@ async def analisar_redacao(
             texto=redacao.texto,
             tema=redacao.tema,
             tipo=redacao.tipo,
+            revisao_de=redacao.revisao_de,
             status=StatusRedacaoEnum.ANALISANDO
         )
         
+        # Reserva condicional: análises simultâneas do mesmo usuário não passam juntas do limite
+        dia_cota = await reservar_cota_diaria(db, usuario.id)
+        if dia_cota is None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Limite diário de {usuario.limite_diario} análises atingido. "
+                       f"Considere fazer upgrade para Premium!"
+            )
+        
         db.add(nova_redacao)
-        db.commit()
-        db.refresh(nova_redacao)
+        await db.commit()
+        await db.refresh(nova_redacao)
+    except BaseException:
+        await db.rollback()
+        controle_admissao.liberar_sincrona(usuario.plano)
+        raise
+    
+    return usuario, nova_redacao, dia_cota
+
+
+async def _concluir_analise(
+    db: AsyncSession,
+    usuario: Usuario,
+    nova_redacao: Redacao,
+    analise_completa: AnaliseCompleta,
+    idempotency_key: Optional[str] = None
+):
+    """
+    Salva a análise e conclui a redação (a correção do dia já foi reservada em _preparar_analise).
+    Com `idempotency_key`, a resposta idempotente entra no mesmo commit.
+    """
+    logger.info(f"[ANALISE] Salvando analise no banco...")
+    print(f"[ANALISE] Salvando analise no banco...")
+    
+    nova_analise = criar_analise(analise_completa)
+    
+    db.add(nova_analise)
+    
+    # Atualizar status da redação
+    nova_redacao.status = StatusRedacaoEnum.CONCLUIDA
+    
+    if idempotency_key:
+        await gerenciador_idempotencia.concluir(
+            db, usuario.id, "POST /analises/analisar", idempotency_key, status.HTTP_200_OK, analise_completa
+        )
+    
+    await db.commit()
+    
+    logger.info(f"[ANALISE] Analise da redacao {nova_redacao.id} concluida!")
+    print(f"[OK] Analise da redacao {nova_redacao.id} concluida!")
+
+
+@router.post("/analises/analisar", response_model=AnaliseCompleta)
+async def analisar_redacao(
+    redacao: RedacaoSubmit,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: TokenData = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Analisa uma redação usando o sistema multiagentes
+    
+    - **Free**: Análise gramatical + Detecção de fuga ao tema + Nota geral
+    - **Premium**: Análise completa com todos os agentes + Funcionalidades extras
+    
+    Com o header Idempotency-Key, retentativas com a mesma chave recebem a análise original
+    (409 enquanto ela ainda está em execução).
+    """
+    usuario_id = current_user.usuario_id
+    if idempotency_key:
+        # A requisição original pode levar até ANALYSIS_TIMEOUT_SECONDS: só depois disso
+        # a chave sem resposta é considerada abandonada
+        resposta_original = await gerenciador_idempotencia.iniciar(
+            db, usuario_id, "POST /analises/analisar", idempotency_key, redacao,
+            trava_segundos=settings.ANALYSIS_TIMEOUT_SECONDS + settings.IDEMPOTENCY_LOCK_SECONDS
+        )
+        if resposta_original:
+            return resposta_original
+    
+    try:
+        analise_completa = await _analisar_redacao_sincrona(redacao, current_user, db, idempotency_key)
+    except BaseException:
+        if idempotency_key:
+            await gerenciador_idempotencia.descartar(db, usuario_id, "POST /analises/analisar", idempotency_key)
+        raise
+    
+    return analise_completa
+
+
+async def _analisar_redacao_sincrona(
+    redacao: RedacaoSubmit,
+    current_user: TokenData,
+    db: AsyncSession,
+    idempotency_key: Optional[str] = None
+) -> AnaliseCompleta:
+    """Cria a redação, executa os agentes e salva a análise (com a resposta idempotente, se houver chave)"""
+    try:
+        logger.info(f"[ANALISE] Iniciando analise para usuario: {current_user.usuario_id}")
+        print(f"[ANALISE] Iniciando analise para usuario: {current_user.usuario_id}")
+        
+        usuario, nova_redacao, dia_cota = await _preparar_analise(redacao, current_user, db)
+        redacao_id = nova_redacao.id
+        plano = usuario.plano
+        inicio = time.monotonic()
+        duracao = None
         
         try:
             # Executar análise
-            logger.info(f"[ANALISE] Executando analise da redacao {redacao_id} ({usuario.plano.value})...")
-            print(f"[INIT] Iniciando analise da redacao {redacao_id} ({usuario.plano.value})...")
+            logger.info(f"[ANALISE] Executando analise da redacao {redacao_id} ({plano.value})...")
+            print(f"[INIT] Iniciando analise da redacao {redacao_id} ({plano.value})...")
             
-            analise_completa = await orquestrador.analisar_redacao(
-                redacao=redacao,
-                plano_usuario=usuario.plano,
-                redacao_id=redacao_id
-            )
+            # Sem transação aberta durante o LLM: a conexão volta ao pool até a gravação
+            base_revisao = await carregar_base_revisao(db, redacao.revisao_de)
+            await db.commit()
             
-            # Salvar análise no banco
-            logger.info(f"[ANALISE] Salvando analise no banco...")
-            print(f"[ANALISE] Salvando analise no banco...")
-            
-            nova_analise = Analise(
-                id=redacao_id,
-                redacao_id=redacao_id,
-                plano_usuario=analise_completa.plano_usuario,
-                tempo_processamento=analise_completa.tempo_processamento,
-                tokens_utilizados=analise_completa.tokens_utilizados,
-                analise_gramatical=analise_completa.analise_gramatical.dict(),
-                analise_logica=analise_completa.analise_logica.dict() if analise_completa.analise_logica else None,
-                analise_estrutural=analise_completa.analise_estrutural.dict() if analise_completa.analise_estrutural else None,
-                repertorio_sociocultural=analise_completa.repertorio_sociocultural.dict() if analise_completa.repertorio_sociocultural else None,
-                reescritas_comparativas=[r.dict() for r in analise_completa.reescritas_comparativas] if analise_completa.reescritas_comparativas else None,
-                modo_socratico=analise_completa.modo_socratico.dict() if analise_completa.modo_socratico else None,
-                avaliacao_final=analise_completa.avaliacao_final.dict(),
-                fuga_ao_tema={"fuga": analise_completa.fuga_ao_tema, "aderencia": analise_completa.aderencia_tema, "palavras": analise_completa.palavras_chave_usadas},
-                aderencia_tema=analise_completa.aderencia_tema,
-                palavras_chave_usadas=analise_completa.palavras_chave_usadas
+            # Tempo limitado: depois disso o reaper considera a redação abandonada
+            analise_completa = await asyncio.wait_for(
+                orquestrador.analisar_redacao(
+                    redacao=redacao,
+                    plano_usuario=plano,
+                    redacao_id=redacao_id,
+                    base_revisao=base_revisao
+                ),
+                timeout=settings.ANALYSIS_TIMEOUT_SECONDS
             )
+            duracao = time.monotonic() - inicio
             
-            db.add(nova_analise)
-            
-            # Atualizar status da redação
-            nova_redacao.status = StatusRedacaoEnum.CONCLUIDA
-            
-            # Incrementar contador de análises
-            usuario.correcoes_realizadas_hoje += 1
-            
-            db.commit()
-            
-            logger.info(f"[ANALISE] Analise da redacao {redacao_id} concluida!")
-            print(f"[OK] Analise da redacao {redacao_id} concluida!")
+            await _concluir_analise(db, usuario, nova_redacao, analise_completa, idempotency_key)
             
             return analise_completa
             
+        except asyncio.CancelledError:
+            # Requisição cancelada: a análise não foi entregue, a reserva volta para a cota
+            async with SessionLocal() as db_cota:
+                await devolver_cota_diaria(db_cota, current_user.usuario_id, dia_cota)
+                await db_cota.commit()
+            raise
         except Exception as e:
-            # Atualizar status da redação para erro
-            nova_redacao.status = StatusRedacaoEnum.ERRO
-            db.commit()
+            # Atualizar status da redação para erro e devolver a reserva da cota
+            # (UPDATE explícito: após o rollback os atributos do objeto estão expirados)
+            await db.rollback()
+            await db.execute(
+                update(Redacao).where(Redacao.id == redacao_id).values(status=StatusRedacaoEnum.ERRO)
+            )
+            await devolver_cota_diaria(db, current_user.usuario_id, dia_cota)
+            await db.commit()
             
             logger.error(f"[ANALISE] Erro ao analisar redacao {redacao_id}: {str(e)}")
             logger.error(f"[ANALISE] Traceback: {traceback.format_exc()}")
@@ -152,6 +264,8 @@ async def analisar_redacao(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Erro ao processar análise: {str(e)}"
             )
+        finally:
+            controle_admissao.liberar_sincrona(plano, duracao)
             
     except HTTPException:
         raise
@@ -160,23 +274,151 @@ async def analisar_redacao(
         logger.error(f"[ANALISE] Traceback: {traceback.format_exc()}")
         print(f"[ANALISE] ERRO geral: {str(e)}")
         traceback.print_exc()
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao processar análise: {str(e)}"
         )
 
 
+# Análises em streaming ainda em execução (referência forte até terminarem)
+_analises_em_andamento: Set[asyncio.Task] = set()
+
+
+def _evento_sse(evento: str, dados: Any) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(jsonable_encoder(dados), ensure_ascii=False)}\n\n"
+
+
+async def _executar_analise_stream(
+    redacao: RedacaoSubmit,
+    plano_usuario: PlanoEnum,
+    usuario_id: str,
+    redacao_id: str,
+    dia_cota: date,
+    fila: asyncio.Queue
+):
+    """
+    Roda a análise publicando cada etapa na fila e persiste o resultado numa sessão própria.
+    Se a análise falhar, a reserva da cota (dia_cota) é devolvida.
+    """
+    async def ao_concluir_etapa(etapa: str, resultado: Any):
+        await fila.put((etapa, resultado))
+    
+    async def ao_receber_item(evento: str, item: Any):
+        await fila.put((evento, item))
+    
+    inicio = time.monotonic()
+    duracao = None
+    try:
+        async with SessionLocal() as db:
+            base_revisao = await carregar_base_revisao(db, redacao.revisao_de)
+        analise_completa = await asyncio.wait_for(
+            orquestrador.analisar_redacao(
+                redacao=redacao,
+                plano_usuario=plano_usuario,
+                redacao_id=redacao_id,
+                ao_concluir_etapa=ao_concluir_etapa,
+                ao_receber_item=ao_receber_item,
+                base_revisao=base_revisao
+            ),
+            timeout=settings.ANALYSIS_TIMEOUT_SECONDS
+        )
+        duracao = time.monotonic() - inicio
+        async with SessionLocal() as db:
+            usuario = await db.scalar(select(Usuario).where(Usuario.id == usuario_id))
+            nova_redacao = await db.scalar(select(Redacao).where(Redacao.id == redacao_id))
+            await _concluir_analise(db, usuario, nova_redacao, analise_completa)
+        await fila.put(("concluido", analise_completa))
+    except Exception as e:
+        logger.error(f"[ANALISE] Erro ao analisar redacao {redacao_id}: {str(e)}")
+        logger.error(f"[ANALISE] Traceback: {traceback.format_exc()}")
+        print(f"[ERROR] Erro ao analisar redacao {redacao_id}: {str(e)}")
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Redacao).where(Redacao.id == redacao_id).values(status=StatusRedacaoEnum.ERRO)
+            )
+            await devolver_cota_diaria(db, usuario_id, dia_cota)
+            await db.commit()
+        await fila.put(("erro", {"detail": f"Erro ao processar análise: {str(e)}"}))
+    finally:
+        controle_admissao.liberar_sincrona(plano_usuario, duracao)
+
+
+async def _eventos_analise(
+    plano_usuario: PlanoEnum,
+    redacao_id: str,
+    fila: asyncio.Queue
+) -> AsyncIterator[str]:
+    """Gera os eventos SSE da análise (publicados na fila), na ordem em que as etapas terminam"""
+    yield _evento_sse("inicio", {
+        "redacao_id": redacao_id,
+        "plano_usuario": plano_usuario.value,
+        "etapas": [CAMPOS_ETAPAS[nome] for nome in orquestrador._montar_etapas(plano_usuario)]
+    })
+    
+    while True:
+        evento, dados = await fila.get()
+        if evento == "fuga_ao_tema":
+            dados = {
+                "fuga_ao_tema": dados["fuga"],
+                "aderencia_tema": dados["aderencia"],
+                "palavras_chave_usadas": dados["palavras_usadas"]
+            }
+        yield _evento_sse(CAMPOS_ETAPAS.get(evento, evento), dados)
+        if evento in ("concluido", "erro"):
+            break
+
+
+@router.post("/analises/analisar/stream")
+async def analisar_redacao_stream(
+    redacao: RedacaoSubmit,
+    current_user: TokenData = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Analisa uma redação enviando cada resultado por Server-Sent Events assim que fica pronto
+    
+    Eventos: `inicio`, `fuga_ao_tema`, um evento por análise (`analise_gramatical`,
+    `analise_logica`, ..., `avaliacao_final`) na ordem em que os agentes terminam e,
+    por fim, `concluido` (AnaliseCompleta) ou `erro`. Enquanto o Gramático e o Lógico
+    escrevem, cada item sai em `erro_gramatical` / `problema_logico` (com posição no texto).
+    """
+    logger.info(f"[ANALISE] Iniciando analise (stream) para usuario: {current_user.usuario_id}")
+    print(f"[ANALISE] Iniciando analise (stream) para usuario: {current_user.usuario_id}")
+    
+    usuario, nova_redacao, dia_cota = await _preparar_analise(redacao, current_user, db)
+    
+    # A análise roda numa tarefa própria, criada já aqui: se o cliente desconectar (ou a
+    # resposta nunca começar) ela termina, fica salva (consultável em GET /analises/{redacao_id})
+    # e libera a vaga de admissão
+    fila: asyncio.Queue = asyncio.Queue()
+    tarefa = asyncio.create_task(
+        _executar_analise_stream(redacao, usuario.plano, usuario.id, nova_redacao.id, dia_cota, fila)
+    )
+    _analises_em_andamento.add(tarefa)
+    tarefa.add_done_callback(_analises_em_andamento.discard)
+    
+    return StreamingResponse(
+        _eventos_analise(usuario.plano, nova_redacao.id, fila),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Sem buffer em proxies (nginx)
+        }
+    )
+
+
 @router.get("/analises/{redacao_id}", response_model=AnaliseCompleta)
 async def obter_analise(
     redacao_id: str,
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Obtém uma análise específica
     """
-    analise_db = db.query(Analise).filter(Analise.id == redacao_id).first()
+    analise_db = await db.scalar(select(Analise).where(Analise.id == redacao_id))
     
     if not analise_db:
         raise HTTPException(
@@ -185,39 +427,16 @@ async def obter_analise(
         )
     
     # Verificar se a redação pertence ao usuário
-    redacao = db.query(Redacao).filter(Redacao.id == redacao_id).first()
+    redacao = await db.scalar(select(Redacao).where(Redacao.id == redacao_id))
     if redacao and redacao.usuario_id != current_user.usuario_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Você não tem permissão para acessar esta análise"
         )
     
-    # Converter de dict para AnaliseCompleta
-    from app.schemas.redacao import (
-        AnaliseGramatical, AnaliseLogica, AnaliseEstrutural,
-        RepertorioSociocultural, ReescritaComparativa, ModeSocratico,
-        AvaliacaoFinal
-    )
-    
     # Reconstruir objeto AnaliseCompleta
-    analise_completa = AnaliseCompleta(
-        redacao_id=analise_db.redacao_id,
-        plano_usuario=analise_db.plano_usuario,
-        analise_gramatical=AnaliseGramatical(**analise_db.analise_gramatical),
-        analise_logica=AnaliseLogica(**analise_db.analise_logica) if analise_db.analise_logica else None,
-        analise_estrutural=AnaliseEstrutural(**analise_db.analise_estrutural) if analise_db.analise_estrutural else None,
-        repertorio_sociocultural=RepertorioSociocultural(**analise_db.repertorio_sociocultural) if analise_db.repertorio_sociocultural else None,
-        reescritas_comparativas=[ReescritaComparativa(**r) for r in analise_db.reescritas_comparativas] if analise_db.reescritas_comparativas else None,
-        modo_socratico=ModeSocratico(**analise_db.modo_socratico) if analise_db.modo_socratico else None,
-        avaliacao_final=AvaliacaoFinal(**analise_db.avaliacao_final),
-        # trechos_melhoria é calculado dinamicamente abaixo (para evitar migração de banco)
-        fuga_ao_tema=analise_db.fuga_ao_tema.get("fuga") if analise_db.fuga_ao_tema else False,
-        aderencia_tema=analise_db.aderencia_tema,
-        palavras_chave_usadas=analise_db.palavras_chave_usadas,
-        tempo_processamento=analise_db.tempo_processamento,
-        data_analise=analise_db.data_analise,
-        tokens_utilizados=analise_db.tokens_utilizados
-    )
+    # (trechos_melhoria é calculado dinamicamente abaixo, para evitar migração de banco)
+    analise_completa = analise_completa_do_modelo(analise_db)
 
     # Calcular trechos_melhoria com base no texto original da redação + análises salvas
     if redacao:
@@ -234,17 +453,19 @@ async def obter_analise(
 async def listar_analises(
     current_user: TokenData = Depends(get_current_user),
     limite: int = 10,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Lista análises do usuário
     """
     # Buscar redações do usuário
-    redacoes = db.query(Redacao).filter(Redacao.usuario_id == current_user.usuario_id).all()
+    redacoes = (await db.scalars(select(Redacao).where(Redacao.usuario_id == current_user.usuario_id))).all()
     redacao_ids = [r.id for r in redacoes]
     
     # Buscar análises dessas redações
-    analises = db.query(Analise).filter(Analise.redacao_id.in_(redacao_ids)).order_by(Analise.data_analise.desc()).limit(limite).all()
+    analises = (await db.scalars(
+        select(Analise).where(Analise.redacao_id.in_(redacao_ids)).order_by(Analise.data_analise.desc()).limit(limite)
+    )).all()
     
     resultado = []
     for analise in analises:
@@ -265,7 +486,7 @@ async def listar_analises(
 @router.get("/analises/estatisticas/evolucao")
 async def obter_estatisticas_evolucao(
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retorna estatísticas de evolução do usuário
@@ -273,7 +494,7 @@ async def obter_estatisticas_evolucao(
     Premium: Gráfico detalhado de evolução
     Free: Estatísticas básicas
     """
-    usuario = db.query(Usuario).filter(Usuario.id == current_user.usuario_id).first()
+    usuario = await db.scalar(select(Usuario).where(Usuario.id == current_user.usuario_id))
     
     if not usuario:
         raise HTTPException(
@@ -282,11 +503,11 @@ async def obter_estatisticas_evolucao(
         )
     
     # Buscar redações do usuário
-    redacoes = db.query(Redacao).filter(Redacao.usuario_id == current_user.usuario_id).all()
+    redacoes = (await db.scalars(select(Redacao).where(Redacao.usuario_id == current_user.usuario_id))).all()
     redacao_ids = [r.id for r in redacoes]
     
     # Buscar análises
-    analises = db.query(Analise).filter(Analise.redacao_id.in_(redacao_ids)).all()
+    analises = (await db.scalars(select(Analise).where(Analise.redacao_id.in_(redacao_ids)))).all()
     
     if not analises:
         return {
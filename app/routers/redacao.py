@@ -2,35 +2,46 @@
 Rotas de redações (submissão e consulta)
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Response
+from typing import List, Optional
+import asyncio
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
-from app.schemas.redacao import RedacaoSubmit, RedacaoResponse
+from app.config import settings
+from app.schemas.redacao import RedacaoSubmit, RedacaoResponse, TarefaResponse
 from app.schemas.usuario import TokenData
 from app.services.auth_service import get_current_user
 from app.database import get_db
 from app.models.redacao import Redacao, StatusRedacaoEnum
 from app.models.analise import Analise
-from sqlalchemy.orm import Session
+from app.models.usuario import Usuario
+from app.services.estimativa_fila import estimador_fila
+from app.services.controle_admissao import controle_admissao
+from app.services.idempotencia import gerenciador_idempotencia
+from app.services.fila_notificacao import notificar_nova_redacao
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-@router.post("/redacoes", response_model=RedacaoResponse, status_code=status.HTTP_201_CREATED)
-async def submeter_redacao(
+async def _registrar_redacao(
     redacao: RedacaoSubmit,
-    current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+    usuario_id: str,
+    db: AsyncSession
+) -> Redacao:
     """
-    Submete uma redação para análise.
-    A redação será processada automaticamente por um worker em background.
+    Valida e enfileira a redação como PENDENTE para o worker.
+    Não faz commit: a rota confirma a redação junto com a resposta idempotente.
     """
+    # Fila cheia: recusa (503 + Retry-After) em vez de acumular trabalho que vai expirar
+    await controle_admissao.verificar_fila(db)
+    
     # Validações
     if len(redacao.texto) < 100:
         raise HTTPException(
@@ -44,50 +55,38 @@ async def submeter_redacao(
             detail="O texto deve ter no máximo 10.000 caracteres"
         )
     
+    # Revisão: a redação anterior precisa ser do próprio usuário
+    if redacao.revisao_de:
+        await _obter_redacao_do_usuario(redacao.revisao_de, usuario_id, db)
+    
     # Criar redação no banco de dados
     redacao_id = str(uuid.uuid4())
     
     nova_redacao = Redacao(
         id=redacao_id,
-        usuario_id=current_user.usuario_id,
+        usuario_id=usuario_id,
         titulo=redacao.titulo,
         texto=redacao.texto,
         tema=redacao.tema,
         tipo=redacao.tipo,
+        revisao_de=redacao.revisao_de,
         status=StatusRedacaoEnum.PENDENTE
     )
     
     db.add(nova_redacao)
-    db.commit()
-    db.refresh(nova_redacao)
+    # Acordar os workers (entregue somente após o commit)
+    await notificar_nova_redacao(db, redacao_id)
+    await db.flush()
     
-    logger.info(f"[REDACAO] Redacao {redacao_id} submetida pelo usuario {current_user.usuario_id}")
+    logger.info(f"[REDACAO] Redacao {redacao_id} submetida pelo usuario {usuario_id}")
     print(f"[REDACAO] Redacao {redacao_id} submetida - status: PENDENTE")
     
-    return RedacaoResponse(
-        id=nova_redacao.id,
-        usuario_id=nova_redacao.usuario_id,
-        titulo=nova_redacao.titulo,
-        texto=nova_redacao.texto,
-        tema=nova_redacao.tema,
-        tipo=nova_redacao.tipo,
-        data_submissao=nova_redacao.data_submissao,
-        status=nova_redacao.status.value,
-        nota_enem=None,
-        nota_geral=None
-    )
+    return nova_redacao
 
 
-@router.get("/redacoes/{redacao_id}", response_model=RedacaoResponse)
-async def obter_redacao(
-    redacao_id: str,
-    current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Obtém uma redação específica
-    """
-    redacao = db.query(Redacao).filter(Redacao.id == redacao_id).first()
+async def _obter_redacao_do_usuario(redacao_id: str, usuario_id: str, db: AsyncSession) -> Redacao:
+    """Busca a redação garantindo que pertence ao usuário (404/403)"""
+    redacao = await db.scalar(select(Redacao).where(Redacao.id == redacao_id))
     
     if not redacao:
         raise HTTPException(
@@ -96,14 +95,77 @@ async def obter_redacao(
         )
     
     # Verificar se é do usuário
-    if redacao.usuario_id != current_user.usuario_id:
+    if redacao.usuario_id != usuario_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Você não tem permissão para acessar esta redação"
         )
     
+    return redacao
+
+
+@router.post("/redacoes", response_model=RedacaoResponse, status_code=status.HTTP_201_CREATED)
+async def submeter_redacao(
+    redacao: RedacaoSubmit,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: TokenData = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Submete uma redação para análise.
+    A redação será processada automaticamente por um worker em background.
+    Com o header Idempotency-Key, retentativas com a mesma chave recebem a resposta original.
+    """
+    usuario_id = current_user.usuario_id
+    if idempotency_key:
+        resposta_original = await gerenciador_idempotencia.iniciar(
+            db, usuario_id, "POST /redacoes", idempotency_key, redacao
+        )
+        if resposta_original:
+            return resposta_original
+    
+    try:
+        nova_redacao = await _registrar_redacao(redacao, usuario_id, db)
+        resposta = RedacaoResponse(
+            id=nova_redacao.id,
+            usuario_id=nova_redacao.usuario_id,
+            titulo=nova_redacao.titulo,
+            texto=nova_redacao.texto,
+            tema=nova_redacao.tema,
+            tipo=nova_redacao.tipo,
+            data_submissao=nova_redacao.data_submissao,
+            status=nova_redacao.status.value,
+            revisao_de=nova_redacao.revisao_de,
+            nota_enem=None,
+            nota_geral=None
+        )
+        if idempotency_key:
+            await gerenciador_idempotencia.concluir(
+                db, usuario_id, "POST /redacoes", idempotency_key, status.HTTP_201_CREATED, resposta
+            )
+        # Redação e resposta idempotente no mesmo commit
+        await db.commit()
+    except BaseException:
+        if idempotency_key:
+            await gerenciador_idempotencia.descartar(db, usuario_id, "POST /redacoes", idempotency_key)
+        raise
+    
+    return resposta
+
+
+@router.get("/redacoes/{redacao_id}", response_model=RedacaoResponse)
+async def obter_redacao(
+    redacao_id: str,
+    current_user: TokenData = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Obtém uma redação específica
+    """
+    redacao = await _obter_redacao_do_usuario(redacao_id, current_user.usuario_id, db)
+    
     # Se houver análise, anexar nota
-    analise = db.query(Analise).filter(Analise.redacao_id == redacao.id).first()
+    analise = await db.scalar(select(Analise).where(Analise.redacao_id == redacao.id))
     nota_enem = None
     nota_geral = None
     if analise and analise.avaliacao_final:
@@ -122,6 +184,7 @@ async def obter_redacao(
         tipo=redacao.tipo,
         data_submissao=redacao.data_submissao,
         status=redacao.status.value,
+        revisao_de=redacao.revisao_de,
         nota_enem=nota_enem,
         nota_geral=nota_geral
     )
@@ -131,19 +194,18 @@ async def obter_redacao(
 async def listar_redacoes(
     current_user: TokenData = Depends(get_current_user),
     limite: int = 10,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Lista redações do usuário
     """
-    rows = (
-        db.query(Redacao, Analise)
+    rows = (await db.execute(
+        select(Redacao, Analise)
         .outerjoin(Analise, Analise.redacao_id == Redacao.id)
-        .filter(Redacao.usuario_id == current_user.usuario_id)
+        .where(Redacao.usuario_id == current_user.usuario_id)
         .order_by(Redacao.data_submissao.desc())
         .limit(limite)
-        .all()
-    )
+    )).all()
 
     resp: List[RedacaoResponse] = []
     for r, a in rows:
@@ -166,6 +228,7 @@ async def listar_redacoes(
                 tipo=r.tipo,
                 data_submissao=r.data_submissao,
                 status=r.status.value,
+                revisao_de=r.revisao_de,
                 nota_enem=nota_enem,
                 nota_geral=nota_geral
             )
@@ -173,3 +236,102 @@ async def listar_redacoes(
 
     return resp
 
+
+# Status finais de uma tarefa (o long-polling não espera além deles)
+STATUS_FINAIS = {StatusRedacaoEnum.CONCLUIDA, StatusRedacaoEnum.ERRO}
+
+
+async def _estado_tarefa(redacao: Redacao, response: Response, db: AsyncSession) -> TarefaResponse:
+    """Monta o estado da tarefa com posição na fila e previsão de conclusão"""
+    plano = await db.scalar(select(Usuario.plano).where(Usuario.id == redacao.usuario_id))
+    posicao, eta = await estimador_fila.estimar(db, redacao, plano)
+    
+    url_status = f"{settings.API_V1_PREFIX}/tarefas/{redacao.id}"
+    tarefa = TarefaResponse(
+        id=redacao.id,
+        status=redacao.status.value,
+        url_status=url_status,
+        url_resultado=(
+            f"{settings.API_V1_PREFIX}/analises/{redacao.id}"
+            if redacao.status == StatusRedacaoEnum.CONCLUIDA else None
+        ),
+        posicao_fila=posicao,
+        eta_segundos=round(eta, 1) if eta is not None else None,
+        previsao_conclusao=datetime.utcnow() + timedelta(seconds=eta) if eta is not None else None,
+        data_submissao=redacao.data_submissao
+    )
+    
+    # Sugere ao cliente quando consultar de novo (em vez de polling cego)
+    if redacao.status not in STATUS_FINAIS:
+        intervalo = eta if eta is not None else settings.TASK_MAX_WAIT_SECONDS
+        response.headers["Retry-After"] = str(int(min(max(intervalo, 1), settings.TASK_MAX_WAIT_SECONDS)))
+    
+    return tarefa
+
+
+@router.post("/tarefas", response_model=TarefaResponse, status_code=status.HTTP_202_ACCEPTED)
+async def criar_tarefa(
+    redacao: RedacaoSubmit,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: TokenData = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Submete uma redação para análise assíncrona.
+    Retorna 202 com a URL de status (header Location), posição na fila e previsão de conclusão.
+    Com o header Idempotency-Key, retentativas com a mesma chave recebem a resposta original.
+    """
+    usuario_id = current_user.usuario_id
+    if idempotency_key:
+        resposta_original = await gerenciador_idempotencia.iniciar(
+            db, usuario_id, "POST /tarefas", idempotency_key, redacao
+        )
+        if resposta_original:
+            return resposta_original
+    
+    try:
+        nova_redacao = await _registrar_redacao(redacao, usuario_id, db)
+        tarefa = await _estado_tarefa(nova_redacao, response, db)
+        if idempotency_key:
+            await gerenciador_idempotencia.concluir(
+                db, usuario_id, "POST /tarefas", idempotency_key, status.HTTP_202_ACCEPTED, tarefa,
+                headers={"Location": tarefa.url_status}
+            )
+        # Redação e resposta idempotente no mesmo commit
+        await db.commit()
+    except BaseException:
+        if idempotency_key:
+            await gerenciador_idempotencia.descartar(db, usuario_id, "POST /tarefas", idempotency_key)
+        raise
+    
+    response.headers["Location"] = tarefa.url_status
+    return tarefa
+
+
+@router.get("/tarefas/{tarefa_id}", response_model=TarefaResponse)
+async def obter_tarefa(
+    tarefa_id: str,
+    response: Response,
+    wait: int = Query(0, ge=0, le=settings.TASK_MAX_WAIT_SECONDS, description="Segundos aguardando mudança de status (long-polling)"),
+    current_user: TokenData = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Consulta o estado de uma tarefa.
+    Com `wait`, a resposta só é enviada quando o status mudar ou o tempo acabar.
+    """
+    redacao = await _obter_redacao_do_usuario(tarefa_id, current_user.usuario_id, db)
+    
+    status_inicial = redacao.status
+    limite = time.monotonic() + wait
+    while redacao.status == status_inicial and redacao.status not in STATUS_FINAIS:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            break
+        # Encerra a transação durante a espera para não prender uma conexão do pool
+        await db.commit()
+        await asyncio.sleep(min(settings.TASK_POLL_INTERVAL, restante))
+        await db.refresh(redacao)
+    
+    return await _estado_tarefa(redacao, response, db)
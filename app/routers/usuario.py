@@ -17,10 +17,12 @@ from app.schemas.usuario import (
     TokenData
 )
 from app.services.auth_service import auth_service, get_current_user
+from app.services.cota_service import correcoes_hoje
 from app.config import settings
 from app.database import get_db
 from app.models.usuario import Usuario
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -29,7 +31,7 @@ router = APIRouter()
 
 
 @router.post("/usuarios/cadastro", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def cadastrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
+async def cadastrar_usuario(usuario: UsuarioCreate, db: AsyncSession = Depends(get_db)):
     """
     Cadastra um novo usuário
     """
@@ -41,7 +43,7 @@ async def cadastrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db
         logger.info(f"[CADASTRO] Verificando se email ja existe: {usuario.email}")
         print(f"[CADASTRO] Verificando se email ja existe: {usuario.email}")
         
-        usuario_existente = db.query(Usuario).filter(Usuario.email == usuario.email).first()
+        usuario_existente = await db.scalar(select(Usuario).where(Usuario.email == usuario.email))
         if usuario_existente:
             logger.warning(f"[CADASTRO] Email ja cadastrado: {usuario.email}")
             print(f"[CADASTRO] Email ja cadastrado: {usuario.email}")
@@ -91,8 +93,8 @@ async def cadastrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db
         print(f"[CADASTRO] Salvando usuario no banco de dados...")
         
         db.add(novo_usuario)
-        db.commit()
-        db.refresh(novo_usuario)
+        await db.commit()
+        await db.refresh(novo_usuario)
         
         logger.info(f"[CADASTRO] Usuario salvo com sucesso. ID: {usuario_id}")
         print(f"[CADASTRO] Usuario salvo com sucesso. ID: {usuario_id}")
@@ -141,7 +143,7 @@ async def cadastrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db
         traceback.print_exc()
         
         # Rollback em caso de erro
-        db.rollback()
+        await db.rollback()
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -150,7 +152,7 @@ async def cadastrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db
 
 
 @router.post("/usuarios/login", response_model=Token)
-async def login(credenciais: UsuarioLogin, db: Session = Depends(get_db)):
+async def login(credenciais: UsuarioLogin, db: AsyncSession = Depends(get_db)):
     """
     Realiza login e retorna token JWT
     """
@@ -159,7 +161,7 @@ async def login(credenciais: UsuarioLogin, db: Session = Depends(get_db)):
         print(f"[LOGIN] Tentativa de login: {credenciais.email}")
         
         # Buscar usuário por email
-        usuario = db.query(Usuario).filter(Usuario.email == credenciais.email).first()
+        usuario = await db.scalar(select(Usuario).where(Usuario.email == credenciais.email))
         
         if not usuario:
             logger.warning(f"[LOGIN] Usuario nao encontrado: {credenciais.email}")
@@ -193,7 +195,7 @@ async def login(credenciais: UsuarioLogin, db: Session = Depends(get_db)):
             nome=usuario.nome,
             plano=usuario.plano,
             data_criacao=usuario.data_criacao,
-            correcoes_realizadas_hoje=usuario.correcoes_realizadas_hoje,
+            correcoes_realizadas_hoje=correcoes_hoje(usuario),
             limite_diario=usuario.limite_diario
         )
         
@@ -220,7 +222,7 @@ async def login(credenciais: UsuarioLogin, db: Session = Depends(get_db)):
 @router.get("/usuarios/me", response_model=UsuarioResponse)
 async def get_usuario_atual(
     current_user: TokenData = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retorna dados do usuário logado
@@ -229,7 +231,7 @@ async def get_usuario_atual(
         logger.info(f"[PERFIL] Buscando usuario: {current_user.usuario_id}")
         print(f"[PERFIL] Buscando usuario: {current_user.usuario_id}")
         
-        usuario = db.query(Usuario).filter(Usuario.id == current_user.usuario_id).first()
+        usuario = await db.scalar(select(Usuario).where(Usuario.id == current_user.usuario_id))
         
         if not usuario:
             logger.warning(f"[PERFIL] Usuario nao encontrado: {current_user.usuario_id}")
@@ -245,7 +247,7 @@ async def get_usuario_atual(
             nome=usuario.nome,
             plano=usuario.plano,
             data_criacao=usuario.data_criacao,
-            correcoes_realizadas_hoje=usuario.correcoes_realizadas_hoje,
+            correcoes_realizadas_hoje=correcoes_hoje(usuario),
             limite_diario=usuario.limite_diario
         )
     except HTTPException:
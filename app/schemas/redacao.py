@@ -27,6 +27,10 @@ class RedacaoSubmit(BaseModel):
         default=None,
         description="Palavras-chave esperadas no tema"
     )
+    revisao_de: Optional[str] = Field(
+        default=None,
+        description="ID da redação da qual esta é uma revisão (reanálise só do que mudou)"
+    )
     
     @field_validator('texto')
     @classmethod
@@ -65,6 +69,18 @@ class RedacaoSubmit(BaseModel):
         return re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F]', '', v).strip()
 
 
+class TarefaResponse(BaseModel):
+    """Estado de uma análise assíncrona (POST /tarefas)"""
+    id: str
+    status: str  # pendente, analisando, concluida, erro
+    url_status: str
+    url_resultado: Optional[str] = None  # Preenchida quando concluída
+    posicao_fila: Optional[int] = None  # 1 = próxima a ser analisada
+    eta_segundos: Optional[float] = None
+    previsao_conclusao: Optional[datetime] = None
+    data_submissao: datetime
+
+
 class RedacaoResponse(BaseModel):
     """Schema de resposta de redação"""
     id: str
@@ -75,6 +91,7 @@ class RedacaoResponse(BaseModel):
     tipo: TipoRedacaoEnum
     data_submissao: datetime
     status: str = "pendente"  # pendente, analisando, concluída
+    revisao_de: Optional[str] = None
     nota_enem: Optional[int] = None
     nota_geral: Optional[float] = None
     
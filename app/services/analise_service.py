@@ -0,0 +1,78 @@
+"""
+Serviço de persistência das análises
+"""
+
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.analise import Analise
+from app.models.redacao import Redacao
+from app.schemas.redacao import (
+    AnaliseCompleta, AnaliseGramatical, AnaliseLogica, AnaliseEstrutural,
+    RepertorioSociocultural, ReescritaComparativa, ModeSocratico, AvaliacaoFinal
+)
+
+
+def criar_analise(analise_completa: AnaliseCompleta) -> Analise:
+    """Converte a AnaliseCompleta do orquestrador no modelo Analise (mesmo ID da redação)"""
+    return Analise(
+        id=analise_completa.redacao_id,
+        redacao_id=analise_completa.redacao_id,
+        plano_usuario=analise_completa.plano_usuario,
+        tempo_processamento=analise_completa.tempo_processamento,
+        tokens_utilizados=analise_completa.tokens_utilizados,
+        analise_gramatical=analise_completa.analise_gramatical.dict(),
+        analise_logica=analise_completa.analise_logica.dict() if analise_completa.analise_logica else None,
+        analise_estrutural=analise_completa.analise_estrutural.dict() if analise_completa.analise_estrutural else None,
+        repertorio_sociocultural=analise_completa.repertorio_sociocultural.dict() if analise_completa.repertorio_sociocultural else None,
+        reescritas_comparativas=[r.dict() for r in analise_completa.reescritas_comparativas] if analise_completa.reescritas_comparativas else None,
+        modo_socratico=analise_completa.modo_socratico.dict() if analise_completa.modo_socratico else None,
+        avaliacao_final=analise_completa.avaliacao_final.dict(),
+        fuga_ao_tema={"fuga": analise_completa.fuga_ao_tema, "aderencia": analise_completa.aderencia_tema, "palavras": analise_completa.palavras_chave_usadas},
+        aderencia_tema=analise_completa.aderencia_tema,
+        palavras_chave_usadas=analise_completa.palavras_chave_usadas
+    )
+
+
+def analise_completa_do_modelo(analise_db: Analise) -> AnaliseCompleta:
+    """Reconstrói a AnaliseCompleta a partir do modelo salvo (sem trechos_melhoria)"""
+    return AnaliseCompleta(
+        redacao_id=analise_db.redacao_id,
+        plano_usuario=analise_db.plano_usuario,
+        analise_gramatical=AnaliseGramatical(**analise_db.analise_gramatical),
+        analise_logica=AnaliseLogica(**analise_db.analise_logica) if analise_db.analise_logica else None,
+        analise_estrutural=AnaliseEstrutural(**analise_db.analise_estrutural) if analise_db.analise_estrutural else None,
+        repertorio_sociocultural=RepertorioSociocultural(**analise_db.repertorio_sociocultural) if analise_db.repertorio_sociocultural else None,
+        reescritas_comparativas=[ReescritaComparativa(**r) for r in analise_db.reescritas_comparativas] if analise_db.reescritas_comparativas else None,
+        modo_socratico=ModeSocratico(**analise_db.modo_socratico) if analise_db.modo_socratico else None,
+        avaliacao_final=AvaliacaoFinal(**analise_db.avaliacao_final),
+        fuga_ao_tema=analise_db.fuga_ao_tema.get("fuga") if analise_db.fuga_ao_tema else False,
+        aderencia_tema=analise_db.aderencia_tema,
+        palavras_chave_usadas=analise_db.palavras_chave_usadas,
+        tempo_processamento=analise_db.tempo_processamento,
+        data_analise=analise_db.data_analise,
+        tokens_utilizados=analise_db.tokens_utilizados
+    )
+
+
+async def carregar_base_revisao(
+    db: AsyncSession,
+    redacao_anterior_id: Optional[str]
+) -> Optional[Tuple[str, AnaliseCompleta]]:
+    """
+    Texto e análise da redação anterior de uma revisão.
+    None se não há redação anterior ou ela ainda não foi analisada (análise completa).
+    """
+    if not redacao_anterior_id:
+        return None
+    linha = (await db.execute(
+        select(Redacao.texto, Analise)
+        .join(Analise, Analise.redacao_id == Redacao.id)
+        .where(Redacao.id == redacao_anterior_id)
+    )).first()
+    if linha is None:
+        return None
+    texto_anterior, analise_db = linha
+    return texto_anterior, analise_completa_do_modelo(analise_db)
@@ -0,0 +1,123 @@
+"""
+Cache de erros gramaticais por parágrafo
+Chave: parágrafo normalizado (espaços colapsados) + modelo + versão do prompt do Gramático.
+Os erros ficam com posições relativas ao parágrafo e são reancorados em qualquer redação.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from bisect import bisect_left
+import hashlib
+import json
+import logging
+
+from app.config import settings
+from app.schemas.redacao import ErroGramatical
+from app.services.llm_cache import LLMCache
+
+logger = logging.getLogger(__name__)
+
+
+class CacheParagrafosGramatica:
+    """Erros gramaticais de parágrafos já analisados (armazenamento: LLMCache, com TTL e despejo)"""
+
+    def __init__(self, armazenamento: LLMCache):
+        self.armazenamento = armazenamento
+
+    @staticmethod
+    def normalizar(paragrafo: str) -> Tuple[str, List[int]]:
+        """
+        Colapsa espaços em branco (e remove os das pontas).
+
+        Returns:
+            (texto normalizado, posição no parágrafo original de cada caractere normalizado)
+        """
+        caracteres: List[str] = []
+        mapa: List[int] = []
+        espaco = False
+        for i, c in enumerate(paragrafo):
+            if c.isspace():
+                espaco = bool(caracteres)
+                continue
+            if espaco:
+                caracteres.append(" ")
+                mapa.append(i - 1)
+                espaco = False
+            caracteres.append(c)
+            mapa.append(i)
+        return "".join(caracteres), mapa
+
+    @staticmethod
+    def gerar_chave(normalizado: str, modelo: str, versao_prompt: str) -> str:
+        """Hash do parágrafo normalizado e do que determina a análise"""
+        payload = json.dumps([normalizado, modelo, versao_prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def buscar(self, paragrafo: str, modelo: str, versao_prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+            {"erros": [ErroGramatical com posições relativas ao parágrafo], "vicios_linguagem", "feedback_geral"}
+            ou None se o parágrafo não está no cache
+        """
+        normalizado, mapa = self.normalizar(paragrafo)
+        if not normalizado:
+            return None
+        entrada = await self.armazenamento.get(self.gerar_chave(normalizado, modelo, versao_prompt))
+        if entrada is None:
+            return None
+
+        erros = []
+        for dados in entrada["erros"]:
+            inicio, fim = dados.pop("inicio"), dados.pop("fim")
+            # Reancora no parágrafo original (o espaçamento pode ser diferente do guardado)
+            p_inicio, p_fim = mapa[inicio], mapa[fim - 1] + 1
+            dados["trecho"] = paragrafo[p_inicio:p_fim]
+            erros.append(ErroGramatical(**dados, posicao_inicio=p_inicio, posicao_fim=p_fim))
+        return {
+            "erros": erros,
+            "vicios_linguagem": entrada["vicios_linguagem"],
+            "feedback_geral": entrada["feedback_geral"],
+        }
+
+    async def guardar(
+        self,
+        paragrafo: str,
+        modelo: str,
+        versao_prompt: str,
+        erros: List[ErroGramatical],
+        vicios_linguagem: List[str],
+        feedback_geral: str
+    ):
+        """Guarda os erros do parágrafo (todos com posição relativa ao parágrafo)"""
+        normalizado, mapa = self.normalizar(paragrafo)
+        if not normalizado:
+            return
+
+        entradas = []
+        for erro in erros:
+            inicio = bisect_left(mapa, erro.posicao_inicio)
+            fim = bisect_left(mapa, erro.posicao_fim)
+            if inicio >= fim:
+                # Erro só em espaços: não sobrevive à normalização, não guarda o parágrafo
+                return
+            dados = erro.model_dump(exclude={"posicao_inicio", "posicao_fim"})
+            entradas.append({**dados, "inicio": inicio, "fim": fim})
+
+        await self.armazenamento.set(self.gerar_chave(normalizado, modelo, versao_prompt), {
+            "erros": entradas,
+            "vicios_linguagem": vicios_linguagem,
+            "feedback_geral": feedback_geral,
+        })
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return self.armazenamento.estatisticas()
+
+
+# Instância global (None = cache desativado)
+cache_paragrafos_gramatica: Optional[CacheParagrafosGramatica] = None
+if settings.GRAMMAR_CACHE_ENABLED:
+    cache_paragrafos_gramatica = CacheParagrafosGramatica(LLMCache(
+        caminho=settings.GRAMMAR_CACHE_PATH,
+        ttl_segundos=settings.GRAMMAR_CACHE_TTL_SECONDS,
+        max_entradas_memoria=settings.GRAMMAR_CACHE_MEMORY_ENTRIES,
+        max_bytes_disco=settings.GRAMMAR_CACHE_MAX_MB * 1024 * 1024
+    ))
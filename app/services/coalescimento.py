@@ -0,0 +1,101 @@
+"""
+Coalescimento (single-flight) de análises idênticas em andamento
+Pedidos simultâneos com o mesmo conteúdo aguardam a mesma execução em vez de repetir as chamadas ao LLM
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescedorAnalises:
+    """Compartilha a execução em andamento entre pedidos com a mesma chave (por processo)"""
+
+    def __init__(self):
+        self._em_voo: Dict[str, asyncio.Task] = {}
+        # Pedidos aguardando cada execução: quando o último desiste, a execução é cancelada
+        self._interessados: Dict[asyncio.Task, int] = {}
+        self.execucoes = 0
+        self.compartilhadas = 0
+
+    @staticmethod
+    def gerar_chave(
+        texto: str,
+        tema: str,
+        tipo: str,
+        plano: str,
+        referencias_esperadas: Sequence[str] = (),
+        base_revisao: Optional[Tuple[str, str]] = None
+    ) -> str:
+        """
+        Hash de tudo que determina a análise.
+        `base_revisao`: texto anterior e análise anterior serializada (reanálise incremental).
+        """
+        payload = json.dumps(
+            [texto, tema, tipo, plano, list(referencias_esperadas), base_revisao],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def executar(self, chave: str, fabrica: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Executa `fabrica()` ou aguarda a execução já em andamento com a mesma chave.
+
+        A execução roda numa task própria: se quem a iniciou for cancelado
+        (ex.: cliente desconectou), os demais continuam aguardando o resultado.
+        Quando todos os interessados são cancelados (ex.: worker perdeu a lease ou está
+        drenando), a execução também é cancelada para não gastar chamadas ao LLM à toa.
+
+        Returns:
+            (resultado, compartilhado) — compartilhado=True quando outra requisição iniciou a execução
+        """
+        tarefa = self._em_voo.get(chave)
+        compartilhado = tarefa is not None
+
+        if compartilhado:
+            self.compartilhadas += 1
+            logger.info(f"[COALESCE] Analise identica em andamento, aguardando resultado ({chave[:12]})")
+            print(f"[COALESCE] Analise identica em andamento, aguardando resultado ({chave[:12]})")
+        else:
+            self.execucoes += 1
+            tarefa = asyncio.create_task(fabrica())
+            self._em_voo[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._finalizar(chave, t))
+
+        self._interessados[tarefa] = self._interessados.get(tarefa, 0) + 1
+        try:
+            return await asyncio.shield(tarefa), compartilhado
+        finally:
+            self._interessados[tarefa] -= 1
+            if not self._interessados[tarefa]:
+                del self._interessados[tarefa]
+                if not tarefa.done():
+                    # Ninguém mais espera: um pedido novo com a mesma chave começa do zero
+                    logger.info(f"[COALESCE] Todos os pedidos desistiram, cancelando analise ({chave[:12]})")
+                    self._descartar(chave, tarefa)
+                    tarefa.cancel()
+
+    def _descartar(self, chave: str, tarefa: asyncio.Task):
+        if self._em_voo.get(chave) is tarefa:
+            del self._em_voo[chave]
+
+    def _finalizar(self, chave: str, tarefa: asyncio.Task):
+        self._descartar(chave, tarefa)
+        # Marca a exceção como lida (todos os interessados podem ter sido cancelados)
+        if not tarefa.cancelled():
+            tarefa.exception()
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "em_andamento": len(self._em_voo),
+            "execucoes": self.execucoes,
+            "compartilhadas": self.compartilhadas,
+        }
+
+
+# Instância global do coalescedor
+coalescedor_analises = CoalescedorAnalises()
@@ -0,0 +1,123 @@
+"""
+Controle de admissão (backpressure) das rotas de análise
+Limita análises síncronas simultâneas por plano e a profundidade da fila do worker,
+recusando o excesso com Retry-After calculado a partir da vazão atual
+"""
+
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+import logging
+import math
+import time
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.analise import Analise
+from app.models.usuario import PlanoEnum
+from app.services.redacao_worker import worker
+
+logger = logging.getLogger(__name__)
+
+
+class ControleAdmissao:
+    """Vagas de análise síncrona por plano (por processo) e limite da fila pendente (global)"""
+
+    def __init__(
+        self,
+        limites_sincronos: Dict[str, int],
+        profundidade_maxima: int,
+        janela_vazao: int,
+        retry_maximo: int,
+        tempo_padrao: float
+    ):
+        self.limites_sincronos = limites_sincronos
+        self.profundidade_maxima = profundidade_maxima
+        self.janela_vazao = janela_vazao
+        self.retry_maximo = retry_maximo
+        self.tempo_padrao = tempo_padrao
+
+        self.em_andamento: Dict[str, int] = {plano.value: 0 for plano in PlanoEnum}
+        # Média móvel exponencial da duração das análises síncronas de cada plano
+        self.tempo_medio: Dict[str, float] = {}
+        self.recusadas = {"sincronas": 0, "fila": 0}
+
+    def _retry_after(self, segundos: float) -> Dict[str, str]:
+        return {"Retry-After": str(int(min(max(math.ceil(segundos), 1), self.retry_maximo)))}
+
+    def reservar_sincrona(self, plano: PlanoEnum):
+        """
+        Ocupa uma vaga de análise síncrona do plano (devolver com liberar_sincrona).
+        Sem vaga: 429 com Retry-After ≈ tempo até a próxima vaga abrir.
+        """
+        limite = self.limites_sincronos.get(plano.value)
+        if limite is not None and self.em_andamento[plano.value] >= limite:
+            self.recusadas["sincronas"] += 1
+            # Com `limite` análises em paralelo, uma vaga abre a cada tempo_medio / limite
+            espera = self.tempo_medio.get(plano.value, self.tempo_padrao) / max(limite, 1)
+            logger.warning(f"[ADMISSAO] Analises sincronas do plano {plano.value} no limite ({limite})")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Muitas análises em andamento no momento. Tente novamente em instantes "
+                       "ou use a análise assíncrona (POST /tarefas).",
+                headers=self._retry_after(espera)
+            )
+        self.em_andamento[plano.value] += 1
+
+    def liberar_sincrona(self, plano: PlanoEnum, duracao: Optional[float] = None):
+        """Devolve a vaga; `duracao` (só de análises concluídas) alimenta a média do plano"""
+        self.em_andamento[plano.value] = max(0, self.em_andamento[plano.value] - 1)
+        if duracao is not None:
+            anterior = self.tempo_medio.get(plano.value)
+            self.tempo_medio[plano.value] = duracao if anterior is None else 0.8 * anterior + 0.2 * duracao
+
+    async def verificar_fila(self, db: AsyncSession):
+        """
+        Recusa novas submissões com a fila pendente cheia.
+        503 com Retry-After ≈ tempo para a fila voltar abaixo do limite na vazão atual.
+
+        Conta as mesmas redações que o worker atende (`worker.ordem_fila`): as estacionadas
+        por cota até o dia seguinte e as reservadas ao processamento em lote ficam de fora.
+        """
+        pendentes = await db.scalar(
+            select(func.count()).select_from(worker.ordem_fila(datetime.utcnow()))
+        )
+        if pendentes < self.profundidade_maxima:
+            return
+
+        self.recusadas["fila"] += 1
+        concluidas = await db.scalar(
+            select(func.count(Analise.id)).where(
+                Analise.data_analise >= datetime.utcnow() - timedelta(seconds=self.janela_vazao)
+            )
+        )
+        vazao = (concluidas or 0) / self.janela_vazao  # análises por segundo
+        excesso = pendentes - self.profundidade_maxima + 1
+        espera = excesso / vazao if vazao > 0 else self.retry_maximo
+
+        logger.warning(f"[ADMISSAO] Fila cheia ({pendentes} pendentes), vazao {vazao * 60:.1f}/min")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Fila de análises cheia no momento. Tente novamente mais tarde.",
+            headers=self._retry_after(espera)
+        )
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            "sincronas_em_andamento": dict(self.em_andamento),
+            "limites_sincronos": dict(self.limites_sincronos),
+            "tempo_medio_sincrono": {plano: round(t, 2) for plano, t in self.tempo_medio.items()},
+            "recusadas": dict(self.recusadas),
+        }
+
+
+# Instância global (vagas síncronas contadas por processo da API)
+controle_admissao = ControleAdmissao(
+    limites_sincronos=settings.ADMISSION_SYNC_LIMITS,
+    profundidade_maxima=settings.ADMISSION_MAX_QUEUE_DEPTH,
+    janela_vazao=settings.ADMISSION_THROUGHPUT_WINDOW,
+    retry_maximo=settings.ADMISSION_RETRY_MAX_SECONDS,
+    tempo_padrao=settings.TASK_ETA_DEFAULT_SECONDS
+)
@@ -0,0 +1,67 @@
+"""
+Serviço de controle da cota diária de análises
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.usuario import Usuario
+
+
+def proximo_reset_cota(agora: datetime = None) -> datetime:
+    """Momento (UTC) em que a cota diária volta a ficar disponível: próxima meia-noite"""
+    agora = agora or datetime.utcnow()
+    return datetime(agora.year, agora.month, agora.day) + timedelta(days=1)
+
+
+def correcoes_hoje(usuario: Usuario) -> int:
+    """Análises do usuário no dia (UTC) atual: um contador de dia anterior vale zero"""
+    if usuario.data_contador != datetime.utcnow().date():
+        return 0
+    return usuario.correcoes_realizadas_hoje or 0
+
+
+async def reservar_cota_diaria(db: AsyncSession, usuario_id: str) -> Optional[date]:
+    """
+    Reserva uma análise da cota do dia antes de executá-la (na transação do chamador).
+    O UPDATE só conta se ainda há cota, então redações do mesmo usuário processadas em
+    paralelo (vários workers/réplicas) não passam juntas do limite.
+
+    Returns:
+        Dia (UTC) da reserva, para devolver_cota_diaria; None se a cota do dia acabou
+    """
+    hoje = datetime.utcnow().date()
+    dia_anterior = or_(Usuario.data_contador.is_(None), Usuario.data_contador < hoje)
+    reservado = await db.scalar(
+        update(Usuario)
+        .where(
+            Usuario.id == usuario_id,
+            or_(dia_anterior, func.coalesce(Usuario.correcoes_realizadas_hoje, 0) < Usuario.limite_diario)
+        )
+        .values(
+            correcoes_realizadas_hoje=case(
+                (dia_anterior, 1),
+                else_=func.coalesce(Usuario.correcoes_realizadas_hoje, 0) + 1
+            ),
+            data_contador=hoje
+        )
+        .returning(Usuario.id)
+        .execution_options(synchronize_session=False)
+    )
+    return hoje if reservado is not None else None
+
+
+async def devolver_cota_diaria(db: AsyncSession, usuario_id: str, dia: date) -> None:
+    """
+    Devolve uma reserva de reservar_cota_diaria (análise falhou ou foi descartada).
+    Reserva de um dia que já virou não é devolvida: o contador já recomeçou.
+    """
+    await db.execute(
+        update(Usuario)
+        .where(Usuario.id == usuario_id, Usuario.data_contador == dia)
+        .values(correcoes_realizadas_hoje=func.greatest(func.coalesce(Usuario.correcoes_realizadas_hoje, 0) - 1, 0))
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,115 @@
+"""
+Posição na fila e previsão de conclusão das redações pendentes
+A previsão usa a média móvel de tempo_processamento das últimas análises de cada plano
+"""
+
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+import logging
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.analise import Analise
+from app.models.redacao import Redacao, StatusRedacaoEnum
+from app.models.usuario import PlanoEnum, Usuario
+from app.services.redacao_worker import worker
+
+logger = logging.getLogger(__name__)
+
+
+class EstimadorFila:
+    """Calcula posição na fila e ETA de uma redação"""
+
+    def __init__(self, janela: int, validade_cache: float, tempo_padrao: float):
+        self.janela = janela
+        self.validade_cache = validade_cache
+        self.tempo_padrao = tempo_padrao
+        self._medias: Dict[str, float] = {}
+        self._medias_em = 0.0
+
+    async def tempos_medios(self, db: AsyncSession) -> Dict[str, float]:
+        """Média de tempo_processamento das últimas `janela` análises de cada plano (em cache)"""
+        if self._medias and time.monotonic() - self._medias_em < self.validade_cache:
+            return self._medias
+
+        medias = {}
+        for plano in PlanoEnum:
+            ultimas = (
+                select(Analise.tempo_processamento.label("tempo"))
+                .where(Analise.plano_usuario == plano.value, Analise.tempo_processamento.is_not(None))
+                .order_by(Analise.data_analise.desc())
+                .limit(self.janela)
+                .subquery()
+            )
+            media = await db.scalar(select(func.avg(ultimas.c.tempo)))
+            medias[plano.value] = float(media) if media is not None else self.tempo_padrao
+
+        self._medias = medias
+        self._medias_em = time.monotonic()
+        return medias
+
+    async def _capacidade(self, db: AsyncSession) -> int:
+        """Análises simultâneas: workers com lease ativa × concorrência de cada um"""
+        workers_ativos = await db.scalar(
+            select(func.count(func.distinct(Redacao.processado_por))).where(
+                Redacao.status == StatusRedacaoEnum.ANALISANDO,
+                Redacao.lease_expira_em > datetime.utcnow()
+            )
+        )
+        return max(1, workers_ativos or 0) * settings.WORKER_CONCURRENCY
+
+    async def estimar(
+        self,
+        db: AsyncSession,
+        redacao: Redacao,
+        plano: PlanoEnum
+    ) -> Tuple[Optional[int], Optional[float]]:
+        """
+        Returns:
+            (posição na fila (1 = próxima), segundos estimados até a conclusão);
+            None quando não se aplica (concluída, com erro ou no processamento em lote)
+        """
+        medias = await self.tempos_medios(db)
+        tempo_proprio = medias.get(plano.value, self.tempo_padrao)
+        agora = datetime.utcnow()
+
+        if redacao.status == StatusRedacaoEnum.ANALISANDO:
+            if redacao.lote_id:
+                return None, None
+            return None, tempo_proprio
+        if redacao.status != StatusRedacaoEnum.PENDENTE:
+            return None, None
+
+        fila = worker.ordem_fila(agora)
+        ordem = await db.scalar(select(fila.c.ordem).where(fila.c.id == redacao.id))
+        if ordem is None:
+            # Fora da fila interativa: agendada para depois ou reservada ao processamento em lote
+            if redacao.agendado_para and redacao.agendado_para > agora:
+                return None, (redacao.agendado_para - agora).total_seconds() + tempo_proprio
+            return None, None
+
+        # Redações à frente, por plano (cada plano tem seu tempo médio)
+        a_frente = (await db.execute(
+            select(Usuario.plano, func.count())
+            .select_from(fila)
+            .join(Redacao, Redacao.id == fila.c.id)
+            .join(Usuario, Usuario.id == Redacao.usuario_id)
+            .where(fila.c.ordem < ordem)
+            .group_by(Usuario.plano)
+        )).all()
+
+        posicao = sum(quantidade for _, quantidade in a_frente) + 1
+        trabalho_a_frente = sum(quantidade * medias.get(p.value, self.tempo_padrao) for p, quantidade in a_frente)
+        eta = trabalho_a_frente / await self._capacidade(db) + tempo_proprio
+        return posicao, eta
+
+
+# Instância global do estimador (médias em cache por processo)
+estimador_fila = EstimadorFila(
+    janela=settings.TASK_ETA_WINDOW,
+    validade_cache=settings.TASK_ETA_CACHE_SECONDS,
+    tempo_padrao=settings.TASK_ETA_DEFAULT_SECONDS
+)
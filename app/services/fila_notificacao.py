@@ -0,0 +1,85 @@
+"""
+Notificação da fila de redações pendentes via Postgres LISTEN/NOTIFY
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def notificar_nova_redacao(db: AsyncSession, redacao_id: str):
+    """
+    Emite NOTIFY no canal da fila.
+    O Postgres só entrega a notificação no COMMIT da transação atual,
+    então o worker nunca acorda antes da redação estar visível.
+    """
+    await db.execute(
+        text("SELECT pg_notify(:canal, :payload)"),
+        {"canal": settings.WORKER_NOTIFY_CHANNEL, "payload": redacao_id}
+    )
+
+
+class OuvinteFila:
+    """Mantém uma conexão em LISTEN e sinaliza o worker quando chegam redações"""
+
+    def __init__(self, canal: str):
+        self.canal = canal
+        self.evento = asyncio.Event()
+        self._conn: Optional[asyncpg.Connection] = None
+
+    @property
+    def conectado(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def conectar(self):
+        """Abre a conexão de LISTEN (reconecta se ela tiver caído)"""
+        if self.conectado:
+            return
+        self.desconectar()
+        try:
+            # Conexão dedicada (fora do pool): LISTEN mantém a conexão ocupada
+            dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql")
+            conn = await asyncpg.connect(dsn.render_as_string(hide_password=False))
+            await conn.add_listener(self.canal, self._ao_receber)
+            conn.add_termination_listener(self._ao_terminar)
+            self._conn = conn
+            logger.info(f"[FILA] Escutando canal '{self.canal}'")
+        except Exception as e:
+            logger.warning(f"[FILA] LISTEN indisponivel, usando apenas polling: {str(e)}")
+
+    def desconectar(self):
+        """Fecha a conexão de LISTEN"""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            conn.terminate()
+        except Exception:
+            pass
+
+    def _ao_receber(self, conexao, pid, canal, payload):
+        """Callback do asyncpg para cada NOTIFY recebido"""
+        self.evento.set()
+
+    def _ao_terminar(self, conexao):
+        """Conexão caiu: acordar o worker e reconectar na próxima espera"""
+        logger.warning("[FILA] Conexao de LISTEN perdida")
+        self.evento.set()
+
+    async def aguardar(self, timeout: float):
+        """Bloqueia até uma notificação chegar ou o timeout (poll de segurança) expirar"""
+        try:
+            await asyncio.wait_for(self.evento.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.evento.clear()
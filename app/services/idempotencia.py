@@ -0,0 +1,182 @@
+"""
+Idempotência das submissões (header Idempotency-Key)
+Retentativas do cliente com a mesma chave recebem a resposta original em vez de criar outra redação
+"""
+
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import uuid
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.chave_idempotencia import ChaveIdempotencia
+
+logger = logging.getLogger(__name__)
+
+
+class GerenciadorIdempotencia:
+    """
+    Fluxo de uma submissão com chave:
+    iniciar() reserva a chave (ou devolve a resposta guardada), a rota executa e
+    chama concluir() com a resposta na mesma transação do que criou (um único commit);
+    em caso de erro, descartar() libera a chave para que a retentativa execute de novo.
+    """
+
+    def __init__(self, ttl_segundos: int, trava_segundos: int):
+        self.ttl_segundos = ttl_segundos
+        # Chave reservada há mais que isso sem resposta: a requisição original morreu
+        self.trava_segundos = trava_segundos
+
+    @staticmethod
+    def impressao(corpo: Any) -> str:
+        """Hash do corpo da requisição"""
+        payload = json.dumps(jsonable_encoder(corpo), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _filtro(usuario_id: str, rota: str, chave: str):
+        return (
+            ChaveIdempotencia.usuario_id == usuario_id,
+            ChaveIdempotencia.rota == rota,
+            ChaveIdempotencia.chave == chave
+        )
+
+    async def iniciar(
+        self,
+        db: AsyncSession,
+        usuario_id: str,
+        rota: str,
+        chave: str,
+        corpo: Any,
+        trava_segundos: Optional[int] = None
+    ) -> Optional[JSONResponse]:
+        """
+        Reserva a chave para esta requisição.
+        `trava_segundos` substitui o padrão em rotas que podem demorar mais (ex.: análise síncrona).
+
+        Returns:
+            None se a requisição deve ser executada; a resposta original se a chave já foi usada
+
+        Raises:
+            HTTPException 409: a requisição original ainda está em execução
+            HTTPException 422: a chave já foi usada com outro conteúdo
+        """
+        impressao = self.impressao(corpo)
+        agora = datetime.utcnow()
+        trava_segundos = trava_segundos or self.trava_segundos
+        valores = dict(
+            impressao=impressao,
+            status_code=None,
+            resposta=None,
+            data_criacao=agora,
+            expira_em=agora + timedelta(seconds=self.ttl_segundos)
+        )
+
+        reservada = await db.scalar(
+            insert(ChaveIdempotencia)
+            .values(id=str(uuid.uuid4()), usuario_id=usuario_id, rota=rota, chave=chave, **valores)
+            .on_conflict_do_nothing(index_elements=["usuario_id", "rota", "chave"])
+            .returning(ChaveIdempotencia.id)
+        )
+        if reservada is None:
+            # Chave expirada ou abandonada (processo morreu no meio): assume a reserva
+            reservada = await db.scalar(
+                update(ChaveIdempotencia)
+                .where(
+                    *self._filtro(usuario_id, rota, chave),
+                    or_(
+                        ChaveIdempotencia.expira_em <= agora,
+                        and_(
+                            # status_code, não resposta: o JSON None é gravado como 'null', não NULL
+                            ChaveIdempotencia.status_code.is_(None),
+                            ChaveIdempotencia.data_criacao < agora - timedelta(seconds=trava_segundos)
+                        )
+                    )
+                )
+                .values(**valores)
+                .returning(ChaveIdempotencia.id)
+            )
+        if reservada is not None:
+            await db.commit()
+            return None
+
+        registro = await db.scalar(select(ChaveIdempotencia).where(*self._filtro(usuario_id, rota, chave)))
+        await db.commit()
+
+        if registro is None or registro.resposta is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Uma requisição com esta Idempotency-Key ainda está em processamento",
+                headers={"Retry-After": "5"}
+            )
+        if registro.impressao != impressao:
+            raise HTTPException(
+                status_code=422,  # Unprocessable Content
+                detail="Idempotency-Key já utilizada com outro conteúdo"
+            )
+
+        logger.info(f"[IDEMPOTENCIA] Repetindo resposta de {rota} para a chave {chave}")
+        print(f"[IDEMPOTENCIA] Repetindo resposta de {rota} para a chave {chave}")
+        return JSONResponse(
+            status_code=registro.status_code,
+            content=registro.resposta["corpo"],
+            headers={**registro.resposta.get("headers", {}), "Idempotent-Replayed": "true"}
+        )
+
+    async def concluir(
+        self,
+        db: AsyncSession,
+        usuario_id: str,
+        rota: str,
+        chave: str,
+        status_code: int,
+        corpo: Any,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        """
+        Guarda a resposta da requisição para as retentativas.
+        Não faz commit: a resposta é gravada junto com o que a requisição criou, para que
+        uma queda entre os dois não deixe a chave reservada e a retentativa duplique o trabalho.
+        """
+        await db.execute(
+            update(ChaveIdempotencia)
+            .where(*self._filtro(usuario_id, rota, chave))
+            .values(
+                status_code=status_code,
+                resposta={"corpo": jsonable_encoder(corpo), "headers": headers or {}}
+            )
+        )
+
+    async def descartar(self, db: AsyncSession, usuario_id: str, rota: str, chave: str):
+        """Libera a chave após um erro (a retentativa executa de novo)"""
+        try:
+            await db.rollback()
+            await db.execute(delete(ChaveIdempotencia).where(*self._filtro(usuario_id, rota, chave)))
+            await db.commit()
+        except Exception as e:
+            # Sem conseguir apagar, a chave expira sozinha após trava_segundos
+            logger.warning(f"[IDEMPOTENCIA] Erro ao liberar a chave {chave}: {str(e)}")
+
+    async def expurgar_expiradas(self, db: AsyncSession) -> int:
+        """Remove as chaves expiradas"""
+        removidas = (await db.execute(
+            delete(ChaveIdempotencia).where(ChaveIdempotencia.expira_em <= datetime.utcnow())
+        )).rowcount
+        await db.commit()
+        return removidas
+
+
+# Instância global do gerenciador
+gerenciador_idempotencia = GerenciadorIdempotencia(
+    ttl_segundos=settings.IDEMPOTENCY_TTL_SECONDS,
+    trava_segundos=settings.IDEMPOTENCY_LOCK_SECONDS
+)
@@ -0,0 +1,160 @@
+"""
+Leitura incremental de JSON gerado em streaming pelo LLM
+Entrega cada elemento de um array assim que ele fecha, antes da resposta terminar
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Caminho de chaves até um array no JSON (ex.: ("erros",) ou ("gramatical", "erros"))
+Caminho = Tuple[str, ...]
+
+# Recebe (caminho do array, índice do elemento, elemento)
+CallbackItem = Callable[[Caminho, int, Any], Awaitable[None]]
+
+_ESPACOS = " \t\r\n"
+
+
+class _Nivel:
+    """Um objeto ou array aberto durante a leitura"""
+
+    __slots__ = ("tipo", "chave", "espera_chave", "alvo", "inicio_item", "indice")
+
+    def __init__(self, tipo: str, alvo: Optional[Caminho] = None):
+        self.tipo = tipo
+        self.chave: Optional[str] = None
+        self.espera_chave = tipo == "{"
+        # Caminho do array acompanhado (None = array/objeto que não interessa)
+        self.alvo = alvo
+        self.inicio_item: Optional[int] = None
+        self.indice = 0
+
+
+class ParserJSONIncremental:
+    """
+    Lê um objeto JSON em fragmentos e devolve os elementos completos dos arrays
+    indicados por `caminhos`. Só acompanha arrays cujos ancestrais são todos objetos.
+    """
+
+    def __init__(self, caminhos: Sequence[Caminho]):
+        self.caminhos = {tuple(caminho) for caminho in caminhos}
+        self.texto = ""
+        self._posicao = 0
+        self._pilha: List[_Nivel] = []
+        self._em_string = False
+        self._escape = False
+        self._inicio_string = 0
+
+    def _caminho_atual(self) -> Optional[Caminho]:
+        if not self._pilha or any(nivel.tipo != "{" for nivel in self._pilha):
+            return None
+        return tuple(nivel.chave for nivel in self._pilha)
+
+    def _array_alvo(self) -> Optional[_Nivel]:
+        if self._pilha and self._pilha[-1].tipo == "[" and self._pilha[-1].alvo:
+            return self._pilha[-1]
+        return None
+
+    def _fechar_item(self, array: _Nivel, fim: int) -> Iterator[Tuple[Caminho, int, Any]]:
+        bruto = self.texto[array.inicio_item:fim].strip()
+        array.inicio_item = None
+        indice = array.indice
+        array.indice += 1
+        try:
+            yield array.alvo, indice, json.loads(bruto)
+        except ValueError:
+            logger.debug(f"[LLM] Elemento invalido no stream em {array.alvo}: {bruto[:80]}")
+
+    def alimentar(self, fragmento: str) -> Iterator[Tuple[Caminho, int, Any]]:
+        """
+        Acrescenta um fragmento da resposta.
+
+        Yields:
+            (caminho do array, índice, elemento) para cada elemento concluído
+        """
+        self.texto += fragmento
+        texto = self.texto
+
+        for i in range(self._posicao, len(texto)):
+            c = texto[i]
+
+            if self._em_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._em_string = False
+                    topo = self._pilha[-1] if self._pilha else None
+                    if topo is not None and topo.tipo == "{" and topo.espera_chave:
+                        topo.chave = json.loads(texto[self._inicio_string:i + 1])
+                        topo.espera_chave = False
+                continue
+
+            if c in _ESPACOS:
+                continue
+
+            array = self._array_alvo()
+            if c in "]," and array is not None and array.inicio_item is not None:
+                # Fim de um elemento escalar
+                yield from self._fechar_item(array, i)
+            elif c not in "]," and array is not None and array.inicio_item is None:
+                array.inicio_item = i
+
+            if c == '"':
+                self._em_string = True
+                self._inicio_string = i
+            elif c == "{":
+                self._pilha.append(_Nivel("{"))
+            elif c == "[":
+                caminho = self._caminho_atual()
+                self._pilha.append(_Nivel("[", caminho if caminho in self.caminhos else None))
+            elif c in "}]":
+                if self._pilha:
+                    self._pilha.pop()
+                array = self._array_alvo()
+                if array is not None and array.inicio_item is not None:
+                    # Fim de um elemento objeto/array
+                    yield from self._fechar_item(array, i + 1)
+            elif c == ",":
+                if self._pilha and self._pilha[-1].tipo == "{":
+                    self._pilha[-1].espera_chave = True
+
+        self._posicao = len(texto)
+
+
+def itens_do_json(dados: Any, caminhos: Sequence[Caminho]) -> Iterator[Tuple[Caminho, int, Any]]:
+    """Os mesmos itens do parser, a partir de um JSON já completo (ex.: resposta do cache)"""
+    for caminho in caminhos:
+        valor = dados
+        for chave in caminho:
+            valor = valor.get(chave) if isinstance(valor, dict) else None
+        if isinstance(valor, list):
+            for indice, item in enumerate(valor):
+                yield tuple(caminho), indice, item
+
+
+class LeitorItensStream:
+    """
+    Liga o texto recebido em streaming ao callback de itens.
+    Cada tentativa de chamada reinicia a leitura (os índices voltam a 0).
+    """
+
+    def __init__(self, caminhos: Sequence[Caminho], ao_receber_item: CallbackItem):
+        self.caminhos = [tuple(caminho) for caminho in caminhos]
+        self.ao_receber_item = ao_receber_item
+        self.parser = ParserJSONIncremental(self.caminhos)
+
+    def reiniciar(self):
+        self.parser = ParserJSONIncremental(self.caminhos)
+
+    async def receber(self, fragmento: str):
+        for caminho, indice, item in self.parser.alimentar(fragmento):
+            await self.ao_receber_item(caminho, indice, item)
+
+    async def receber_completo(self, dados: Dict[str, Any]):
+        for caminho, indice, item in itens_do_json(dados, self.caminhos):
+            await self.ao_receber_item(caminho, indice, item)
@@ -0,0 +1,200 @@
+"""
+Cache de respostas do LLM endereçado por conteúdo
+Dois níveis: LRU em memória (por processo) + SQLite em disco (compartilhado entre workers)
+"""
+
+from typing import Optional, Dict, Any
+from collections import OrderedDict
+from contextlib import closing
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """Cache de respostas do LLM com expiração (TTL) e despejo por tamanho"""
+
+    def __init__(
+        self,
+        caminho: str,
+        ttl_segundos: int,
+        max_entradas_memoria: int,
+        max_bytes_disco: int
+    ):
+        self.caminho = caminho
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas_memoria = max_entradas_memoria
+        self.max_bytes_disco = max_bytes_disco
+
+        # chave -> (expira_em, valor serializado)
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disco_ok = self._init_disco()
+
+        # Contadores de uso
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+    @staticmethod
+    def gerar_chave(
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        json_mode: bool
+    ) -> str:
+        """Hash do conteúdo que determina a resposta do LLM"""
+        payload = json.dumps(
+            [model, system_prompt, user_prompt, temperature, json_mode],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.caminho, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_disco(self) -> bool:
+        """Cria a tabela do cache em disco (desativa o nível de disco se falhar)"""
+        try:
+            diretorio = os.path.dirname(self.caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            with closing(self._conectar()) as conn, conn:
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS llm_cache (
+                        chave TEXT PRIMARY KEY,
+                        valor TEXT NOT NULL,
+                        tamanho INTEGER NOT NULL,
+                        expira_em REAL NOT NULL,
+                        acessado_em REAL NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_llm_cache_acessado_em ON llm_cache(acessado_em)"
+                )
+            return True
+        except Exception as e:
+            logger.warning(f"[LLM_CACHE] Cache em disco desativado: {str(e)}")
+            return False
+
+    # === Nível 1: memória ===
+
+    def _get_memoria(self, chave: str) -> Optional[str]:
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.time():
+                del self._memoria[chave]
+                return None
+            self._memoria.move_to_end(chave)
+            return valor
+
+    def _set_memoria(self, chave: str, valor: str, expira_em: float):
+        with self._lock:
+            self._memoria[chave] = (expira_em, valor)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_entradas_memoria:
+                self._memoria.popitem(last=False)
+
+    # === Nível 2: disco ===
+
+    def _get_disco(self, chave: str) -> Optional[tuple]:
+        agora = time.time()
+        with closing(self._conectar()) as conn, conn:
+            row = conn.execute(
+                "SELECT valor, expira_em FROM llm_cache WHERE chave = ?", (chave,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < agora:
+                conn.execute("DELETE FROM llm_cache WHERE chave = ?", (chave,))
+                return None
+            conn.execute(
+                "UPDATE llm_cache SET acessado_em = ? WHERE chave = ?", (agora, chave)
+            )
+            return row
+
+    def _set_disco(self, chave: str, valor: str, expira_em: float):
+        agora = time.time()
+        with closing(self._conectar()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (chave, valor, tamanho, expira_em, acessado_em) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chave, valor, len(valor), expira_em, agora)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE expira_em < ?", (agora,))
+
+            # Despejo por tamanho: remove as entradas menos acessadas recentemente
+            total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM llm_cache").fetchone()[0]
+            if total > self.max_bytes_disco:
+                excesso = total - self.max_bytes_disco
+                liberado = 0
+                removidas = []
+                for chave_antiga, tamanho in conn.execute(
+                    "SELECT chave, tamanho FROM llm_cache ORDER BY acessado_em ASC"
+                ):
+                    removidas.append((chave_antiga,))
+                    liberado += tamanho
+                    if liberado >= excesso:
+                        break
+                conn.executemany("DELETE FROM llm_cache WHERE chave = ?", removidas)
+
+    # === API pública ===
+
+    async def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Retorna a resposta em cache (ou None)"""
+        valor = self._get_memoria(chave)
+        if valor is not None:
+            self.hits_memoria += 1
+            return json.loads(valor)
+
+        if self._disco_ok:
+            try:
+                row = await asyncio.to_thread(self._get_disco, chave)
+            except Exception as e:
+                logger.warning(f"[LLM_CACHE] Erro ao ler cache em disco: {str(e)}")
+                row = None
+            if row is not None:
+                valor, expira_em = row
+                self._set_memoria(chave, valor, expira_em)
+                self.hits_disco += 1
+                return json.loads(valor)
+
+        self.misses += 1
+        return None
+
+    async def set(self, chave: str, resposta: Dict[str, Any]):
+        """Armazena a resposta nos dois níveis"""
+        valor = json.dumps(resposta, ensure_ascii=False)
+        expira_em = time.time() + self.ttl_segundos
+        self._set_memoria(chave, valor, expira_em)
+
+        if self._disco_ok:
+            try:
+                await asyncio.to_thread(self._set_disco, chave, valor, expira_em)
+            except Exception as e:
+                logger.warning(f"[LLM_CACHE] Erro ao gravar cache em disco: {str(e)}")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Contadores de hit/miss do processo atual"""
+        hits = self.hits_memoria + self.hits_disco
+        total = hits + self.misses
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "taxa_acerto": round(hits / total, 4) if total else 0.0,
+            "entradas_memoria": len(self._memoria),
+        }
@@ -0,0 +1,165 @@
+"""
+Pool de chaves de API do provider
+Cada chamada vai para a chave com mais folga no rate limit (headers x-ratelimit-* + contadores locais)
+"""
+
+from typing import Optional, List, Dict, Any, Tuple
+import hashlib
+import logging
+import re
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_UNIDADES_DURACAO = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duracao(valor: Optional[str]) -> Optional[float]:
+    """Converte durações da OpenAI ("1s", "6m0s", "20ms", "1h2m3.5s") em segundos"""
+    if not valor:
+        return None
+    partes = re.findall(r"([\d.]+)(ms|h|m|s)", valor)
+    if not partes:
+        return None
+    return sum(float(numero) * _UNIDADES_DURACAO[unidade] for numero, unidade in partes)
+
+
+def chaves_openai_configuradas() -> List[Tuple[str, Optional[str]]]:
+    """Lista (api_key, organização) a partir de OPENAI_API_KEYS ou OPENAI_API_KEY"""
+    entradas = settings.OPENAI_API_KEYS or [settings.OPENAI_API_KEY]
+    chaves = []
+    for entrada in entradas:
+        api_key, _, organizacao = entrada.partition("|")
+        chaves.append((api_key.strip(), organizacao.strip() or None))
+    return chaves
+
+
+def _int_header(headers, nome: str) -> Optional[int]:
+    try:
+        valor = headers.get(nome)
+        return int(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ChaveAPI:
+    """Uma chave (ou organização) do provider com o último retrato do seu rate limit"""
+
+    def __init__(self, nome: str, client: Any):
+        self.nome = nome
+        self.client = client
+
+        # Último estado informado pelos headers (None = ainda desconhecido)
+        self.limite_requisicoes: Optional[int] = None
+        self.limite_tokens: Optional[int] = None
+        self.restante_requisicoes: Optional[int] = None
+        self.restante_tokens: Optional[int] = None
+        self.reset_requisicoes_em = 0.0
+        self.reset_tokens_em = 0.0
+
+        # Contadores locais desde o último header (chamadas em andamento)
+        self.requisicoes_em_voo = 0
+        self.tokens_em_voo = 0
+
+        self.cooldown_ate = 0.0
+        self.total_chamadas = 0
+        self.total_429 = 0
+
+    def em_cooldown(self, agora: float) -> bool:
+        return agora < self.cooldown_ate
+
+    def folga(self, agora: float) -> float:
+        """
+        Fração livre do rate limit (0 a 1), descontando o que está em andamento.
+        Sem headers, ou após o reset informado, a chave é considerada cheia.
+        """
+        fracoes = []
+        if self.limite_requisicoes and self.restante_requisicoes is not None and agora < self.reset_requisicoes_em:
+            fracoes.append((self.restante_requisicoes - self.requisicoes_em_voo) / self.limite_requisicoes)
+        else:
+            fracoes.append(1.0 - self.requisicoes_em_voo / max(self.limite_requisicoes or 1000, 1))
+        if self.limite_tokens and self.restante_tokens is not None and agora < self.reset_tokens_em:
+            fracoes.append((self.restante_tokens - self.tokens_em_voo) / self.limite_tokens)
+        else:
+            fracoes.append(1.0 - self.tokens_em_voo / max(self.limite_tokens or 100000, 1))
+        return min(fracoes)
+
+    def iniciar(self, tokens: int):
+        self.requisicoes_em_voo += 1
+        self.tokens_em_voo += tokens
+        self.total_chamadas += 1
+
+    def finalizar(self, tokens: int):
+        self.requisicoes_em_voo = max(0, self.requisicoes_em_voo - 1)
+        self.tokens_em_voo = max(0, self.tokens_em_voo - tokens)
+
+    def atualizar_limites(self, headers):
+        """Registra o estado do rate limit informado na resposta"""
+        if not headers:
+            return
+        agora = time.monotonic()
+        self.limite_requisicoes = _int_header(headers, "x-ratelimit-limit-requests") or self.limite_requisicoes
+        self.limite_tokens = _int_header(headers, "x-ratelimit-limit-tokens") or self.limite_tokens
+
+        restante = _int_header(headers, "x-ratelimit-remaining-requests")
+        if restante is not None:
+            self.restante_requisicoes = restante
+            self.reset_requisicoes_em = agora + (parse_duracao(headers.get("x-ratelimit-reset-requests")) or 60.0)
+        restante = _int_header(headers, "x-ratelimit-remaining-tokens")
+        if restante is not None:
+            self.restante_tokens = restante
+            self.reset_tokens_em = agora + (parse_duracao(headers.get("x-ratelimit-reset-tokens")) or 60.0)
+
+    def estatisticas(self, agora: float) -> Dict[str, Any]:
+        return {
+            "folga": round(self.folga(agora), 3),
+            "em_cooldown": self.em_cooldown(agora),
+            "chamadas": self.total_chamadas,
+            "erros_429": self.total_429,
+        }
+
+
+class PoolChaves:
+    """Seleciona a chave com mais folga e controla o cooldown por chave após 429"""
+
+    def __init__(self, chaves: List[ChaveAPI], cooldown_padrao: float):
+        self.chaves = chaves
+        self.cooldown_padrao = cooldown_padrao
+
+    @staticmethod
+    def nome_chave(api_key: str, indice: int) -> str:
+        """Identificador estável e não sensível da chave (usado em logs e no rate limiter)"""
+        sufixo = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+        return f"k{indice}-{sufixo}"
+
+    def escolher(self) -> Optional[ChaveAPI]:
+        """Chave fora de cooldown com maior folga (None se todas estão em cooldown)"""
+        agora = time.monotonic()
+        disponiveis = [c for c in self.chaves if not c.em_cooldown(agora)]
+        if not disponiveis:
+            return None
+        return max(disponiveis, key=lambda c: c.folga(agora))
+
+    def registrar_limite(self, chave: ChaveAPI, retry_after: Optional[float], headers=None):
+        """Coloca a chave em cooldown após um 429"""
+        chave.atualizar_limites(headers)
+        chave.total_429 += 1
+        espera = retry_after
+        if espera is None and headers:
+            espera = parse_duracao(headers.get("x-ratelimit-reset-requests")) or parse_duracao(
+                headers.get("x-ratelimit-reset-tokens")
+            )
+        espera = espera if espera is not None else self.cooldown_padrao
+        chave.cooldown_ate = time.monotonic() + espera
+        logger.warning(f"[LLM] Chave {chave.nome} em cooldown por {espera:.1f}s (429)")
+
+    def segundos_ate_disponivel(self) -> float:
+        """Quanto falta para a primeira chave sair do cooldown"""
+        agora = time.monotonic()
+        return max(0.0, min(c.cooldown_ate for c in self.chaves) - agora)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        agora = time.monotonic()
+        return {c.nome: c.estatisticas(agora) for c in self.chaves}
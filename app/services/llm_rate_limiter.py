@@ -0,0 +1,148 @@
+"""
+Limitador de taxa das chamadas ao LLM (token bucket de requisições/min e tokens/min)
+O estado fica no Postgres para ser compartilhado entre a API e todas as réplicas do worker
+"""
+
+from typing import Dict, Any, Tuple
+import asyncio
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal
+from app.models.balde_taxa import BaldeTaxa
+
+logger = logging.getLogger(__name__)
+
+# Aproximação de caracteres por token para português (sem depender de tokenizer)
+CARACTERES_POR_TOKEN = 3.5
+
+
+def estimar_tokens(*textos: str) -> int:
+    """Estimativa grosseira de tokens de entrada a partir do tamanho dos textos"""
+    return int(sum(len(t) for t in textos) / CARACTERES_POR_TOKEN) + 1
+
+
+class LimitadorTaxa:
+    """
+    Dois token buckets por chave (ex.: provider:modelo): um de requisições e outro de tokens.
+    Os baldes reabastecem continuamente até a capacidade de um minuto.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+
+        # Contadores de uso
+        self.esperas = 0
+        self.segundos_esperando = 0.0
+
+    async def _reabastecer(self, db: AsyncSession, chave: str) -> Tuple[float, float, float]:
+        """
+        Trava o balde (até o commit do chamador) e aplica o reabastecimento desde a última atualização.
+
+        Returns:
+            (requisicoes, tokens, agora) — agora pelo relógio do Postgres, comum a todos os processos
+        """
+        await db.execute(
+            insert(BaldeTaxa)
+            .values(
+                chave=chave,
+                requisicoes=float(self.rpm),
+                tokens=float(self.tpm),
+                atualizado_em=func.extract("epoch", func.clock_timestamp())
+            )
+            .on_conflict_do_nothing(index_elements=["chave"])
+        )
+        requisicoes, tokens, atualizado_em = (await db.execute(
+            select(BaldeTaxa.requisicoes, BaldeTaxa.tokens, BaldeTaxa.atualizado_em)
+            .where(BaldeTaxa.chave == chave)
+            .with_for_update()
+        )).one()
+        # Relógio lido só com o lock em mãos, senão o reabastecimento é contado duas vezes
+        agora = float(await db.scalar(select(func.extract("epoch", func.clock_timestamp()))))
+
+        decorrido = max(0.0, agora - atualizado_em)
+        requisicoes = min(float(self.rpm), requisicoes + decorrido * self.rpm / 60)
+        tokens = min(float(self.tpm), tokens + decorrido * self.tpm / 60)
+        return requisicoes, tokens, agora
+
+    async def _salvar(self, db: AsyncSession, chave: str, requisicoes: float, tokens: float, agora: float):
+        await db.execute(
+            update(BaldeTaxa)
+            .where(BaldeTaxa.chave == chave)
+            .values(requisicoes=requisicoes, tokens=tokens, atualizado_em=agora)
+        )
+
+    async def _tentar_consumir(self, chave: str, tokens_necessarios: int) -> float:
+        """
+        Consome 1 requisição e os tokens se houver saldo.
+        Retorna 0 em caso de sucesso ou quantos segundos esperar até haver saldo.
+        """
+        # Uma chamada maior que a capacidade do balde nunca passaria: limita ao TPM
+        tokens_necessarios = min(tokens_necessarios, self.tpm)
+        async with SessionLocal() as db:
+            # A trava da linha serializa os processos que disputam o mesmo balde
+            requisicoes, tokens, agora = await self._reabastecer(db, chave)
+            if requisicoes >= 1 and tokens >= tokens_necessarios:
+                await self._salvar(db, chave, requisicoes - 1, tokens - tokens_necessarios, agora)
+                await db.commit()
+                return 0.0
+            await db.commit()
+
+        espera_requisicoes = max(0.0, 1 - requisicoes) * 60 / self.rpm
+        espera_tokens = max(0.0, tokens_necessarios - tokens) * 60 / self.tpm
+        return max(espera_requisicoes, espera_tokens, 0.05)
+
+    async def _ajustar(self, chave: str, diferenca: int):
+        """Devolve (diferenca < 0) ou cobra (diferenca > 0) tokens após a resposta"""
+        async with SessionLocal() as db:
+            requisicoes, tokens, agora = await self._reabastecer(db, chave)
+            # Saldo negativo é permitido (dívida paga pelo reabastecimento), limitado a um minuto
+            tokens = max(-float(self.tpm), min(float(self.tpm), tokens - diferenca))
+            await self._salvar(db, chave, requisicoes, tokens, agora)
+            await db.commit()
+
+    # === API pública ===
+
+    async def adquirir(self, chave: str, tokens_estimados: int):
+        """Bloqueia até o balde da chave ter saldo para a chamada"""
+        while True:
+            try:
+                espera = await self._tentar_consumir(chave, tokens_estimados)
+            except Exception as e:
+                # Falha no banco não pode derrubar a análise: segue sem limitar
+                logger.warning(f"[RATE_LIMIT] Erro ao consultar limitador: {str(e)}")
+                return
+            if espera <= 0:
+                return
+            self.esperas += 1
+            self.segundos_esperando += espera
+            await asyncio.sleep(espera)
+
+    async def reconciliar(self, chave: str, tokens_estimados: int, tokens_reais: int):
+        """Corrige o balde com o consumo real informado pelo provider (usage.total_tokens)"""
+        if tokens_reais is None:
+            return
+        diferenca = tokens_reais - min(tokens_estimados, self.tpm)
+        if diferenca == 0:
+            return
+        try:
+            await self._ajustar(chave, diferenca)
+        except Exception as e:
+            logger.warning(f"[RATE_LIMIT] Erro ao reconciliar tokens: {str(e)}")
+
+    async def devolver(self, chave: str, tokens_estimados: int):
+        """Devolve os tokens de uma chamada recusada pelo provider (ex.: 429), que não consumiu nada"""
+        await self.reconciliar(chave, tokens_estimados, 0)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Contadores de espera do processo atual"""
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "esperas": self.esperas,
+            "segundos_esperando": round(self.segundos_esperando, 2),
+        }
@@ -0,0 +1,157 @@
+"""
+Resiliência das chamadas ao LLM
+Classificação de erros transitórios, backoff exponencial com jitter e circuit breaker por provider
+"""
+
+from typing import Optional
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Status HTTP que indicam falha transitória do provider
+STATUS_RETENTAVEIS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class ErroLLM(Exception):
+    """Erro de chamada ao LLM com a informação necessária para decidir o retry"""
+
+    def __init__(
+        self,
+        mensagem: str,
+        retentavel: bool = False,
+        retry_after: Optional[float] = None,
+        status: Optional[int] = None,
+        headers=None,
+        truncada: bool = False
+    ):
+        super().__init__(mensagem)
+        self.retentavel = retentavel
+        self.retry_after = retry_after
+        self.status = status
+        self.headers = headers
+        # Resposta cortada por max_tokens (JSON incompleto)
+        self.truncada = truncada
+
+
+def _ler_retry_after(headers) -> Optional[float]:
+    """Extrai o tempo de espera sugerido pelo provider (retry-after-ms / retry-after)"""
+    if not headers:
+        return None
+    try:
+        valor_ms = headers.get("retry-after-ms")
+        if valor_ms is not None:
+            return float(valor_ms) / 1000
+        valor = headers.get("retry-after")
+        if valor is not None:
+            return float(valor)
+    except (TypeError, ValueError):
+        # Formato de data HTTP não é usado pelos providers atuais
+        pass
+    return None
+
+
+def classificar_erro_openai(erro: Exception) -> ErroLLM:
+    """Converte exceções do SDK da OpenAI em ErroLLM"""
+    import openai
+
+    mensagem = f"Erro ao chamar OpenAI: {str(erro)}"
+    if isinstance(erro, (openai.APITimeoutError, openai.APIConnectionError)):
+        return ErroLLM(mensagem, retentavel=True)
+    if isinstance(erro, openai.APIStatusError):
+        return ErroLLM(
+            mensagem,
+            retentavel=erro.status_code in STATUS_RETENTAVEIS,
+            retry_after=_ler_retry_after(erro.response.headers),
+            status=erro.status_code,
+            headers=erro.response.headers
+        )
+    return ErroLLM(mensagem)
+
+
+def classificar_erro_gemini(erro: Exception) -> ErroLLM:
+    """Converte exceções do google-api-core em ErroLLM"""
+    mensagem = f"Erro ao chamar Gemini: {str(erro)}"
+    status = getattr(erro, "code", None)
+    if isinstance(status, int):
+        return ErroLLM(mensagem, retentavel=status in STATUS_RETENTAVEIS, status=status)
+    if isinstance(erro, TimeoutError):
+        return ErroLLM(mensagem, retentavel=True)
+    return ErroLLM(mensagem)
+
+
+def calcular_backoff(
+    tentativa: int,
+    base: float,
+    maximo: float,
+    retry_after: Optional[float] = None
+) -> float:
+    """
+    Backoff exponencial com jitter completo (evita que os workers retentem em sincronia).
+    Se o provider informou Retry-After, nunca espera menos que isso.
+    """
+    espera = random.uniform(0, min(maximo, base * (2 ** tentativa)))
+    if retry_after is not None:
+        espera = max(espera, retry_after)
+    return espera
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um provider/modelo.
+    fechado: chamadas liberadas | aberto: chamadas bloqueadas até o tempo de abertura expirar |
+    meio_aberto: uma chamada de teste decide se fecha ou reabre
+    """
+
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+    def __init__(self, nome: str, limite_falhas: int, tempo_abertura: float):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_abertura = tempo_abertura
+
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self.aberto_em = 0.0
+        self._teste_em_andamento = False
+
+    def permite(self) -> bool:
+        """Indica se uma chamada pode ser feita agora"""
+        if self.estado == self.FECHADO:
+            return True
+        if self.estado == self.ABERTO:
+            if time.monotonic() - self.aberto_em < self.tempo_abertura:
+                return False
+            self.estado = self.MEIO_ABERTO
+            self._teste_em_andamento = False
+        # Meio aberto: só uma chamada de teste por vez
+        if self._teste_em_andamento:
+            return False
+        self._teste_em_andamento = True
+        return True
+
+    def registrar_sucesso(self):
+        if self.estado != self.FECHADO:
+            logger.info(f"[LLM] Circuit breaker '{self.nome}' fechado")
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self._teste_em_andamento = False
+
+    def registrar_falha(self):
+        self.falhas_consecutivas += 1
+        self._teste_em_andamento = False
+        if self.estado == self.MEIO_ABERTO or self.falhas_consecutivas >= self.limite_falhas:
+            if self.estado != self.ABERTO:
+                logger.warning(
+                    f"[LLM] Circuit breaker '{self.nome}' aberto "
+                    f"({self.falhas_consecutivas} falhas consecutivas)"
+                )
+            self.estado = self.ABERTO
+            self.aberto_em = time.monotonic()
+
+    def liberar_teste(self):
+        """Devolve a vaga de teste quando a chamada terminou sem sucesso nem falha transitória"""
+        self._teste_em_andamento = False
@@ -2,9 +2,24 @@
 Serviço de integração com LLMs (OpenAI, Gemini)
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+import asyncio
 import json
+import logging
 from app.config import settings
+from app.services.llm_cache import LLMCache
+from app.services.json_incremental import Caminho, CallbackItem, LeitorItensStream
+from app.services.llm_rate_limiter import LimitadorTaxa, estimar_tokens
+from app.services.llm_key_pool import ChaveAPI, PoolChaves, chaves_openai_configuradas
+from app.services.llm_resilience import (
+    CircuitBreaker,
+    ErroLLM,
+    calcular_backoff,
+    classificar_erro_gemini,
+    classificar_erro_openai,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class LLMService:
@@ -16,26 +31,98 @@ class LLMService:
         self.temperature = settings.LLM_TEMPERATURE
         self.max_tokens = settings.LLM_MAX_TOKENS
         
-        # Inicializar cliente baseado no provider
-        if self.provider == "openai":
-            self._init_openai()
-        elif self.provider == "gemini":
-            self._init_gemini()
+        # Cache de respostas (chaveado pelo conteúdo da chamada)
+        self.cache = None
+        if settings.LLM_CACHE_ENABLED:
+            self.cache = LLMCache(
+                caminho=settings.LLM_CACHE_PATH,
+                ttl_segundos=settings.LLM_CACHE_TTL_SECONDS,
+                max_entradas_memoria=settings.LLM_CACHE_MEMORY_ENTRIES,
+                max_bytes_disco=settings.LLM_CACHE_MAX_MB * 1024 * 1024
+            )
+        
+        # Limite de RPM/TPM do provider (cada rota tem seu balde)
+        self.limitador = None
+        if settings.LLM_RATE_LIMIT_ENABLED:
+            self.limitador = LimitadorTaxa(
+                rpm=settings.LLM_RATE_LIMIT_RPM,
+                tpm=settings.LLM_RATE_LIMIT_TPM
+            )
+        
+        # Rotas em ordem de preferência: principal e, opcionalmente, failover
+        self.rotas: List[Tuple[str, str]] = [(self.provider, self.model)]
+        if settings.LLM_FALLBACK_MODEL:
+            self.rotas.append((
+                settings.LLM_FALLBACK_PROVIDER or self.provider,
+                settings.LLM_FALLBACK_MODEL
+            ))
+        
+        # Um circuit breaker e um pool de chaves por provider/modelo (criados sob demanda)
+        self.circuitos: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.pools: Dict[Tuple[str, str], PoolChaves] = {}
+        self._clientes_openai: Optional[List[Tuple[str, Any]]] = None
+        for rota in self.rotas:
+            self._circuito(rota)
+            self._pool(rota)
+    
+    def _circuito(self, rota: Tuple[str, str]) -> CircuitBreaker:
+        """Circuit breaker da rota"""
+        if rota not in self.circuitos:
+            self.circuitos[rota] = CircuitBreaker(
+                nome=f"{rota[0]}:{rota[1]}",
+                limite_falhas=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                tempo_abertura=settings.LLM_CIRCUIT_OPEN_SECONDS
+            )
+        return self.circuitos[rota]
+    
+    def _pool(self, rota: Tuple[str, str]) -> Optional[PoolChaves]:
+        """Pool de chaves da rota (OpenAI aceita várias chaves/organizações)"""
+        if rota in self.pools:
+            return self.pools[rota]
+        provider, model = rota
+        if provider == "openai":
+            if self._clientes_openai is None:
+                self._clientes_openai = [
+                    (PoolChaves.nome_chave(api_key, indice), self._init_openai(api_key, organizacao))
+                    for indice, (api_key, organizacao) in enumerate(chaves_openai_configuradas(), start=1)
+                ]
+            # Estado de rate limit é por modelo: cada rota tem suas ChaveAPI sobre os mesmos clientes
+            chaves = [ChaveAPI(nome, client) for nome, client in self._clientes_openai]
+        elif provider == "gemini":
+            chaves = [ChaveAPI("gemini", self._init_gemini(model))]
+        else:
+            return None
+        self.pools[rota] = PoolChaves(chaves, settings.LLM_KEY_COOLDOWN_SECONDS)
+        return self.pools[rota]
+    
+    def _rotas_para(self, model: Optional[str]) -> List[Tuple[str, str]]:
+        """Rotas da chamada: o modelo pedido (ou o padrão) no provider principal, depois o failover"""
+        if not model or model == self.model:
+            return self.rotas
+        principal = (self.provider, model)
+        return [principal] + [rota for rota in self.rotas[1:] if rota != principal]
     
-    def _init_openai(self):
+    def _init_openai(self, api_key: str, organizacao: Optional[str] = None):
         """Inicializa cliente OpenAI"""
         try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            from openai import AsyncOpenAI
+            # Retentativas ficam a cargo do LLMService (backoff + circuit breaker)
+            return AsyncOpenAI(
+                api_key=api_key,
+                organization=organizacao,
+                base_url=settings.OPENAI_BASE_URL or None,
+                timeout=settings.LLM_TIMEOUT_SECONDS,
+                max_retries=0
+            )
         except ImportError:
             raise Exception("OpenAI não instalado. Execute: pip install openai")
     
-    def _init_gemini(self):
+    def _init_gemini(self, model: str):
         """Inicializa cliente Gemini"""
         try:
             import google.generativeai as genai
             genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.client = genai.GenerativeModel(self.model)
+            return genai.GenerativeModel(model)
         except ImportError:
             raise Exception("Google Generative AI não instalado. Execute: pip install google-generativeai")
     
@@ -45,7 +132,10 @@ class LLMService:
         user_prompt: str,
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-        json_mode: bool = False
+        json_mode: bool = False,
+        model: Optional[str] = None,
+        caminhos_stream: Sequence[Caminho] = (),
+        ao_receber_item: Optional[CallbackItem] = None
     ) -> Dict[str, Any]:
         """
         Gera resposta do LLM
@@ -56,96 +146,330 @@ class LLMService:
             temperature: Temperatura (0-1)
             max_tokens: Máximo de tokens
             json_mode: Se deve retornar JSON estruturado
+            model: Modelo do provider principal (None = LLM_MODEL)
+            caminhos_stream: Arrays do JSON cujos elementos são repassados durante a geração
+            ao_receber_item: Chamado com (caminho, índice, elemento) de cada elemento concluído.
+                Com ele a resposta é gerada em streaming; numa retentativa os índices recomeçam em 0.
             
         Returns:
             Dict com resposta e metadados
         """
-        temp = temperature or self.temperature
+        temp = temperature if temperature is not None else self.temperature
         tokens = max_tokens or self.max_tokens
+        rotas = self._rotas_para(model)
         
-        if self.provider == "openai":
-            return await self._generate_openai(
-                system_prompt, user_prompt, temp, tokens, json_mode
-            )
-        elif self.provider == "gemini":
-            return await self._generate_gemini(
-                system_prompt, user_prompt, temp, tokens, json_mode
+        leitor = None
+        if json_mode and caminhos_stream and ao_receber_item:
+            leitor = LeitorItensStream(caminhos_stream, ao_receber_item)
+        
+        chave_cache = None
+        if self.cache:
+            chave_cache = LLMCache.gerar_chave(
+                rotas[0][1], system_prompt, user_prompt, temp, json_mode
             )
+            resposta = await self.cache.get(chave_cache)
+            if resposta is not None:
+                if leitor:
+                    await leitor.receber_completo(resposta["content"])
+                return resposta
+        
+        resposta, rota = await self._generate_com_failover(
+            rotas, system_prompt, user_prompt, temp, tokens, json_mode, leitor
+        )
+        
+        # Respostas do modelo de failover não entram no cache do modelo principal
+        if rota != rotas[0]:
+            chave_cache = None
+        
+        if chave_cache:
+            await self.cache.set(chave_cache, resposta)
+        elif rota != rotas[0]:
+            # Caches derivados (ex.: por parágrafo do Gramático) também ignoram estas respostas
+            resposta["failover"] = True
+        
+        return resposta
     
-    async def _generate_openai(
+    async def _generate_com_failover(
         self,
+        rotas: List[Tuple[str, str]],
         system_prompt: str,
         user_prompt: str,
         temperature: float,
         max_tokens: int,
-        json_mode: bool
-    ) -> Dict[str, Any]:
-        """Gera resposta usando OpenAI"""
-        try:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            
-            kwargs = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
+        json_mode: bool,
+        leitor: Optional[LeitorItensStream] = None
+    ) -> Tuple[Dict[str, Any], Tuple[str, str]]:
+        """
+        Percorre as rotas em ordem: erros transitórios são retentados com backoff,
+        e quando o circuito de uma rota abre a próxima é usada.
+        """
+        ultimo_erro: Optional[ErroLLM] = None
+        
+        for rota in rotas:
+            circuito = self._circuito(rota)
             
-            if json_mode:
-                kwargs["response_format"] = {"type": "json_object"}
+            for tentativa in range(settings.LLM_MAX_RETRIES + 1):
+                if not circuito.permite():
+                    break
+                
+                try:
+                    resposta = await self._chamar_rota(
+                        rota, system_prompt, user_prompt, temperature, max_tokens, json_mode, leitor
+                    )
+                except ErroLLM as e:
+                    if not e.retentavel:
+                        # Erro da requisição (400, auth, JSON inválido): outra tentativa não ajuda
+                        circuito.liberar_teste()
+                        raise
+                    circuito.registrar_falha()
+                    ultimo_erro = e
+                    
+                    if tentativa == settings.LLM_MAX_RETRIES or circuito.estado == CircuitBreaker.ABERTO:
+                        break
+                    if e.retry_after is not None and e.retry_after > settings.LLM_RETRY_MAX_SECONDS:
+                        logger.warning(f"[LLM] {circuito.nome} pediu espera de {e.retry_after:.0f}s, tentando failover")
+                        break
+                    
+                    espera = calcular_backoff(
+                        tentativa,
+                        settings.LLM_RETRY_BASE_SECONDS,
+                        settings.LLM_RETRY_MAX_SECONDS,
+                        e.retry_after
+                    )
+                    logger.warning(
+                        f"[LLM] {circuito.nome} falhou ({e.status or 'sem status'}), "
+                        f"tentativa {tentativa + 1}/{settings.LLM_MAX_RETRIES + 1}, aguardando {espera:.1f}s"
+                    )
+                    await asyncio.sleep(espera)
+                    continue
+                except BaseException:
+                    circuito.liberar_teste()
+                    raise
+                
+                circuito.registrar_sucesso()
+                if rota != rotas[0]:
+                    logger.info(f"[LLM] Resposta obtida via failover ({circuito.nome})")
+                return resposta, rota
+        
+        if ultimo_erro is not None:
+            raise ultimo_erro
+        raise ErroLLM("Nenhum provider de LLM disponível (circuit breaker aberto)")
+    
+    async def _chamar_rota(
+        self,
+        rota: Tuple[str, str],
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        json_mode: bool,
+        leitor: Optional[LeitorItensStream] = None
+    ) -> Dict[str, Any]:
+        """Faz uma chamada ao provider/modelo da rota, usando a chave com mais folga"""
+        provider, model = rota
+        if provider == "openai":
+            gerar = self._generate_openai
+        elif provider == "gemini":
+            gerar = self._generate_gemini
+        else:
+            raise ErroLLM(f"Provider de LLM desconhecido: {provider}")
+        
+        pool = self._pool(rota)
+        # O provider reserva max_tokens de saída no TPM; a diferença é devolvida na reconciliação
+        tokens_estimados = estimar_tokens(system_prompt, user_prompt) + max_tokens
+        
+        while True:
+            chave = pool.escolher()
+            if chave is None:
+                espera = pool.segundos_ate_disponivel()
+                raise ErroLLM(
+                    f"Todas as chaves de {provider}:{model} em cooldown",
+                    retentavel=True,
+                    retry_after=espera,
+                    status=429
+                )
             
-            response = self.client.chat.completions.create(**kwargs)
+            chave_limite = f"{provider}:{model}:{chave.nome}"
+            if self.limitador:
+                await self.limitador.adquirir(chave_limite, tokens_estimados)
             
-            content = response.choices[0].message.content
+            chave.iniciar(tokens_estimados)
+            try:
+                resposta = await gerar(
+                    chave, model, system_prompt, user_prompt, temperature, max_tokens, json_mode, leitor
+                )
+            except ErroLLM as e:
+                if e.status == 429:
+                    # Chamada recusada não consome TPM: a reserva volta ao balde da chave
+                    if self.limitador:
+                        await self.limitador.devolver(chave_limite, tokens_estimados)
+                    # Limite da chave: tenta outra chave imediatamente, sem backoff
+                    pool.registrar_limite(chave, e.retry_after, e.headers)
+                    if pool.escolher() is not None:
+                        continue
+                    e.retry_after = pool.segundos_ate_disponivel()
+                raise
+            finally:
+                chave.finalizar(tokens_estimados)
             
+            if self.limitador:
+                await self.limitador.reconciliar(chave_limite, tokens_estimados, resposta["tokens_used"])
+            return resposta
+    
+    async def _generate_openai(
+        self,
+        chave: ChaveAPI,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        json_mode: bool,
+        leitor: Optional[LeitorItensStream] = None
+    ) -> Dict[str, Any]:
+        """Gera resposta usando OpenAI (cliente assíncrono, não bloqueia o event loop)"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        kwargs = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        
+        if leitor:
+            kwargs["stream"] = True
+            kwargs["stream_options"] = {"include_usage": True}
+        
+        try:
+            # Resposta bruta para ler os headers x-ratelimit-* da chave
+            raw = await chave.client.chat.completions.with_raw_response.create(**kwargs)
+            chave.atualizar_limites(raw.headers)
+            if leitor:
+                content, finish_reason, usage, modelo = await self._ler_stream_openai(raw.parse(), leitor)
+            else:
+                response = raw.parse()
+                content = response.choices[0].message.content
+                finish_reason = response.choices[0].finish_reason
+                usage = response.usage
+                modelo = response.model
+        except Exception as e:
+            raise classificar_erro_openai(e) from e
+        
+        truncada = finish_reason == "length"
+        
+        try:
             return {
                 "content": json.loads(content) if json_mode else content,
-                "tokens_used": response.usage.total_tokens,
-                "model": response.model
+                "tokens_used": usage.total_tokens if usage else None,
+                "completion_tokens": usage.completion_tokens if usage else None,
+                "model": modelo or model
             }
         except Exception as e:
-            raise Exception(f"Erro ao chamar OpenAI: {str(e)}")
+            raise ErroLLM(f"Erro ao chamar OpenAI: {str(e)}", truncada=truncada) from e
+    
+    async def _ler_stream_openai(
+        self,
+        stream,
+        leitor: LeitorItensStream
+    ) -> Tuple[str, Optional[str], Any, Optional[str]]:
+        """
+        Consome o stream da OpenAI repassando o texto ao leitor de itens
+        
+        Returns:
+            (conteúdo completo, finish_reason, usage, modelo)
+        """
+        leitor.reiniciar()
+        partes: List[str] = []
+        finish_reason = None
+        usage = None
+        modelo = None
+        async for chunk in stream:
+            modelo = chunk.model or modelo
+            # Com include_usage o último chunk traz o uso e nenhuma choice
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            escolha = chunk.choices[0]
+            if escolha.finish_reason:
+                finish_reason = escolha.finish_reason
+            fragmento = escolha.delta.content if escolha.delta else None
+            if fragmento:
+                partes.append(fragmento)
+                await leitor.receber(fragmento)
+        return "".join(partes), finish_reason, usage, modelo
     
     async def _generate_gemini(
         self,
+        chave: ChaveAPI,
+        model: str,
         system_prompt: str,
         user_prompt: str,
         temperature: float,
         max_tokens: int,
-        json_mode: bool
+        json_mode: bool,
+        leitor: Optional[LeitorItensStream] = None
     ) -> Dict[str, Any]:
-        """Gera resposta usando Gemini"""
+        """Gera resposta usando Gemini (API assíncrona, não bloqueia o event loop)"""
+        # Gemini combina system e user prompt
+        full_prompt = f"{system_prompt}\n\n{user_prompt}"
+        
+        if json_mode:
+            full_prompt += "\n\nResponda APENAS com um JSON válido."
+        
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+        
         try:
-            # Gemini combina system e user prompt
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            
-            if json_mode:
-                full_prompt += "\n\nResponda APENAS com um JSON válido."
-            
-            generation_config = {
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-            }
-            
-            response = self.client.generate_content(
+            response = await chave.client.generate_content_async(
                 full_prompt,
-                generation_config=generation_config
+                generation_config=generation_config,
+                stream=leitor is not None,
+                request_options={"timeout": settings.LLM_TIMEOUT_SECONDS}
             )
-            
+            if leitor:
+                # Os chunks são acumulados na própria resposta (text, usage_metadata, candidates)
+                leitor.reiniciar()
+                async for chunk in response:
+                    fragmento = chunk.text if chunk.parts else ""
+                    if fragmento:
+                        await leitor.receber(fragmento)
+        except Exception as e:
+            raise classificar_erro_gemini(e) from e
+        
+        uso = getattr(response, "usage_metadata", None)
+        candidatos = getattr(response, "candidates", None) or []
+        motivo = getattr(candidatos[0], "finish_reason", None) if candidatos else None
+        truncada = getattr(motivo, "name", str(motivo)) == "MAX_TOKENS"
+        
+        try:
             content = response.text
-            
             return {
                 "content": json.loads(content) if json_mode else content,
                 "tokens_used": None,  # Gemini não retorna contagem de tokens diretamente
-                "model": self.model
+                "completion_tokens": getattr(uso, "candidates_token_count", None),
+                "model": model
             }
         except Exception as e:
-            raise Exception(f"Erro ao chamar Gemini: {str(e)}")
+            raise ErroLLM(f"Erro ao chamar Gemini: {str(e)}", truncada=truncada) from e
+    
+    def estado_circuitos(self) -> Dict[str, str]:
+        """Estado atual do circuit breaker de cada rota"""
+        return {circuito.nome: circuito.estado for circuito in self.circuitos.values()}
+    
+    def estado_chaves(self) -> Dict[str, Any]:
+        """Folga e cooldown de cada chave, por rota"""
+        return {f"{provider}:{model}": pool.estatisticas() for (provider, model), pool in self.pools.items()}
 
 
 # Instância global do serviço
 llm_service = LLMService()
-
@@ -0,0 +1,66 @@
+"""
+Orçamento adaptativo de tokens de saída por agente
+Aprende o percentil alto do tamanho das respostas de cada agente e ajusta max_tokens
+"""
+
+from typing import Optional, Dict, Any
+from collections import deque
+import math
+
+from app.config import settings
+
+
+class OrcamentoSaida:
+    """Histórico recente de completion_tokens por agente"""
+
+    def __init__(
+        self,
+        janela: int,
+        percentil: float,
+        margem: float,
+        minimo: int,
+        amostras_minimas: int
+    ):
+        self.janela = janela
+        self.percentil = percentil
+        self.margem = margem
+        self.minimo = minimo
+        self.amostras_minimas = amostras_minimas
+        self._historico: Dict[str, deque] = {}
+
+    def registrar(self, agente: str, tokens: Optional[int]):
+        """Guarda o tamanho de uma resposta do agente"""
+        if not tokens:
+            return
+        self._historico.setdefault(agente, deque(maxlen=self.janela)).append(tokens)
+
+    def _percentil(self, agente: str) -> Optional[int]:
+        amostras = self._historico.get(agente)
+        if not amostras or len(amostras) < self.amostras_minimas:
+            return None
+        ordenadas = sorted(amostras)
+        indice = max(0, math.ceil(self.percentil * len(ordenadas)) - 1)
+        return ordenadas[indice]
+
+    def sugerir(self, agente: str, teto: int) -> int:
+        """max_tokens para a próxima chamada (o teto configurado enquanto não há histórico)"""
+        observado = self._percentil(agente)
+        if observado is None:
+            return teto
+        return max(self.minimo, min(teto, math.ceil(observado * self.margem)))
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            agente: {"amostras": len(amostras), "percentil": self._percentil(agente)}
+            for agente, amostras in self._historico.items()
+        }
+
+
+# Instância global (por processo)
+orcamento_saida = OrcamentoSaida(
+    janela=settings.LLM_ADAPTIVE_BUDGET_WINDOW,
+    percentil=settings.LLM_ADAPTIVE_BUDGET_PERCENTILE,
+    margem=settings.LLM_ADAPTIVE_BUDGET_MARGIN,
+    minimo=settings.LLM_ADAPTIVE_BUDGET_FLOOR,
+    amostras_minimas=settings.LLM_ADAPTIVE_BUDGET_MIN_SAMPLES
+)
@@ -0,0 +1,523 @@
+"""
+Processamento offline das redações B2B pelo Batch API da OpenAI
+
+Fluxo de um lote:
+1. Redações B2B pendentes são reivindicadas (reservando a cota diária de cada uma; sem
+   cota ficam para o dia seguinte) e os prompts dos agentes independentes são enviados
+   como JSONL (fase "etapas").
+2. Quando o batch termina, as respostas ficam guardadas no lote e os prompts do
+   avaliador (que depende das etapas anteriores) são enviados (fase "avaliacao").
+3. Ao fim da segunda fase as respostas passam pela mesma conversão dos agentes
+   e viram linhas de Analise, como no processamento interativo.
+
+Nenhuma chamada ao provider acontece com transação aberta: o envio de uma fase é
+reivindicado (enviando_desde) e confirmado depois do upload com um UPDATE condicional,
+e as respostas baixadas só são gravadas se o lote ainda estiver no mesmo batch.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.lote_analise import FaseLoteEnum, LoteAnalise, StatusLoteEnum
+from app.models.redacao import Redacao, StatusRedacaoEnum
+from app.models.usuario import PlanoEnum, Usuario
+from app.agents.base_agent import BaseAgent
+from app.agents.orquestrador import orquestrador
+from app.services.analise_service import criar_analise
+from app.services.cota_service import devolver_cota_diaria, proximo_reset_cota, reservar_cota_diaria
+from app.services.llm_key_pool import chaves_openai_configuradas
+
+logger = logging.getLogger(__name__)
+
+# Status do batch no provider que ainda não têm resultado
+STATUS_BATCH_EM_ANDAMENTO = {"validating", "in_progress", "finalizing", "cancelling"}
+
+
+def lote_habilitado() -> bool:
+    """O Batch API só existe no provider OpenAI"""
+    return settings.BATCH_ENABLED and settings.LLM_PROVIDER == "openai"
+
+
+class ProcessadorLotes:
+    """Envia, acompanha e conclui os lotes de redações B2B"""
+
+    def __init__(self):
+        self.running = False
+        self.task = None
+        self.client = None
+
+    @staticmethod
+    def _chave():
+        """Primeira chave OpenAI configurada (a cota do Batch API é separada)"""
+        chaves = [(api_key, organizacao) for api_key, organizacao in chaves_openai_configuradas() if api_key]
+        if not chaves:
+            raise RuntimeError("BATCH_ENABLED=true exige OPENAI_API_KEY ou OPENAI_API_KEYS configurada")
+        return chaves[0]
+
+    def _cliente(self):
+        """Cliente OpenAI do lote"""
+        if self.client is None:
+            from openai import AsyncOpenAI
+            api_key, organizacao = self._chave()
+            self.client = AsyncOpenAI(
+                api_key=api_key,
+                organization=organizacao,
+                base_url=settings.OPENAI_BASE_URL or None,
+                timeout=settings.LLM_TIMEOUT_SECONDS
+            )
+        return self.client
+
+    def _etapas_por_fase(self) -> Tuple[Dict[str, BaseAgent], Dict[str, BaseAgent]]:
+        """Etapas do plano B2B: independentes (fase 1) e com dependências (fase 2)"""
+        etapas = orquestrador._montar_etapas(PlanoEnum.B2B)
+        independentes = {nome: agente for nome, agente in etapas.items() if not agente.dependencias}
+        dependentes = {nome: agente for nome, agente in etapas.items() if agente.dependencias}
+        return independentes, dependentes
+
+    @staticmethod
+    def _contexto(redacao: Redacao) -> Dict[str, Any]:
+        # Referências esperadas não são persistidas na redação (mesmo contexto do worker)
+        return {"tipo": redacao.tipo.value, "referencias_esperadas": []}
+
+    @staticmethod
+    def _linha_jsonl(custom_id: str, requisicao: Dict[str, Any]) -> str:
+        """Uma requisição de chat completion no formato de entrada do Batch API"""
+        return json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": requisicao["model"],
+                "messages": [
+                    {"role": "system", "content": requisicao["system_prompt"]},
+                    {"role": "user", "content": requisicao["user_prompt"]}
+                ],
+                "temperature": requisicao["temperature"],
+                "max_tokens": requisicao["max_tokens"],
+                "response_format": {"type": "json_object"}
+            }
+        }, ensure_ascii=False)
+
+    async def _enviar_batch(self, linhas: List[str]) -> str:
+        """Sobe o JSONL e cria o batch; retorna o ID do batch no provider"""
+        client = self._cliente()
+        conteudo = ("\n".join(linhas) + "\n").encode("utf-8")
+        arquivo = await client.files.create(
+            file=("lote.jsonl", io.BytesIO(conteudo)),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=arquivo.id,
+            endpoint="/v1/chat/completions",
+            completion_window=settings.BATCH_COMPLETION_WINDOW
+        )
+        return batch.id
+
+    async def _baixar_respostas(self, batch) -> Dict[str, Tuple[Dict[str, Any], int]]:
+        """
+        Lê o arquivo de saída do batch.
+        Returns:
+            Dict custom_id -> (JSON retornado pelo agente, tokens usados); linhas com erro ficam de fora
+        """
+        respostas: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        if not batch.output_file_id:
+            return respostas
+
+        saida = await self._cliente().files.content(batch.output_file_id)
+        for linha in saida.text.splitlines():
+            if not linha.strip():
+                continue
+            try:
+                item = json.loads(linha)
+                resposta = item.get("response") or {}
+                if resposta.get("status_code") != 200:
+                    continue
+                corpo = resposta["body"]
+                dados = json.loads(corpo["choices"][0]["message"]["content"])
+                tokens = (corpo.get("usage") or {}).get("total_tokens") or 0
+                respostas[item["custom_id"]] = (dados, tokens)
+            except Exception as e:
+                logger.warning(f"[LOTE] Linha de resposta invalida no batch {batch.id}: {str(e)}")
+        return respostas
+
+    async def _devolver(self, db: AsyncSession, lote: LoteAnalise, redacao: Redacao):
+        """
+        Redação sem resultado no lote: volta para o próximo lote ou vira ERRO após as tentativas.
+        A cota reservada na reivindicação é devolvida (o próximo lote reserva de novo).
+        """
+        redacao.lote_id = None
+        redacao.processado_por = None
+        if (redacao.tentativas or 0) >= settings.WORKER_MAX_ATTEMPTS:
+            redacao.status = StatusRedacaoEnum.ERRO
+        else:
+            redacao.status = StatusRedacaoEnum.PENDENTE
+        if lote.dia_cota:
+            await devolver_cota_diaria(db, redacao.usuario_id, lote.dia_cota)
+
+    # === Envio ===
+
+    async def submeter_novo_lote(self) -> Optional[str]:
+        """
+        Reivindica redações B2B pendentes e envia a primeira fase do lote.
+        Só envia quando há BATCH_MIN_ESSAYS redações ou a mais antiga esperou BATCH_MAX_WAIT_SECONDS.
+        Cada redação reserva a cota diária do usuário (como no worker); sem cota ela é
+        estacionada até o reset e fica fora do lote.
+
+        Returns:
+            ID do lote criado (ou None)
+        """
+        agora = datetime.utcnow()
+        elegiveis = (
+            Redacao.status == StatusRedacaoEnum.PENDENTE,
+            Redacao.lote_id.is_(None),
+            Usuario.plano == PlanoEnum.B2B,
+            or_(Redacao.agendado_para.is_(None), Redacao.agendado_para <= agora)
+        )
+
+        async with SessionLocal() as db:
+            quantidade, mais_antiga = (await db.execute(
+                select(func.count(Redacao.id), func.min(Redacao.data_submissao))
+                .join(Usuario, Usuario.id == Redacao.usuario_id)
+                .where(*elegiveis)
+            )).one()
+            if not quantidade:
+                return None
+            esperando = (agora - mais_antiga).total_seconds()
+            if quantidade < settings.BATCH_MIN_ESSAYS and esperando < settings.BATCH_MAX_WAIT_SECONDS:
+                return None
+
+            redacoes = (await db.scalars(
+                select(Redacao)
+                .join(Usuario, Usuario.id == Redacao.usuario_id)
+                .where(*elegiveis)
+                .order_by(Redacao.data_submissao.asc())
+                .limit(settings.BATCH_MAX_ESSAYS)
+                .with_for_update(of=Redacao, skip_locked=True)
+            )).all()
+            if not redacoes:
+                return None
+
+            # Reservar a cota de cada redação (UPDATE condicional, como no worker)
+            aceitas, dia_cota = [], None
+            for redacao in redacoes:
+                dia = await reservar_cota_diaria(db, redacao.usuario_id)
+                if dia is None:
+                    # Sem cota: estaciona até o reset, sem contar tentativa
+                    redacao.agendado_para = proximo_reset_cota(agora)
+                    continue
+                dia_cota = dia_cota or dia
+                aceitas.append(redacao)
+            estacionadas = len(redacoes) - len(aceitas)
+            if estacionadas:
+                logger.warning(f"[LOTE] {estacionadas} redacoes sem cota diaria, reagendadas para {proximo_reset_cota(agora)}")
+                print(f"[LOTE] {estacionadas} redacoes sem cota diaria, reagendadas para {proximo_reset_cota(agora)}")
+            if not aceitas:
+                await db.commit()
+                return None
+            redacoes = aceitas
+
+            # O lote nasce sem batch no provider: o envio acontece depois do commit
+            lote = LoteAnalise(
+                fase=FaseLoteEnum.ETAPAS.value,
+                status=StatusLoteEnum.ENVIADO.value,
+                redacao_ids=[redacao.id for redacao in redacoes],
+                resultados={},
+                tokens_utilizados={},
+                dia_cota=dia_cota
+            )
+            db.add(lote)
+            await db.flush()
+
+            for redacao in redacoes:
+                redacao.status = StatusRedacaoEnum.ANALISANDO
+                redacao.lote_id = lote.id
+                redacao.processado_por = f"lote:{lote.id}"
+                redacao.lease_expira_em = None  # Fora do reaper: o lote acompanha a redação
+                redacao.tentativas = (redacao.tentativas or 0) + 1
+            await db.commit()
+
+        logger.info(f"[LOTE] Lote {lote.id} criado com {len(redacoes)} redacoes")
+        print(f"[LOTE] Lote {lote.id} criado com {len(redacoes)} redacoes")
+        await self._enviar_fase(lote.id)
+        return lote.id
+
+    async def _enviar_fase(self, lote_id: str) -> Optional[str]:
+        """
+        Envia a fase atual de um lote que ainda não tem batch no provider.
+
+        A reivindicação (enviando_desde) e a confirmação do batch são UPDATEs condicionais em
+        transações curtas; o upload acontece entre as duas, sem locks. Uma reivindicação sem
+        confirmação após BATCH_SEND_TIMEOUT_SECONDS (instância caiu no meio) pode ser refeita.
+
+        Returns:
+            ID do batch enviado (ou None)
+        """
+        agora = datetime.utcnow()
+        limite = agora - timedelta(seconds=settings.BATCH_SEND_TIMEOUT_SECONDS)
+        pendente = (
+            LoteAnalise.id == lote_id,
+            LoteAnalise.status == StatusLoteEnum.ENVIADO.value,
+            LoteAnalise.provider_batch_id.is_(None)
+        )
+
+        async with SessionLocal() as db:
+            reivindicado = await db.execute(
+                update(LoteAnalise)
+                .where(*pendente, or_(LoteAnalise.enviando_desde.is_(None), LoteAnalise.enviando_desde < limite))
+                .values(enviando_desde=agora)
+                .execution_options(synchronize_session=False)
+            )
+            if reivindicado.rowcount == 0:
+                await db.rollback()
+                return None
+
+            lote = await db.get(LoteAnalise, lote_id)
+            redacoes = (await db.scalars(
+                select(Redacao).where(Redacao.id.in_(lote.redacao_ids), Redacao.lote_id == lote.id)
+            )).all()
+            fase = lote.fase
+            linhas = await self._linhas_fase(db, lote, redacoes)
+            if not linhas:
+                lote.status = StatusLoteEnum.ERRO.value
+                lote.enviando_desde = None
+            # Redações devolvidas ao montar a fase já saem do lote aqui
+            await db.commit()
+
+        if not linhas:
+            logger.warning(f"[LOTE] Lote {lote_id} sem redacoes para a fase {fase}")
+            return None
+
+        try:
+            batch_id = await self._enviar_batch(linhas)
+        except Exception as e:
+            # A reivindicação fica até expirar: outra tentativa sai após BATCH_SEND_TIMEOUT_SECONDS
+            logger.error(f"[LOTE] Erro ao enviar a fase {fase} do lote {lote_id}: {str(e)}")
+            print(f"[LOTE] Erro ao enviar a fase {fase} do lote {lote_id}: {str(e)}")
+            return None
+
+        async with SessionLocal() as db:
+            confirmado = await db.execute(
+                update(LoteAnalise)
+                .where(*pendente, LoteAnalise.enviando_desde == agora)
+                .values(provider_batch_id=batch_id, enviando_desde=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+        if confirmado.rowcount == 0:
+            # Reivindicação expirou e outra instância reenviou a fase: este batch sobra
+            logger.warning(f"[LOTE] Lote {lote_id}: envio da fase {fase} perdeu a reivindicacao, cancelando {batch_id}")
+            try:
+                await self._cliente().batches.cancel(batch_id)
+            except Exception as e:
+                logger.warning(f"[LOTE] Erro ao cancelar o batch {batch_id}: {str(e)}")
+            return None
+
+        logger.info(f"[LOTE] Lote {lote_id}: fase {fase} enviada ({len(linhas)} requisicoes)")
+        print(f"[LOTE] Lote {lote_id}: fase {fase} enviada ({len(linhas)} requisicoes)")
+        return batch_id
+
+    async def _linhas_fase(self, db: AsyncSession, lote: LoteAnalise, redacoes: List[Redacao]) -> List[str]:
+        """JSONL da fase atual do lote; na fase de avaliação devolve as redações sem as etapas"""
+        independentes, dependentes = self._etapas_por_fase()
+        linhas = []
+
+        if lote.fase == FaseLoteEnum.ETAPAS.value:
+            for redacao in redacoes:
+                contexto = self._contexto(redacao)
+                for nome, agente in independentes.items():
+                    requisicao = agente.montar_requisicao(redacao.texto, redacao.tema, contexto)
+                    linhas.append(self._linha_jsonl(f"{redacao.id}:{nome}", requisicao))
+            return linhas
+
+        resultados = lote.resultados or {}
+        for redacao in redacoes:
+            try:
+                obtidos = resultados.get(redacao.id, {})
+                faltando = [nome for nome in independentes if nome not in obtidos]
+                if faltando:
+                    raise ValueError(f"sem resposta para {', '.join(faltando)}")
+                # Mesma conversão dos agentes: uma resposta inválida derruba só esta redação
+                convertidos = {
+                    nome: agente.converter_resposta(obtidos[nome])
+                    for nome, agente in independentes.items()
+                }
+                contexto = self._contexto(redacao)
+                for nome, agente in dependentes.items():
+                    anteriores = {d: convertidos[d] for d in agente.dependencias if d in convertidos}
+                    requisicao = agente.montar_requisicao(redacao.texto, redacao.tema, contexto, anteriores)
+                    linhas.append(self._linha_jsonl(f"{redacao.id}:{nome}", requisicao))
+            except Exception as e:
+                logger.warning(f"[LOTE] Redacao {redacao.id} falhou na fase de etapas: {str(e)}")
+                await self._devolver(db, lote, redacao)
+        return linhas
+
+    # === Acompanhamento ===
+
+    async def acompanhar_lotes(self):
+        """
+        Verifica os lotes enviados e avança os que terminaram no provider.
+        A leitura não trava nada: consulta e download acontecem fora de transação.
+        """
+        async with SessionLocal() as db:
+            lotes = (await db.execute(
+                select(LoteAnalise.id, LoteAnalise.provider_batch_id)
+                .where(LoteAnalise.status == StatusLoteEnum.ENVIADO.value)
+            )).all()
+
+        for lote_id, batch_id in lotes:
+            try:
+                if batch_id is None:
+                    # Fase ainda sem batch (envio anterior falhou ou a instância caiu no meio)
+                    await self._enviar_fase(lote_id)
+                    continue
+                batch = await self._cliente().batches.retrieve(batch_id)
+                if batch.status in STATUS_BATCH_EM_ANDAMENTO:
+                    continue
+                respostas = await self._baixar_respostas(batch)
+                if await self._avancar_lote(lote_id, batch_id, respostas):
+                    await self._enviar_fase(lote_id)
+            except Exception as e:
+                logger.error(f"[LOTE] Erro ao acompanhar lote {lote_id}: {str(e)}")
+                logger.error(f"[LOTE] Traceback: {traceback.format_exc()}")
+                print(f"[LOTE] Erro ao acompanhar lote {lote_id}: {str(e)}")
+
+    async def _avancar_lote(
+        self,
+        lote_id: str,
+        batch_id: str,
+        respostas: Dict[str, Tuple[Dict[str, Any], int]]
+    ) -> bool:
+        """
+        Guarda as respostas da fase que terminou e passa para a próxima fase (ou conclui o lote).
+        Só grava se o lote ainda estiver no batch `batch_id` (outra instância pode ter avançado).
+
+        Returns:
+            True quando a fase de avaliação ficou pronta para envio
+        """
+        async with SessionLocal() as db:
+            lote = await db.scalar(
+                select(LoteAnalise)
+                .where(
+                    LoteAnalise.id == lote_id,
+                    LoteAnalise.status == StatusLoteEnum.ENVIADO.value,
+                    LoteAnalise.provider_batch_id == batch_id
+                )
+                .with_for_update(skip_locked=True)
+            )
+            if lote is None:
+                return False
+
+            # Cópias: atribuir um novo objeto marca a coluna JSON como alterada
+            resultados = {rid: dict(etapas) for rid, etapas in (lote.resultados or {}).items()}
+            tokens = dict(lote.tokens_utilizados or {})
+            for custom_id, (dados, usados) in respostas.items():
+                redacao_id, _, etapa = custom_id.rpartition(":")
+                resultados.setdefault(redacao_id, {})[etapa] = dados
+                tokens[redacao_id] = tokens.get(redacao_id, 0) + usados
+            lote.resultados = resultados
+            lote.tokens_utilizados = tokens
+
+            if lote.fase == FaseLoteEnum.ETAPAS.value:
+                # A avaliação é enviada por _enviar_fase, depois deste commit
+                lote.fase = FaseLoteEnum.AVALIACAO.value
+                lote.provider_batch_id = None
+                await db.commit()
+                return True
+
+            redacoes = (await db.scalars(
+                select(Redacao).where(Redacao.id.in_(lote.redacao_ids), Redacao.lote_id == lote.id)
+            )).all()
+            concluidas = 0
+            for redacao in redacoes:
+                try:
+                    await self._concluir_redacao(db, lote, redacao, resultados.get(redacao.id, {}), tokens.get(redacao.id, 0))
+                    concluidas += 1
+                except Exception as e:
+                    logger.warning(f"[LOTE] Redacao {redacao.id} falhou na fase de avaliacao: {str(e)}")
+                    await self._devolver(db, lote, redacao)
+
+            lote.status = StatusLoteEnum.CONCLUIDO.value
+            await db.commit()
+
+        logger.info(f"[LOTE] Lote {lote_id} concluido: {concluidas}/{len(lote.redacao_ids)} redacoes")
+        print(f"[LOTE] Lote {lote_id} concluido: {concluidas}/{len(lote.redacao_ids)} redacoes")
+        return False
+
+    async def _concluir_redacao(
+        self,
+        db: AsyncSession,
+        lote: LoteAnalise,
+        redacao: Redacao,
+        obtidos: Dict[str, Any],
+        tokens: int
+    ):
+        """Converte as respostas das duas fases e grava a Analise da redação (a cota já foi reservada no envio)"""
+        etapas = orquestrador._montar_etapas(PlanoEnum.B2B)
+        faltando = [nome for nome in etapas if nome not in obtidos]
+        if faltando:
+            raise ValueError(f"sem resposta para {', '.join(faltando)}")
+
+        resultados = {nome: agente.converter_resposta(obtidos[nome]) for nome, agente in etapas.items()}
+        contexto = self._contexto(redacao)
+        fuga_tema_result = await orquestrador._detectar_fuga_tema(redacao.texto, redacao.tema, contexto)
+
+        analise_completa = orquestrador.compor_analise(
+            redacao_id=redacao.id,
+            plano_usuario=PlanoEnum.B2B,
+            texto=redacao.texto,
+            resultados=resultados,
+            fuga_tema_result=fuga_tema_result,
+            tempo_total=(datetime.utcnow() - lote.data_criacao).total_seconds(),
+            total_tokens=tokens
+        )
+
+        db.add(criar_analise(analise_completa))
+        redacao.status = StatusRedacaoEnum.CONCLUIDA
+        redacao.lote_id = None
+        redacao.processado_por = None
+
+    # === Loop ===
+
+    async def run(self):
+        """Loop principal: acompanha os lotes enviados e envia novos"""
+        self.running = True
+        logger.info("[LOTE] Processador de lotes iniciado")
+        print("[LOTE] Processador de lotes iniciado")
+
+        while self.running:
+            try:
+                await self.acompanhar_lotes()
+                await self.submeter_novo_lote()
+            except Exception as e:
+                logger.error(f"[LOTE] Erro no loop de lotes: {str(e)}")
+                print(f"[LOTE] Erro no loop de lotes: {str(e)}")
+            await asyncio.sleep(settings.BATCH_POLL_INTERVAL)
+
+    def start(self):
+        """Inicia o processador em background (falha na hora se não há chave para o Batch API)"""
+        self._chave()
+        if not self.running:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """Para o processador (lotes enviados continuam no provider e são retomados depois)"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+        logger.info("[LOTE] Processador de lotes parado")
+        print("[LOTE] Processador de lotes parado")
+
+
+# Instância global do processador
+processador_lotes = ProcessadorLotes()
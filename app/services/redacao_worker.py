@@ -4,17 +4,27 @@ Worker para processar redações pendentes automaticamente
 
 import asyncio
 import logging
+import os
+import socket
+import time
 import traceback
-from datetime import datetime
-from sqlalchemy.orm import Session
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+from sqlalchemy import Float, and_, case, cast, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database import SessionLocal
 from app.models.redacao import Redacao, StatusRedacaoEnum
-from app.models.analise import Analise
-from app.models.usuario import Usuario
+from app.services.analise_service import carregar_base_revisao, criar_analise
+from app.models.usuario import Usuario, PlanoEnum
 from app.schemas.redacao import RedacaoSubmit
 from app.agents.orquestrador import orquestrador
+from app.services.fila_notificacao import OuvinteFila, notificar_nova_redacao
+from app.services.cota_service import devolver_cota_diaria, proximo_reset_cota, reservar_cota_diaria
+from app.services.processador_lotes import lote_habilitado
+from app.services.idempotencia import gerenciador_idempotencia
 
 logger = logging.getLogger(__name__)
 
@@ -26,141 +36,436 @@ class RedacaoWorker:
         """Inicializa o worker"""
         self.running = False
         self.task = None
-        self.check_interval = 5  # Verificar a cada 5 segundos
+        self.check_interval = settings.WORKER_CHECK_INTERVAL
+        self.concorrencia = settings.WORKER_CONCURRENCY
+        self.semaforo = asyncio.Semaphore(self.concorrencia)
+        self.em_andamento: Set[asyncio.Task] = set()
+        self.ouvinte = OuvinteFila(settings.WORKER_NOTIFY_CHANNEL)
+        
+        # Identificação do worker nas leases (host:pid:sufixo)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ultima_recuperacao = 0.0
+    
+    def _liberar_lease(self, redacao: Redacao):
+        """Remove a reivindicação do worker (redação concluída, com erro ou reagendada)"""
+        redacao.processado_por = None
+        redacao.lease_expira_em = None
     
-    async def processar_redacao_pendente(self, redacao: Redacao, db: Session):
+    async def processar_redacao_pendente(self, redacao: Redacao, db: AsyncSession):
         """
         Processa uma redação pendente
         
         Args:
             redacao: Objeto Redacao a ser processado
-            db: Sessão do banco de dados
+            db: Sessão do banco de dados (usada só na preparação, até a chamada ao LLM)
         """
+        redacao_id = redacao.id
+        usuario_id = redacao.usuario_id
+        dia_cota = None
         try:
             logger.info(f"[WORKER] Processando redacao {redacao.id} do usuario {redacao.usuario_id}")
             print(f"[WORKER] Processando redacao {redacao.id} do usuario {redacao.usuario_id}")
             
             # Buscar usuário
-            usuario = db.query(Usuario).filter(Usuario.id == redacao.usuario_id).first()
+            usuario = await db.scalar(select(Usuario).where(Usuario.id == redacao.usuario_id))
             
             if not usuario:
                 logger.error(f"[WORKER] Usuario {redacao.usuario_id} nao encontrado")
                 redacao.status = StatusRedacaoEnum.ERRO
-                db.commit()
+                self._liberar_lease(redacao)
+                await db.commit()
                 return
             
-            # Verificar limite diário
-            if usuario.correcoes_realizadas_hoje >= usuario.limite_diario:
-                logger.warning(f"[WORKER] Limite diario atingido para usuario {usuario.id}")
-                print(f"[WORKER] Limite diario atingido para usuario {usuario.id}")
-                # Manter como pendente para processar depois
+            # Reservar a cota do dia antes da análise (UPDATE condicional: redações do
+            # mesmo usuário em outros workers/réplicas não passam juntas do limite)
+            dia_cota = await reservar_cota_diaria(db, usuario.id)
+            if dia_cota is None:
+                # Estacionar até o reset da cota: a fila segue andando para os demais
+                # (sem contar tentativa: a análise nem começou)
+                redacao.status = StatusRedacaoEnum.PENDENTE
+                redacao.agendado_para = proximo_reset_cota()
+                redacao.tentativas = max((redacao.tentativas or 0) - 1, 0)
+                self._liberar_lease(redacao)
+                await db.commit()
+                logger.warning(f"[WORKER] Limite diario atingido para usuario {usuario.id}, reagendada para {redacao.agendado_para}")
+                print(f"[WORKER] Limite diario atingido para usuario {usuario.id}, reagendada para {redacao.agendado_para}")
                 return
-            
-            # Atualizar status para analisando
-            redacao.status = StatusRedacaoEnum.ANALISANDO
-            db.commit()
-            db.refresh(redacao)
+            await db.commit()
             
             # Criar objeto RedacaoSubmit para o orquestrador
             redacao_submit = RedacaoSubmit(
                 titulo=redacao.titulo,
                 texto=redacao.texto,
                 tema=redacao.tema,
-                tipo=redacao.tipo
+                tipo=redacao.tipo,
+                revisao_de=redacao.revisao_de
             )
+            plano = usuario.plano
+            base_revisao = await carregar_base_revisao(db, redacao.revisao_de)
+            # Encerrar a transação antes do LLM: a conexão volta ao pool durante a análise
+            # (o resultado é gravado numa sessão própria)
+            await db.commit()
             
             # Executar análise
-            logger.info(f"[WORKER] Executando analise da redacao {redacao.id} ({usuario.plano.value})...")
-            print(f"[WORKER] Executando analise da redacao {redacao.id} ({usuario.plano.value})...")
+            logger.info(f"[WORKER] Executando analise da redacao {redacao_id} ({plano.value})...")
+            print(f"[WORKER] Executando analise da redacao {redacao_id} ({plano.value})...")
             
             analise_completa = await orquestrador.analisar_redacao(
                 redacao=redacao_submit,
-                plano_usuario=usuario.plano,
-                redacao_id=redacao.id
+                plano_usuario=plano,
+                redacao_id=redacao_id,
+                base_revisao=base_revisao
             )
             
             # Salvar análise no banco
             logger.info(f"[WORKER] Salvando analise no banco...")
             print(f"[WORKER] Salvando analise no banco...")
             
-            nova_analise = Analise(
-                id=redacao.id,
-                redacao_id=redacao.id,
-                plano_usuario=analise_completa.plano_usuario,
-                tempo_processamento=analise_completa.tempo_processamento,
-                tokens_utilizados=analise_completa.tokens_utilizados,
-                analise_gramatical=analise_completa.analise_gramatical.dict(),
-                analise_logica=analise_completa.analise_logica.dict() if analise_completa.analise_logica else None,
-                analise_estrutural=analise_completa.analise_estrutural.dict() if analise_completa.analise_estrutural else None,
-                repertorio_sociocultural=analise_completa.repertorio_sociocultural.dict() if analise_completa.repertorio_sociocultural else None,
-                reescritas_comparativas=[r.dict() for r in analise_completa.reescritas_comparativas] if analise_completa.reescritas_comparativas else None,
-                modo_socratico=analise_completa.modo_socratico.dict() if analise_completa.modo_socratico else None,
-                avaliacao_final=analise_completa.avaliacao_final.dict(),
-                fuga_ao_tema={"fuga": analise_completa.fuga_ao_tema, "aderencia": analise_completa.aderencia_tema, "palavras": analise_completa.palavras_chave_usadas},
-                aderencia_tema=analise_completa.aderencia_tema,
-                palavras_chave_usadas=analise_completa.palavras_chave_usadas
-            )
+            async with SessionLocal() as db_resultado:
+                # Atualizar status da redação só se a lease ainda for deste worker:
+                # recuperada pelo reaper, a redação já é de outro e esta análise é descartada
+                concluida = await db_resultado.execute(
+                    update(Redacao)
+                    .where(*self._filtro_lease_propria(redacao_id))
+                    .values(status=StatusRedacaoEnum.CONCLUIDA, processado_por=None, lease_expira_em=None)
+                )
+                if concluida.rowcount == 0:
+                    await db_resultado.rollback()
+                    await devolver_cota_diaria(db_resultado, usuario_id, dia_cota)
+                    await db_resultado.commit()
+                    logger.warning(f"[WORKER] Lease da redacao {redacao_id} perdida, analise descartada")
+                    print(f"[WORKER] Lease da redacao {redacao_id} perdida, analise descartada")
+                    return
+                
+                db_resultado.add(criar_analise(analise_completa))
+                await db_resultado.commit()
             
-            db.add(nova_analise)
+            logger.info(f"[WORKER] Analise da redacao {redacao_id} concluida!")
+            print(f"[WORKER] Analise da redacao {redacao_id} concluida!")
             
-            # Atualizar status da redação
-            redacao.status = StatusRedacaoEnum.CONCLUIDA
+        except asyncio.CancelledError:
+            # Lease perdida ou worker parando: esta análise não será entregue
+            if dia_cota:
+                async with SessionLocal() as db_cota:
+                    await devolver_cota_diaria(db_cota, usuario_id, dia_cota)
+                    await db_cota.commit()
+            raise
+        except Exception as e:
+            # Atualizar status da redação para erro (se a lease ainda for deste worker),
+            # numa sessão própria como a gravação do resultado
+            await db.rollback()
+            async with SessionLocal() as db_erro:
+                await db_erro.execute(
+                    update(Redacao)
+                    .where(*self._filtro_lease_propria(redacao_id))
+                    .values(status=StatusRedacaoEnum.ERRO, processado_por=None, lease_expira_em=None)
+                )
+                if dia_cota:
+                    # A análise não foi entregue: a reserva volta para a cota
+                    await devolver_cota_diaria(db_erro, usuario_id, dia_cota)
+                await db_erro.commit()
             
-            # Incrementar contador de análises
-            usuario.correcoes_realizadas_hoje += 1
+            logger.error(f"[WORKER] Erro ao processar redacao {redacao_id}: {str(e)}")
+            logger.error(f"[WORKER] Traceback: {traceback.format_exc()}")
+            print(f"[WORKER] Erro ao processar redacao {redacao_id}: {str(e)}")
+            traceback.print_exc()
+    
+    def ordem_fila(self, agora: datetime):
+        """
+        Subconsulta com a ordem de atendimento das redações elegíveis.
+        
+        Enfileiramento justo ponderado: cada usuário (uma escola B2B é uma conta)
+        tem sua própria fila, e a n-ésima redação de um usuário recebe a posição
+        n / peso_do_plano. Assim um lote grande de um usuário intercala com as
+        redações dos demais em vez de bloqueá-las. Para evitar inanição, cada
+        WORKER_AGING_SECONDS de espera adianta a redação em uma posição.
+        """
+        peso_plano = case(
+            *[
+                (Usuario.plano == PlanoEnum(plano), float(peso))
+                for plano, peso in settings.WORKER_PLAN_WEIGHTS.items()
+            ],
+            else_=1.0
+        )
+        
+        posicao_usuario = cast(
+            func.row_number().over(
+                partition_by=Redacao.usuario_id,
+                order_by=Redacao.data_submissao.asc()
+            ),
+            Float
+        )
+        espera_segundos = func.extract("epoch", agora - Redacao.data_submissao)
+        
+        return (
+            select(
+                Redacao.id.label("id"),
+                (
+                    posicao_usuario / peso_plano
+                    - espera_segundos / settings.WORKER_AGING_SECONDS
+                ).label("ordem")
+            )
+            .join(Usuario, Usuario.id == Redacao.usuario_id)
+            .where(
+                Redacao.status == StatusRedacaoEnum.PENDENTE,
+                or_(
+                    Redacao.agendado_para.is_(None),
+                    Redacao.agendado_para <= agora
+                ),
+                *self._filtro_lote()
+            )
+            .subquery()
+        )
+    
+    @staticmethod
+    def _filtro_lote():
+        """Com o Batch API ativo, as redações B2B ficam com o processador de lotes"""
+        if lote_habilitado():
+            return (Usuario.plano != PlanoEnum.B2B,)
+        return ()
+    
+    async def _reivindicar_lote(self, limite: int) -> List[str]:
+        """
+        Reivindica atomicamente até `limite` redações pendentes,
+        na ordem de prioridade definida por `ordem_fila`.
+        
+        Usa SELECT ... FOR UPDATE SKIP LOCKED: linhas já travadas por outra
+        réplica são puladas, então cada redação é processada por um único worker.
+        
+        Returns:
+            IDs das redações reivindicadas (já marcadas como ANALISANDO)
+        """
+        async with SessionLocal() as db:
+            fila = self.ordem_fila(datetime.utcnow())
+            redacoes = (await db.scalars(
+                select(Redacao)
+                .join(fila, fila.c.id == Redacao.id)
+                .order_by(fila.c.ordem.asc(), Redacao.data_submissao.asc())
+                .limit(limite)
+                .with_for_update(of=Redacao, skip_locked=True)
+            )).all()
             
-            db.commit()
+            lease_expira_em = datetime.utcnow() + timedelta(seconds=settings.WORKER_LEASE_SECONDS)
+            for redacao in redacoes:
+                redacao.status = StatusRedacaoEnum.ANALISANDO
+                redacao.processado_por = self.worker_id
+                redacao.lease_expira_em = lease_expira_em
+                redacao.tentativas = (redacao.tentativas or 0) + 1
+            await db.commit()
             
-            logger.info(f"[WORKER] Analise da redacao {redacao.id} concluida!")
-            print(f"[WORKER] Analise da redacao {redacao.id} concluida!")
+            return [redacao.id for redacao in redacoes]
+    
+    async def _segundos_ate_proximo_agendamento(self) -> Optional[float]:
+        """Tempo até a próxima redação agendada ficar elegível (None se não houver)"""
+        async with SessionLocal() as db:
+            proximo = await db.scalar(
+                select(func.min(Redacao.agendado_para)).where(
+                    Redacao.status == StatusRedacaoEnum.PENDENTE,
+                    Redacao.agendado_para > datetime.utcnow()
+                )
+            )
+        
+        if proximo is None:
+            return None
+        return max((proximo - datetime.utcnow()).total_seconds(), 0)
+    
+    def _filtro_lease_propria(self, redacao_id: str):
+        """Filtro das redações cuja lease ainda pertence a este worker"""
+        return (
+            Redacao.id == redacao_id,
+            Redacao.status == StatusRedacaoEnum.ANALISANDO,
+            Redacao.processado_por == self.worker_id
+        )
+    
+    async def _renovar_lease(self, redacao_id: str) -> bool:
+        """Estende a lease; retorna False se ela foi perdida (recuperada por outro worker)"""
+        async with SessionLocal() as db:
+            resultado = await db.execute(
+                update(Redacao)
+                .where(*self._filtro_lease_propria(redacao_id))
+                .values(lease_expira_em=datetime.utcnow() + timedelta(seconds=settings.WORKER_LEASE_SECONDS))
+            )
+            await db.commit()
+            return resultado.rowcount > 0
+    
+    async def _devolver_para_fila(self, redacao_id: str):
+        """Devolve uma redação interrompida (ex.: worker parando) sem contar tentativa"""
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Redacao)
+                .where(*self._filtro_lease_propria(redacao_id))
+                .values(
+                    status=StatusRedacaoEnum.PENDENTE,
+                    processado_por=None,
+                    lease_expira_em=None,
+                    tentativas=func.greatest(Redacao.tentativas - 1, 0)
+                )
+            )
+            await db.commit()
+    
+    async def _heartbeat(self, redacao_id: str, tarefa_analise: asyncio.Task):
+        """Renova periodicamente a lease enquanto a análise está rodando"""
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_INTERVAL)
+            try:
+                if not await self._renovar_lease(redacao_id):
+                    logger.warning(f"[WORKER] Lease da redacao {redacao_id} perdida, interrompendo analise")
+                    print(f"[WORKER] Lease da redacao {redacao_id} perdida, interrompendo analise")
+                    tarefa_analise.cancel()
+                    return
+            except Exception as e:
+                # Falha transitória no banco: tentar de novo no próximo batimento
+                logger.warning(f"[WORKER] Erro ao renovar lease da redacao {redacao_id}: {str(e)}")
+    
+    async def _recuperar_leases_expiradas(self) -> int:
+        """
+        Devolve à fila redações cuja lease expirou (processo morreu no meio da análise)
+        e as das análises síncronas (sem lease) em ANALISANDO há mais que o tempo
+        máximo da análise (a API caiu no meio). As de lotes ficam com o processador de lotes.
+        Após WORKER_MAX_ATTEMPTS tentativas a redação é marcada como ERRO.
+        
+        Returns:
+            Quantidade de redações devolvidas à fila
+        """
+        async with SessionLocal() as db:
+            agora = datetime.utcnow()
+            limite_sincronas = agora - timedelta(
+                seconds=settings.ANALYSIS_TIMEOUT_SECONDS + settings.WORKER_LEASE_SECONDS
+            )
+            expiradas = (
+                Redacao.status == StatusRedacaoEnum.ANALISANDO,
+                or_(
+                    Redacao.lease_expira_em < agora,
+                    and_(
+                        Redacao.lease_expira_em.is_(None),
+                        Redacao.lote_id.is_(None),
+                        Redacao.data_atualizacao < limite_sincronas
+                    )
+                )
+            )
             
-        except Exception as e:
-            # Atualizar status da redação para erro
-            redacao.status = StatusRedacaoEnum.ERRO
-            db.commit()
+            reenfileiradas = (await db.execute(
+                update(Redacao)
+                .where(*expiradas, Redacao.tentativas < settings.WORKER_MAX_ATTEMPTS)
+                .values(status=StatusRedacaoEnum.PENDENTE, processado_por=None, lease_expira_em=None)
+            )).rowcount
+            esgotadas = (await db.execute(
+                update(Redacao)
+                .where(*expiradas, Redacao.tentativas >= settings.WORKER_MAX_ATTEMPTS)
+                .values(status=StatusRedacaoEnum.ERRO, processado_por=None, lease_expira_em=None)
+            )).rowcount
             
-            logger.error(f"[WORKER] Erro ao processar redacao {redacao.id}: {str(e)}")
-            logger.error(f"[WORKER] Traceback: {traceback.format_exc()}")
-            print(f"[WORKER] Erro ao processar redacao {redacao.id}: {str(e)}")
-            traceback.print_exc()
+            if reenfileiradas:
+                # Acordar os workers ociosos das outras réplicas
+                await notificar_nova_redacao(db, "recuperada")
+            await db.commit()
+            
+            if reenfileiradas or esgotadas:
+                logger.warning(f"[WORKER] Leases expiradas: {reenfileiradas} devolvidas a fila, {esgotadas} marcadas como erro")
+                print(f"[WORKER] Leases expiradas: {reenfileiradas} devolvidas a fila, {esgotadas} marcadas como erro")
+            return reenfileiradas
     
-    async def processar_pendentes(self):
-        """Processa todas as redações pendentes"""
-        db = SessionLocal()
+    async def processar_redacao(self, redacao_id: str):
+        """Processa uma redação reivindicada, respeitando o limite de concorrência"""
+        async with self.semaforo:
+            heartbeat = asyncio.create_task(
+                self._heartbeat(redacao_id, asyncio.current_task())
+            )
+            try:
+                async with SessionLocal() as db:
+                    redacao = await db.scalar(select(Redacao).where(Redacao.id == redacao_id))
+                    if redacao:
+                        await self.processar_redacao_pendente(redacao, db)
+            except asyncio.CancelledError:
+                # Worker parando (ou lease perdida): devolver se a lease ainda for nossa
+                await self._devolver_para_fila(redacao_id)
+                raise
+            finally:
+                heartbeat.cancel()
+    
+    async def processar_pendentes(self) -> int:
+        """
+        Reivindica um lote de redações pendentes (até o número de vagas livres)
+        e dispara o processamento concorrente de cada uma.
+        
+        Returns:
+            Quantidade de redações reivindicadas
+        """
+        vagas = self.concorrencia - len(self.em_andamento)
+        if vagas <= 0:
+            return 0
+        
         try:
-            # Buscar redações pendentes (ordenadas por data de submissão)
-            redacoes_pendentes = db.query(Redacao).filter(
-                Redacao.status == StatusRedacaoEnum.PENDENTE
-            ).order_by(Redacao.data_submissao.asc()).limit(1).all()  # Processar uma por vez
-            
-            if redacoes_pendentes:
-                for redacao in redacoes_pendentes:
-                    await self.processar_redacao_pendente(redacao, db)
-                    # Pequena pausa entre processamentos
-                    await asyncio.sleep(1)
+            redacao_ids = await self._reivindicar_lote(vagas)
         except Exception as e:
             logger.error(f"[WORKER] Erro ao processar pendentes: {str(e)}")
             logger.error(f"[WORKER] Traceback: {traceback.format_exc()}")
             print(f"[WORKER] Erro ao processar pendentes: {str(e)}")
             traceback.print_exc()
-        finally:
-            db.close()
+            return 0
+        
+        for redacao_id in redacao_ids:
+            tarefa = asyncio.create_task(self.processar_redacao(redacao_id))
+            self.em_andamento.add(tarefa)
+            tarefa.add_done_callback(self.em_andamento.discard)
+        
+        return len(redacao_ids)
+    
+    async def _aguardar_proxima_verificacao(self, reivindicadas: int, vagas: int):
+        """Decide quanto esperar antes de consultar a fila novamente"""
+        if vagas <= 0 and self.em_andamento:
+            # Todas as vagas ocupadas: acordar quando alguma análise terminar
+            await asyncio.wait(
+                self.em_andamento,
+                timeout=self.check_interval,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        elif reivindicadas < vagas or vagas <= 0:
+            # Fila esvaziada: aguardar NOTIFY de novas submissões
+            # (com poll de segurança para eventos perdidos e acordando
+            # a tempo da próxima redação agendada ficar elegível e da
+            # próxima verificação de leases)
+            await self.ouvinte.conectar()
+            espera = (
+                settings.WORKER_FALLBACK_POLL_INTERVAL if self.ouvinte.conectado
+                else self.check_interval
+            )
+            try:
+                proximo_agendamento = await self._segundos_ate_proximo_agendamento()
+            except Exception:
+                proximo_agendamento = None
+            if proximo_agendamento is not None:
+                espera = min(espera, proximo_agendamento)
+            espera = min(espera, settings.WORKER_REAPER_INTERVAL)
+            
+            if self.ouvinte.conectado:
+                await self.ouvinte.aguardar(espera)
+            else:
+                await asyncio.sleep(espera)
+        # Lote cheio: pode haver mais pendentes, verificar de novo imediatamente
     
     async def run(self):
         """Loop principal do worker"""
         self.running = True
-        logger.info("[WORKER] Worker iniciado")
-        print("[WORKER] Worker de processamento de redações iniciado")
+        logger.info(f"[WORKER] Worker iniciado (concorrencia={self.concorrencia})")
+        print(f"[WORKER] Worker de processamento de redações iniciado (concorrencia={self.concorrencia})")
         
         while self.running:
+            vagas = self.concorrencia - len(self.em_andamento)
+            reivindicadas = 0
             try:
-                await self.processar_pendentes()
+                if time.monotonic() - self.ultima_recuperacao >= settings.WORKER_REAPER_INTERVAL:
+                    self.ultima_recuperacao = time.monotonic()
+                    await self._recuperar_leases_expiradas()
+                    async with SessionLocal() as db:
+                        await gerenciador_idempotencia.expurgar_expiradas(db)
+                reivindicadas = await self.processar_pendentes()
             except Exception as e:
                 logger.error(f"[WORKER] Erro no loop do worker: {str(e)}")
                 print(f"[WORKER] Erro no loop do worker: {str(e)}")
             
             # Aguardar antes da próxima verificação
-            await asyncio.sleep(self.check_interval)
+            await self._aguardar_proxima_verificacao(reivindicadas, vagas)
     
     def start(self):
         """Inicia o worker em background"""
@@ -169,11 +474,39 @@ class RedacaoWorker:
             logger.info("[WORKER] Worker iniciado em background")
             print("[WORKER] Worker iniciado em background")
     
+    async def drenar(self, timeout: float):
+        """
+        Encerramento gracioso: para de reivindicar redações e aguarda as análises
+        em andamento por até `timeout` segundos. As que não terminarem a tempo
+        são canceladas e devolvidas à fila.
+        """
+        self.running = False
+        if self.task:
+            self.task.cancel()
+        
+        if self.em_andamento:
+            logger.info(f"[WORKER] Aguardando {len(self.em_andamento)} analise(s) em andamento...")
+            print(f"[WORKER] Aguardando {len(self.em_andamento)} analise(s) em andamento...")
+            await asyncio.wait(self.em_andamento, timeout=timeout)
+        
+        pendentes = list(self.em_andamento)
+        for tarefa in pendentes:
+            tarefa.cancel()
+        if pendentes:
+            await asyncio.gather(*pendentes, return_exceptions=True)
+        
+        self.ouvinte.desconectar()
+        logger.info("[WORKER] Worker parado")
+        print("[WORKER] Worker parado")
+    
     def stop(self):
         """Para o worker"""
         self.running = False
         if self.task:
             self.task.cancel()
+        for tarefa in list(self.em_andamento):
+            tarefa.cancel()
+        self.ouvinte.desconectar()
         logger.info("[WORKER] Worker parado")
         print("[WORKER] Worker parado")
 
@@ -0,0 +1,23 @@
+"""
+Utilitários de texto compartilhados pelos agentes e serviços
+"""
+
+import re
+from typing import List, Tuple
+
+
+def spans_paragrafos(texto: str) -> List[Tuple[int, int]]:
+    """
+    Retorna spans (inicio,fim) de parágrafos (1-based no frontend/agentes).
+    Considera parágrafos separados por linha em branco.
+    """
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    for m in re.finditer(r'\n\s*\n+', texto):
+        end = m.start()
+        if texto[start:end].strip():
+            spans.append((start, end))
+        start = m.end()
+    if texto[start:].strip():
+        spans.append((start, len(texto)))
+    return spans
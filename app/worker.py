@@ -0,0 +1,51 @@
+"""
+Socratis - Processo dedicado do worker de redações
+Uso: python -m app.worker
+
+Roda o RedacaoWorker fora da API, para escalar API e workers de forma independente.
+Em SIGTERM/SIGINT para de reivindicar redações e aguarda as análises em andamento.
+"""
+
+import asyncio
+import logging
+import signal
+
+from app.config import settings
+from app.services.redacao_worker import worker
+from app.services.processador_lotes import processador_lotes, lote_habilitado
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # Log no console
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """Inicia o worker e aguarda o sinal de encerramento"""
+    encerrar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sinal, encerrar.set)
+    
+    logger.info(f"[WORKER] Processo dedicado iniciado (modo: {settings.ENVIRONMENT})")
+    print(f"[WORKER] Processo dedicado iniciado (modo: {settings.ENVIRONMENT})")
+    worker.start()
+    if lote_habilitado():
+        processador_lotes.start()
+    
+    await encerrar.wait()
+    
+    logger.info("[WORKER] Sinal de encerramento recebido, drenando analises em andamento...")
+    print("[WORKER] Sinal de encerramento recebido, drenando analises em andamento...")
+    processador_lotes.stop()
+    await worker.drenar(settings.WORKER_DRAIN_TIMEOUT)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -50,6 +50,64 @@ CREATE TABLE IF NOT EXISTS analises (
     data_analise TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
 );
 
+-- Cota diária: dia (UTC) a que se refere o contador de correções
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS data_contador DATE;
+
+-- Fila de redações: agendamento (ex.: aguardando reset da cota diária)
+ALTER TABLE redacoes ADD COLUMN IF NOT EXISTS agendado_para TIMESTAMP;
+CREATE INDEX IF NOT EXISTS ix_redacoes_agendado_para ON redacoes(agendado_para);
+
+-- Fila de redações: lease do worker (recuperação de redações presas em ANALISANDO)
+ALTER TABLE redacoes ADD COLUMN IF NOT EXISTS processado_por VARCHAR(255);
+ALTER TABLE redacoes ADD COLUMN IF NOT EXISTS lease_expira_em TIMESTAMP;
+ALTER TABLE redacoes ADD COLUMN IF NOT EXISTS tentativas INTEGER DEFAULT 0 NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_redacoes_lease_expira_em ON redacoes(lease_expira_em);
+
+-- Processamento em lote (Batch API) das redações B2B
+CREATE TABLE IF NOT EXISTS lotes_analise (
+    id VARCHAR(255) PRIMARY KEY,
+    provider_batch_id VARCHAR(255),
+    fase VARCHAR(50) NOT NULL DEFAULT 'etapas',
+    status VARCHAR(50) NOT NULL DEFAULT 'enviado',
+    redacao_ids JSON NOT NULL,
+    resultados JSON NOT NULL,
+    tokens_utilizados JSON NOT NULL,
+    data_criacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_lotes_analise_status ON lotes_analise(status);
+ALTER TABLE redacoes ADD COLUMN IF NOT EXISTS lote_id VARCHAR(255) REFERENCES lotes_analise(id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS ix_redacoes_lote_id ON redacoes(lote_id);
+ALTER TABLE lotes_analise ADD COLUMN IF NOT EXISTS enviando_desde TIMESTAMP;
+ALTER TABLE lotes_analise ADD COLUMN IF NOT EXISTS dia_cota DATE;
+
+-- Revisões: redação anterior da qual esta é uma nova versão (reanálise incremental)
+ALTER TABLE redacoes ADD COLUMN IF NOT EXISTS revisao_de VARCHAR(36) REFERENCES redacoes(id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS ix_redacoes_revisao_de ON redacoes(revisao_de);
+
+-- Idempotency-Key: respostas das submissões guardadas por chave do cliente
+CREATE TABLE IF NOT EXISTS chaves_idempotencia (
+    id VARCHAR(255) PRIMARY KEY,
+    usuario_id VARCHAR(36) NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    rota VARCHAR(255) NOT NULL,
+    chave VARCHAR(255) NOT NULL,
+    impressao VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    resposta JSON,
+    data_criacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expira_em TIMESTAMP NOT NULL,
+    CONSTRAINT uq_chaves_idempotencia_usuario_rota_chave UNIQUE (usuario_id, rota, chave)
+);
+CREATE INDEX IF NOT EXISTS ix_chaves_idempotencia_expira_em ON chaves_idempotencia(expira_em);
+
+-- Limite de taxa do LLM: baldes de RPM/TPM compartilhados por API e workers
+CREATE TABLE IF NOT EXISTS baldes_taxa_llm (
+    chave VARCHAR(255) PRIMARY KEY,
+    requisicoes DOUBLE PRECISION NOT NULL,
+    tokens DOUBLE PRECISION NOT NULL,
+    atualizado_em DOUBLE PRECISION NOT NULL
+);
+
 -- Criar tabela de versões do Alembic
 CREATE TABLE IF NOT EXISTS alembic_version (
     version_num VARCHAR(32) NOT NULL PRIMARY KEY
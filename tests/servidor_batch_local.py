@@ -0,0 +1,210 @@
+"""
+Servidor local que imita o Batch API da OpenAI (arquivos e batches)
+
+Usado pelos testes do processador de lotes e para testes manuais:
+    python -m tests.servidor_batch_local 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 BATCH_ENABLED=true python -m app.worker
+
+Um batch fica "in_progress" na primeira consulta e "completed" na seguinte; o arquivo de
+saída é gerado pelo `responder`, que recebe o custom_id e o corpo da requisição e devolve
+o JSON que o modelo teria respondido (ou None para uma linha com erro).
+"""
+
+import json
+import sys
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+Responder = Callable[[str, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+# Respostas válidas de cada agente (nome da etapa = sufixo do custom_id)
+RESPOSTAS_PADRAO: Dict[str, Dict[str, Any]] = {
+    "gramatical": {"nota": 8.0, "erros": [], "total_erros": 0, "feedback_geral": "Boa gramática."},
+    "logica": {
+        "nota": 7.5, "tese_clara": True, "problemas": [],
+        "profundidade_argumentacao": "boa", "feedback_geral": "Argumentação consistente."
+    },
+    "estrutural": {
+        "nota": 8.0, "estrutura_adequada": True, "tem_introducao": True,
+        "tem_desenvolvimento": True, "tem_conclusao": True, "problemas": [],
+        "feedback_geral": "Estrutura adequada."
+    },
+    "repertorio": {"citacoes_identificadas": [], "uso_adequado": True, "feedback": "Repertório pertinente."},
+    "reescrita": {"reescritas": []},
+    "socratico": {"perguntas": []},
+    "avaliacao": {
+        "nota_geral": 7.8, "feedback_geral": "Boa redação.",
+        "pontos_fortes": ["clareza"], "pontos_fracos": [], "sugestoes_melhoria": []
+    },
+}
+
+
+def responder_padrao(custom_id: str, corpo: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return RESPOSTAS_PADRAO.get(custom_id.rpartition(":")[2])
+
+
+class ServidorBatchLocal:
+    """Estado do servidor: arquivos enviados, batches e quantas vezes cada batch foi consultado"""
+
+    def __init__(self, responder: Responder = responder_padrao, porta: int = 0):
+        self.responder = responder
+        self.arquivos: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.consultas: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.http = ThreadingHTTPServer(("127.0.0.1", porta), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.http.server_address[1]}/v1"
+
+    def __enter__(self) -> "ServidorBatchLocal":
+        self.thread = threading.Thread(target=self.http.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *erro):
+        self.http.shutdown()
+        self.http.server_close()
+
+    # === Objetos no formato da API ===
+
+    def _novo_arquivo(self, nome: str, proposito: str, conteudo: bytes) -> Dict[str, Any]:
+        arquivo = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(conteudo),
+            "created_at": int(time.time()),
+            "filename": nome,
+            "purpose": proposito,
+            "status": "processed",
+        }
+        self.arquivos[arquivo["id"]] = {"objeto": arquivo, "conteudo": conteudo}
+        return arquivo
+
+    def _novo_batch(self, dados: Dict[str, Any]) -> Dict[str, Any]:
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": dados["endpoint"],
+            "input_file_id": dados["input_file_id"],
+            "completion_window": dados["completion_window"],
+            "created_at": int(time.time()),
+            "status": "validating",
+            "output_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self.batches[batch["id"]] = batch
+        self.consultas[batch["id"]] = 0
+        return batch
+
+    def _concluir(self, batch: Dict[str, Any]):
+        """Roda o responder para cada linha de entrada e grava o arquivo de saída"""
+        entrada = self.arquivos[batch["input_file_id"]]["conteudo"].decode("utf-8")
+        saida, falhas, total = [], 0, 0
+        for linha in entrada.splitlines():
+            if not linha.strip():
+                continue
+            total += 1
+            item = json.loads(linha)
+            dados = self.responder(item["custom_id"], item["body"])
+            if dados is None:
+                falhas += 1
+                resposta = {"status_code": 500, "body": {"error": {"message": "falha simulada"}}}
+            else:
+                resposta = {"status_code": 200, "body": {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(dados)}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                }}
+            saida.append(json.dumps({"id": f"req_{uuid.uuid4().hex}", "custom_id": item["custom_id"], "response": resposta}))
+        arquivo = self._novo_arquivo("saida.jsonl", "batch_output", ("\n".join(saida) + "\n").encode("utf-8"))
+        batch.update(
+            status="completed",
+            output_file_id=arquivo["id"],
+            request_counts={"total": total, "completed": total - falhas, "failed": falhas},
+        )
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, dados: Dict[str, Any]):
+                corpo = json.dumps(dados).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def _corpo(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def do_POST(self):
+                with servidor.lock:
+                    if self.path == "/v1/files":
+                        # multipart/form-data: campos "purpose" e "file"
+                        cabecalho = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                        mensagem = BytesParser(policy=HTTP).parsebytes(cabecalho + self._corpo())
+                        campos = {parte.get_param("name", header="content-disposition"): parte for parte in mensagem.iter_parts()}
+                        arquivo = servidor._novo_arquivo(
+                            campos["file"].get_filename() or "entrada.jsonl",
+                            campos["purpose"].get_content().strip(),
+                            campos["file"].get_payload(decode=True)
+                        )
+                        return self._json(200, arquivo)
+                    if self.path == "/v1/batches":
+                        return self._json(200, servidor._novo_batch(json.loads(self._corpo())))
+                    if self.path.startswith("/v1/batches/") and self.path.endswith("/cancel"):
+                        batch = servidor.batches.get(self.path.split("/")[3])
+                        if batch is None:
+                            return self._json(404, {"error": {"message": "batch não encontrado"}})
+                        if batch["status"] != "completed":
+                            batch["status"] = "cancelled"
+                        return self._json(200, batch)
+                return self._json(404, {"error": {"message": "rota não encontrada"}})
+
+            def do_GET(self):
+                with servidor.lock:
+                    partes = self.path.split("/")
+                    if self.path.startswith("/v1/batches/"):
+                        batch = servidor.batches.get(partes[3])
+                        if batch is None:
+                            return self._json(404, {"error": {"message": "batch não encontrado"}})
+                        servidor.consultas[batch["id"]] += 1
+                        if batch["status"] == "validating":
+                            batch["status"] = "in_progress"
+                        elif batch["status"] == "in_progress":
+                            servidor._concluir(batch)
+                        return self._json(200, batch)
+                    if self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+                        arquivo = servidor.arquivos.get(partes[3])
+                        if arquivo is None:
+                            return self._json(404, {"error": {"message": "arquivo não encontrado"}})
+                        self.send_response(200)
+                        self.send_header("Content-Type", "application/octet-stream")
+                        self.send_header("Content-Length", str(len(arquivo["conteudo"])))
+                        self.end_headers()
+                        self.wfile.write(arquivo["conteudo"])
+                        return
+                return self._json(404, {"error": {"message": "rota não encontrada"}})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    servidor = ServidorBatchLocal(porta=porta)
+    print(f"Servidor Batch local em {servidor.base_url}")
+    try:
+        servidor.http.serve_forever()
+    except KeyboardInterrupt:
+        pass
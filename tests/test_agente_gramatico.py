@@ -0,0 +1,80 @@
+"""
+Gramático em fatias: histórico próprio no orçamento adaptativo e relação com o painel combinado
+"""
+
+import asyncio
+
+from app.agents import agente_gramatico
+from app.agents.agente_gramatico import AgenteGramatico
+from app.agents.orquestrador import orquestrador
+from app.config import settings
+from app.models.usuario import PlanoEnum
+from app.services.cache_paragrafos import CacheParagrafosGramatica
+from app.services.llm_cache import LLMCache
+from app.services.orcamento_tokens import OrcamentoSaida
+
+PARAGRAFO = "A educação pública precisa de mais investimento e de professores valorizados. " * 6
+TEXTO = "\n\n".join([PARAGRAFO] * 4)
+
+
+class LLMFalso:
+    """Responde uma análise sem erros e registra o max_tokens de cada chamada"""
+
+    def __init__(self):
+        self.max_tokens = []
+
+    async def generate(self, max_tokens, **parametros):
+        self.max_tokens.append(max_tokens)
+        return {
+            "content": {"nota": 10.0, "erros": [], "total_erros": 0, "feedback_geral": "Sem erros."},
+            "completion_tokens": 300,
+        }
+
+
+def test_fatias_nao_reduzem_orcamento_do_texto_inteiro(monkeypatch):
+    orcamento = OrcamentoSaida(janela=50, percentil=0.99, margem=1.25, minimo=256, amostras_minimas=1)
+    monkeypatch.setattr("app.agents.base_agent.orcamento_saida", orcamento)
+    monkeypatch.setattr(agente_gramatico, "cache_paragrafos_gramatica", None)
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_BUDGET_ENABLED", True)
+    monkeypatch.setattr(settings, "GRAMMAR_SHARDING_ENABLED", True)
+    monkeypatch.setattr(settings, "GRAMMAR_SHARDING_MIN_TEXT_CHARS", 1000)
+
+    agente = AgenteGramatico()
+    agente.llm_service = LLMFalso()
+    asyncio.run(agente.analisar(TEXTO, "Tema", {}))
+
+    estatisticas = orcamento.estatisticas()
+    assert "gramatico" not in estatisticas
+    assert estatisticas["gramatico_fatia"]["amostras"] == 4
+    # O texto inteiro continua com o teto do agente
+    assert orcamento.sugerir("gramatico", agente._config_llm()["max_tokens"]) == agente._config_llm()["max_tokens"]
+
+
+def test_painel_free_deixa_gramatico_no_caminho_proprio(monkeypatch, tmp_path):
+    cache = CacheParagrafosGramatica(LLMCache(
+        caminho=str(tmp_path / "paragrafos.sqlite3"), ttl_segundos=3600,
+        max_entradas_memoria=100, max_bytes_disco=1024 * 1024
+    ))
+    monkeypatch.setattr(agente_gramatico, "cache_paragrafos_gramatica", cache)
+    monkeypatch.setattr(settings, "PAINEL_COMBINADO_PLANOS", ["free"])
+    monkeypatch.setattr(settings, "GRAMMAR_SHARDING_ENABLED", True)
+    monkeypatch.setattr(settings, "GRAMMAR_SHARDING_MIN_TEXT_CHARS", 1000)
+    curto = "\n\n".join([PARAGRAFO, "Por isso, o Estado deve agir."])
+
+    async def cenario():
+        etapas = orquestrador._montar_etapas(PlanoEnum.FREE)
+        longo = await orquestrador._combinar_etapas(etapas, PlanoEnum.FREE, TEXTO)
+        antes = await orquestrador._combinar_etapas(etapas, PlanoEnum.FREE, curto)
+
+        # Parte gramatical do painel vai para o cache de parágrafos
+        await antes["painel"].etapas["gramatical"].guardar_parte_combinada(
+            curto, agente_gramatico.AnaliseGramatical(nota=10.0, erros=[], total_erros=0, feedback_geral="Sem erros.")
+        )
+        depois = await orquestrador._combinar_etapas(etapas, PlanoEnum.FREE, curto)
+        return longo, antes, depois
+
+    longo, antes, depois = asyncio.run(cenario())
+    assert "painel" not in longo
+    assert set(antes["painel"].etapas) == {"gramatical", "avaliacao"}
+    # Tudo no cache: o Gramático não chama o LLM, então não entra no painel
+    assert "painel" not in depois
@@ -0,0 +1,71 @@
+"""
+Coalescimento: chave com todas as entradas da análise e cancelamento quando ninguém mais espera
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.coalescimento import CoalescedorAnalises
+
+
+def test_chave_considera_referencias_e_revisao():
+    base = CoalescedorAnalises.gerar_chave("texto", "tema", "enem", "premium")
+    assert base == CoalescedorAnalises.gerar_chave("texto", "tema", "enem", "premium", [], None)
+    assert base != CoalescedorAnalises.gerar_chave("texto", "tema", "enem", "premium", ["Bauman"])
+    assert base != CoalescedorAnalises.gerar_chave(
+        "texto", "tema", "enem", "premium", base_revisao=("texto anterior", "{}")
+    )
+
+
+def test_execucao_cancelada_quando_todos_desistem():
+    async def cenario():
+        coalescedor = CoalescedorAnalises()
+        iniciou, cancelada = asyncio.Event(), asyncio.Event()
+
+        async def analisar():
+            iniciou.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelada.set()
+                raise
+
+        pedidos = [asyncio.create_task(coalescedor.executar("chave", analisar)) for _ in range(2)]
+        await iniciou.wait()
+
+        pedidos[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelada.is_set()  # Ainda há quem espere o resultado
+
+        pedidos[1].cancel()
+        await asyncio.wait_for(cancelada.wait(), 1)
+        for pedido in pedidos:
+            with pytest.raises(asyncio.CancelledError):
+                await pedido
+        return coalescedor.estatisticas()
+
+    estatisticas = asyncio.run(cenario())
+    assert estatisticas["em_andamento"] == 0
+
+
+def test_pedido_restante_recebe_o_resultado():
+    async def cenario():
+        coalescedor = CoalescedorAnalises()
+        liberar = asyncio.Event()
+
+        async def analisar():
+            await liberar.wait()
+            return "analise"
+
+        primeiro = asyncio.create_task(coalescedor.executar("chave", analisar))
+        segundo = asyncio.create_task(coalescedor.executar("chave", analisar))
+        await asyncio.sleep(0.01)
+        primeiro.cancel()
+        liberar.set()
+        return await segundo, coalescedor.execucoes
+
+    (resultado, compartilhado), execucoes = asyncio.run(cenario())
+    assert resultado == "analise"
+    assert compartilhado is True
+    assert execucoes == 1
@@ -0,0 +1,86 @@
+"""
+Controle de admissão: a profundidade da fila conta só o que o worker atenderia agora
+e as vagas síncronas sempre voltam
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.agents.orquestrador import orquestrador
+from app.config import settings
+from app.database import SessionLocal
+from app.models.redacao import Redacao, StatusRedacaoEnum
+from app.models.usuario import PlanoEnum
+from app.routers import analise as rotas_analise
+from app.schemas.redacao import RedacaoSubmit
+from app.schemas.usuario import TokenData
+from app.services.controle_admissao import ControleAdmissao, controle_admissao
+from tests.conftest import analise_falsa, nova_redacao, novo_usuario, rodar
+
+
+def _controle(profundidade_maxima: int) -> ControleAdmissao:
+    return ControleAdmissao(
+        limites_sincronos={},
+        profundidade_maxima=profundidade_maxima,
+        janela_vazao=60,
+        retry_maximo=60,
+        tempo_padrao=30.0
+    )
+
+
+def test_fila_ignora_estacionadas_e_lote(banco, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_ENABLED", True)
+
+    async def cenario():
+        async with SessionLocal() as db:
+            aluno = novo_usuario()
+            escola = novo_usuario(plano=PlanoEnum.B2B)
+            db.add_all([aluno, escola])
+            await db.flush()
+            db.add_all([
+                nova_redacao(aluno.id),
+                # Estacionada por cota até amanhã
+                nova_redacao(aluno.id, agendado_para=datetime.utcnow() + timedelta(hours=6)),
+                # Reservada ao processamento em lote
+                nova_redacao(escola.id),
+                nova_redacao(escola.id),
+            ])
+            await db.commit()
+
+        async with SessionLocal() as db:
+            await _controle(2).verificar_fila(db)
+            with pytest.raises(HTTPException) as recusa:
+                await _controle(1).verificar_fila(db)
+        return recusa.value
+
+    recusa = rodar(cenario())
+    assert recusa.status_code == 503
+    assert "Retry-After" in recusa.headers
+
+
+def test_stream_nao_lido_libera_vaga_e_conclui(banco, monkeypatch):
+    """Resposta SSE nunca consumida (cliente caiu antes): a análise roda e a vaga volta"""
+    async def analisar(redacao, plano_usuario, redacao_id, **kwargs):
+        return analise_falsa(redacao_id)
+    monkeypatch.setattr(orquestrador, "analisar_redacao", analisar)
+
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario()
+            db.add(usuario)
+            await db.commit()
+
+        submissao = RedacaoSubmit(titulo="Título", texto="Texto da redação de teste. " * 10, tema="Tema")
+        async with SessionLocal() as db:
+            await rotas_analise.analisar_redacao_stream(submissao, TokenData(usuario_id=usuario.id), db)
+        await asyncio.gather(*rotas_analise._analises_em_andamento)
+
+        async with SessionLocal() as db:
+            return await db.scalar(select(Redacao.status))
+
+    assert rodar(cenario()) == StatusRedacaoEnum.CONCLUIDA
+    assert controle_admissao.em_andamento[PlanoEnum.FREE.value] == 0
@@ -0,0 +1,135 @@
+"""
+Cota diária: reserva condicional (troca de dia e incremento no mesmo UPDATE) e devolução
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.agents.orquestrador import orquestrador
+from app.database import SessionLocal
+from app.models.redacao import Redacao, StatusRedacaoEnum
+from app.models.usuario import Usuario
+from app.routers.usuario import get_usuario_atual
+from app.schemas.usuario import TokenData
+from app.services.cota_service import correcoes_hoje, reservar_cota_diaria
+from app.services.redacao_worker import worker
+from tests.conftest import analise_falsa, nova_redacao, novo_usuario, rodar
+
+
+def _ontem():
+    return datetime.utcnow().date() - timedelta(days=1)
+
+
+def test_reserva_recomeca_no_dia_seguinte(banco):
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario(correcoes_realizadas_hoje=5, data_contador=_ontem())
+            db.add(usuario)
+            await db.commit()
+
+            assert correcoes_hoje(usuario) == 0
+            assert await reservar_cota_diaria(db, usuario.id) == datetime.utcnow().date()
+            await db.commit()
+            assert await reservar_cota_diaria(db, usuario.id)
+            await db.commit()
+
+            return (await db.execute(
+                select(Usuario.correcoes_realizadas_hoje, Usuario.data_contador).where(Usuario.id == usuario.id)
+            )).one()
+
+    correcoes, data_contador = rodar(cenario())
+    assert correcoes == 2
+    assert data_contador == datetime.utcnow().date()
+
+
+def test_reservas_simultaneas_nao_passam_do_limite(banco):
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario(correcoes_realizadas_hoje=1, limite_diario=3, data_contador=datetime.utcnow().date())
+            db.add(usuario)
+            await db.commit()
+
+        async def reservar():
+            async with SessionLocal() as db:
+                dia = await reservar_cota_diaria(db, usuario.id)
+                await asyncio.sleep(0.05)  # Segura o lock da linha enquanto as outras tentam
+                await db.commit()
+                return dia
+
+        reservas = await asyncio.gather(*[reservar() for _ in range(5)])
+        async with SessionLocal() as db:
+            return reservas, await db.scalar(select(Usuario.correcoes_realizadas_hoje))
+
+    reservas, correcoes = rodar(cenario())
+    assert sum(1 for dia in reservas if dia) == 2
+    assert correcoes == 3
+
+
+def test_falha_na_analise_devolve_a_cota(banco, monkeypatch):
+    async def analisar(redacao, plano_usuario, redacao_id, **kwargs):
+        raise RuntimeError("provider fora do ar")
+    monkeypatch.setattr(orquestrador, "analisar_redacao", analisar)
+
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario(correcoes_realizadas_hoje=2, data_contador=datetime.utcnow().date())
+            db.add(usuario)
+            await db.flush()
+            redacao = nova_redacao(usuario.id, status=StatusRedacaoEnum.ANALISANDO, processado_por=worker.worker_id)
+            db.add(redacao)
+            await db.commit()
+
+            await worker.processar_redacao_pendente(redacao, db)
+
+            return (
+                await db.scalar(select(Usuario.correcoes_realizadas_hoje)),
+                await db.scalar(select(Redacao.status))
+            )
+
+    correcoes, status = rodar(cenario())
+    assert status == StatusRedacaoEnum.ERRO
+    assert correcoes == 2
+
+
+def test_worker_conta_do_zero_apos_virada_do_dia(banco, monkeypatch):
+    async def analisar(redacao, plano_usuario, redacao_id, **kwargs):
+        return analise_falsa(redacao_id)
+    monkeypatch.setattr(orquestrador, "analisar_redacao", analisar)
+
+    async def cenario():
+        async with SessionLocal() as db:
+            # Usuário que terminou ontem no limite
+            usuario = novo_usuario(correcoes_realizadas_hoje=5, limite_diario=5, data_contador=_ontem())
+            db.add(usuario)
+            await db.flush()
+            redacao = nova_redacao(usuario.id, status=StatusRedacaoEnum.ANALISANDO, processado_por=worker.worker_id)
+            db.add(redacao)
+            await db.commit()
+
+            await worker.processar_redacao_pendente(redacao, db)
+
+            correcoes, data_contador = (await db.execute(
+                select(Usuario.correcoes_realizadas_hoje, Usuario.data_contador).where(Usuario.id == usuario.id)
+            )).one()
+            status = await db.scalar(select(Redacao.status).where(Redacao.id == redacao.id))
+            return correcoes, data_contador, status
+
+    correcoes, data_contador, status = rodar(cenario())
+    assert status == StatusRedacaoEnum.CONCLUIDA
+    assert correcoes == 1
+    assert data_contador == datetime.utcnow().date()
+
+
+def test_perfil_mostra_contador_do_dia(banco):
+    """Contador de ontem no limite: o perfil mostra zero correções hoje"""
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario(correcoes_realizadas_hoje=5, limite_diario=5, data_contador=_ontem())
+            db.add(usuario)
+            await db.commit()
+            return await get_usuario_atual(TokenData(usuario_id=usuario.id), db)
+
+    perfil = rodar(cenario())
+    assert perfil.correcoes_realizadas_hoje == 0
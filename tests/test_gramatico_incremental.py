@@ -0,0 +1,98 @@
+"""
+Reanálise gramatical de revisões: só o que é de parágrafos inalterados é reaproveitado
+"""
+
+import asyncio
+
+from app.agents.gramatico_incremental import GramaticoIncremental
+from app.agents.orquestrador import orquestrador
+from app.schemas.redacao import AnaliseGramatical, ErroGramatical
+
+ANTERIOR = (
+    "A educação é a base de tudo. Porém a gente sabe que falta investimento.\n\n"
+    "Sendo assim, haviam muitos problemas nas escolas.\n\n"
+    "Concluindo, é preciso agir."
+)
+REVISAO = (
+    "A educação é a base de tudo. Porém a gente sabe que falta investimento.\n\n"
+    "Por isso, existiam muitos problemas nas escolas públicas.\n\n"
+    "Concluindo, é preciso agir."
+)
+
+
+class GramaticoFalso:
+    """Devolve uma análise fixa dos trechos alterados, com posições relativas a eles"""
+    nome = "Gramático"
+
+    def __init__(self, parcial: AnaliseGramatical):
+        self.parcial = parcial
+        self.recebido = None
+
+    async def analisar(self, texto, tema, contexto, ao_receber_item=None):
+        self.recebido = texto
+        return self.parcial
+
+
+def _anterior() -> AnaliseGramatical:
+    inicio = ANTERIOR.index("haviam")
+    return AnaliseGramatical(
+        nota=7.0,
+        erros=[ErroGramatical(
+            trecho="haviam", tipo="concordância", explicacao="impessoal", sugestao="havia", regra="haver",
+            posicao_inicio=inicio, posicao_fim=inicio + len("haviam")
+        )],
+        total_erros=1,
+        vicios_linguagem=["Uso de 'a gente' no 1º parágrafo", "Uso de 'sendo assim'", "Repetição de palavras"],
+        feedback_geral=(
+            "Bom domínio da norma. No parágrafo 2 há erro de concordância com 'haviam'. "
+            "Evite 'a gente' no parágrafo 1."
+        )
+    )
+
+
+def _analisar(parcial: AnaliseGramatical):
+    gramatico = GramaticoFalso(parcial)
+    diff = orquestrador.diff_paragrafos(ANTERIOR, REVISAO)
+    incremental = GramaticoIncremental(gramatico, diff, _anterior())
+    return asyncio.run(incremental.analisar(REVISAO, "Tema", {})), gramatico
+
+
+def test_so_reaproveita_o_que_e_de_paragrafos_inalterados():
+    parcial = AnaliseGramatical(
+        nota=8.0,
+        erros=[
+            ErroGramatical(trecho="existiam", tipo="estilo", explicacao="x", sugestao="havia", regra="r",
+                           posicao_inicio=10, posicao_fim=18),
+            ErroGramatical(trecho="trecho inventado", tipo="estilo", explicacao="x", sugestao="y", regra="r",
+                           posicao_inicio=0, posicao_fim=16),
+        ],
+        total_erros=2,
+        vicios_linguagem=["Uso de 'por isso' no parágrafo 1"],
+        feedback_geral="O parágrafo 1 melhorou."
+    )
+    analise, gramatico = _analisar(parcial)
+
+    assert gramatico.recebido == "Por isso, existiam muitos problemas nas escolas públicas."
+
+    # Erro do parágrafo reescrito some; os novos ficam posicionados na revisão ou sem posição
+    posicoes = {erro.trecho: (erro.posicao_inicio, erro.posicao_fim) for erro in analise.erros}
+    assert "haviam" not in posicoes
+    inicio = REVISAO.index("existiam")
+    assert posicoes["existiam"] == (inicio, inicio + len("existiam"))
+    assert posicoes["trecho inventado"] == (None, None)
+
+    # Vícios: os do parágrafo inalterado ficam; o do reescrito e o genérico saem
+    assert analise.vicios_linguagem == ["Uso de 'a gente' no 1º parágrafo", "Uso de 'por isso' no parágrafo 2"]
+
+    # Feedback: frases ligadas ao parágrafo inalterado + feedback dos trechos, na numeração da revisão
+    assert analise.feedback_geral == "Evite 'a gente' no parágrafo 1. O parágrafo 2 melhorou."
+
+
+def test_sem_alteracoes_mantem_a_analise_anterior():
+    diff = orquestrador.diff_paragrafos(ANTERIOR, ANTERIOR)
+    incremental = GramaticoIncremental(GramaticoFalso(None), diff, _anterior())
+    analise = asyncio.run(incremental.analisar(ANTERIOR, "Tema", {}))
+    anterior = _anterior()
+    assert analise.vicios_linguagem == anterior.vicios_linguagem
+    assert analise.feedback_geral == anterior.feedback_geral
+    assert [erro.trecho for erro in analise.erros] == ["haviam"]
@@ -0,0 +1,79 @@
+"""
+Idempotency-Key: resposta gravada no mesmo commit da redação e trava das rotas demoradas
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+
+from app.database import SessionLocal
+from app.models.chave_idempotencia import ChaveIdempotencia
+from app.models.redacao import Redacao
+from app.routers import redacao as rotas_redacao
+from app.schemas.redacao import RedacaoSubmit
+from app.schemas.usuario import TokenData
+from app.services.idempotencia import gerenciador_idempotencia
+from tests.conftest import novo_usuario, rodar
+
+
+def _submissao() -> RedacaoSubmit:
+    return RedacaoSubmit(titulo="Título", texto="Texto da redação de teste. " * 10, tema="Tema")
+
+
+def test_queda_ao_gravar_resposta_nao_duplica(banco, monkeypatch):
+    """Queda ao gravar a resposta: a redação não fica sem a resposta e a retentativa cria uma só"""
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario()
+            db.add(usuario)
+            await db.commit()
+        token = TokenData(usuario_id=usuario.id)
+
+        async with SessionLocal() as db:
+            commit = db.commit
+
+            async def commit_que_cai():
+                # Cai justamente no commit que grava a resposta idempotente
+                if await db.scalar(select(ChaveIdempotencia.status_code)) is not None:
+                    raise ConnectionError("conexão perdida")
+                await commit()
+            monkeypatch.setattr(db, "commit", commit_que_cai)
+            with pytest.raises(ConnectionError):
+                await rotas_redacao.submeter_redacao(_submissao(), "chave-1", token, db)
+
+        async with SessionLocal() as db:
+            primeira = await rotas_redacao.submeter_redacao(_submissao(), "chave-1", token, db)
+        async with SessionLocal() as db:
+            repetida = await rotas_redacao.submeter_redacao(_submissao(), "chave-1", token, db)
+            total = await db.scalar(select(func.count(Redacao.id)))
+        return primeira, repetida, total
+
+    primeira, repetida, total = rodar(cenario())
+    assert total == 1
+    assert repetida.headers["Idempotent-Replayed"] == "true"
+    assert primeira.id.encode() in repetida.body
+
+
+def test_trava_maior_para_rotas_demoradas(banco):
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario()
+            db.add(usuario)
+            await db.commit()
+            assert await gerenciador_idempotencia.iniciar(db, usuario.id, "POST /x", "k", {"a": 1}) is None
+            # A requisição original começou há 400s e ainda não respondeu
+            await db.execute(
+                update(ChaveIdempotencia).values(data_criacao=datetime.utcnow() - timedelta(seconds=400))
+            )
+            await db.commit()
+
+            with pytest.raises(HTTPException) as em_andamento:
+                await gerenciador_idempotencia.iniciar(db, usuario.id, "POST /x", "k", {"a": 1}, trava_segundos=900)
+            assumida = await gerenciador_idempotencia.iniciar(db, usuario.id, "POST /x", "k", {"a": 1})
+        return em_andamento.value.status_code, assumida
+
+    status_code, assumida = rodar(cenario())
+    assert status_code == 409
+    assert assumida is None
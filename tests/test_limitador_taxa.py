@@ -0,0 +1,72 @@
+"""
+Limitador de taxa: o balde no Postgres é o mesmo para todos os processos
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.llm_rate_limiter import LimitadorTaxa
+from app.services.llm_resilience import ErroLLM
+from app.services.llm_service import LLMService
+from tests.conftest import rodar
+
+
+def test_balde_compartilhado_entre_instancias(banco):
+    """Duas instâncias (como dois containers) consomem do mesmo balde"""
+    async def cenario():
+        api = LimitadorTaxa(rpm=2, tpm=100000)
+        worker = LimitadorTaxa(rpm=2, tpm=100000)
+        primeiras = [
+            await api._tentar_consumir("openai:gpt:a", 10),
+            await worker._tentar_consumir("openai:gpt:a", 10),
+        ]
+        terceira = await api._tentar_consumir("openai:gpt:a", 10)
+        outra_chave = await worker._tentar_consumir("openai:gpt:b", 10)
+        return primeiras, terceira, outra_chave
+
+    primeiras, terceira, outra_chave = rodar(cenario())
+    assert primeiras == [0.0, 0.0]
+    assert terceira > 0  # Sem saldo: ~30s até a próxima requisição (2 RPM)
+    assert outra_chave == 0.0
+
+
+def test_consumo_concorrente_nao_passa_da_capacidade(banco):
+    async def cenario():
+        limitadores = [LimitadorTaxa(rpm=5, tpm=100000) for _ in range(4)]
+        esperas = await asyncio.gather(*[
+            limitador._tentar_consumir("openai:gpt:a", 10)
+            for limitador in limitadores for _ in range(3)
+        ])
+        return sum(1 for espera in esperas if espera == 0)
+
+    assert rodar(cenario()) == 5
+
+
+def test_reconciliar_cobra_tokens_reais(banco):
+    async def cenario():
+        limitador = LimitadorTaxa(rpm=100, tpm=1000)
+        await limitador._tentar_consumir("k", 100)
+        await limitador.reconciliar("k", 100, 900)  # Gastou 800 a mais que o estimado
+        return await limitador._tentar_consumir("k", 200)
+
+    assert rodar(cenario()) > 0
+
+
+def test_chamada_recusada_devolve_tokens(banco, monkeypatch):
+    """429 do provider: os tokens reservados voltam ao balde antes do failover"""
+    async def cenario():
+        servico = LLMService()
+        servico.limitador = LimitadorTaxa(rpm=100, tpm=1000)
+
+        async def recusar(*args, **kwargs):
+            raise ErroLLM("limite da chave", retentavel=True, status=429)
+        monkeypatch.setattr(servico, "_generate_openai", recusar)
+
+        rota = ("openai", "gpt-teste")
+        with pytest.raises(ErroLLM):
+            await servico._chamar_rota(rota, "sistema", "usuario", 0.3, 500, True)
+        chave = f"openai:gpt-teste:{servico._pool(rota).chaves[0].nome}"
+        return await servico.limitador._tentar_consumir(chave, 1000)
+
+    assert rodar(cenario()) == 0.0
@@ -0,0 +1,180 @@
+"""
+Processador de lotes B2B contra o servidor Batch local: envio, acompanhamento, download e gravação
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.analise import Analise
+from app.models.lote_analise import FaseLoteEnum, LoteAnalise, StatusLoteEnum
+from app.models.redacao import Redacao, StatusRedacaoEnum
+from app.models.usuario import PlanoEnum, Usuario
+from app.services.cota_service import proximo_reset_cota
+from app.services.processador_lotes import ProcessadorLotes
+from tests.conftest import nova_redacao, novo_usuario, rodar
+from tests.servidor_batch_local import ServidorBatchLocal, responder_padrao
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    with ServidorBatchLocal() as servidor:
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", servidor.base_url)
+        monkeypatch.setattr(settings, "BATCH_ENABLED", True)
+        monkeypatch.setattr(settings, "BATCH_MIN_ESSAYS", 1)
+        yield servidor
+
+
+async def _usuario_b2b_com_redacoes(quantidade: int):
+    async with SessionLocal() as db:
+        usuario = novo_usuario(
+            plano=PlanoEnum.B2B,
+            limite_diario=100,
+            correcoes_realizadas_hoje=7,
+            data_contador=datetime.utcnow().date() - timedelta(days=1)
+        )
+        db.add(usuario)
+        await db.flush()
+        redacoes = [nova_redacao(usuario.id) for _ in range(quantidade)]
+        db.add_all(redacoes)
+        await db.commit()
+        return usuario.id, [redacao.id for redacao in redacoes]
+
+
+def test_ciclo_completo_do_lote(banco, servidor, monkeypatch):
+    # Uma redação sem resposta do lógico: volta para a fila, as outras são concluídas
+    def responder(custom_id, corpo):
+        if custom_id == f"{falha}:logica":
+            return None
+        return responder_padrao(custom_id, corpo)
+    servidor.responder = responder
+
+    async def cenario():
+        nonlocal falha
+        usuario_id, ids = await _usuario_b2b_com_redacoes(3)
+        falha = ids[0]
+        processador = ProcessadorLotes()
+
+        lote_id = await processador.submeter_novo_lote()
+        assert lote_id
+        for _ in range(4):  # etapas: em andamento, concluída; avaliação: em andamento, concluída
+            await processador.acompanhar_lotes()
+
+        async with SessionLocal() as db:
+            lote = await db.get(LoteAnalise, lote_id)
+            redacoes = {r.id: r for r in (await db.scalars(select(Redacao))).all()}
+            analises = (await db.scalars(select(Analise.id))).all()
+            usuario = await db.get(Usuario, usuario_id)
+            return ids, lote, redacoes, analises, usuario
+
+    falha = None
+    ids, lote, redacoes, analises, usuario = rodar(cenario())
+
+    assert lote.status == StatusLoteEnum.CONCLUIDO.value
+    assert lote.fase == FaseLoteEnum.AVALIACAO.value
+    assert len(servidor.batches) == 2
+    assert sorted(analises) == sorted(ids[1:])
+    assert all(redacoes[i].status == StatusRedacaoEnum.CONCLUIDA for i in ids[1:])
+    assert redacoes[ids[0]].status == StatusRedacaoEnum.PENDENTE
+    assert redacoes[ids[0]].lote_id is None
+    # Contador de ontem: recomeça do zero; a reserva da redação devolvida volta para a cota
+    assert usuario.correcoes_realizadas_hoje == 2
+    assert usuario.data_contador == datetime.utcnow().date()
+
+
+def test_redacoes_sem_cota_ficam_fora_do_lote(banco, servidor):
+    """Lote respeita o limite diário: as excedentes esperam o reset, sem gastar tentativa"""
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario(
+                plano=PlanoEnum.B2B,
+                limite_diario=2,
+                correcoes_realizadas_hoje=1,
+                data_contador=datetime.utcnow().date()
+            )
+            db.add(usuario)
+            await db.flush()
+            db.add_all([nova_redacao(usuario.id) for _ in range(3)])
+            await db.commit()
+
+        lote_id = await ProcessadorLotes().submeter_novo_lote()
+        async with SessionLocal() as db:
+            lote = await db.get(LoteAnalise, lote_id)
+            redacoes = (await db.scalars(select(Redacao))).all()
+            correcoes = await db.scalar(select(Usuario.correcoes_realizadas_hoje))
+        return lote, redacoes, correcoes
+
+    lote, redacoes, correcoes = rodar(cenario())
+    assert len(lote.redacao_ids) == 1
+    assert lote.dia_cota == datetime.utcnow().date()
+    estacionadas = [r for r in redacoes if r.id not in lote.redacao_ids]
+    assert all(r.status == StatusRedacaoEnum.PENDENTE and r.tentativas == 0 for r in estacionadas)
+    assert all(r.agendado_para == proximo_reset_cota() for r in estacionadas)
+    assert correcoes == 2
+
+
+def test_respostas_de_batch_antigo_sao_descartadas(banco, servidor):
+    """Outra instância já avançou o lote: as respostas baixadas não são gravadas"""
+    async def cenario():
+        await _usuario_b2b_com_redacoes(1)
+        processador = ProcessadorLotes()
+        lote_id = await processador.submeter_novo_lote()
+        async with SessionLocal() as db:
+            batch_id = (await db.get(LoteAnalise, lote_id)).provider_batch_id
+
+        avancou = await processador._avancar_lote(lote_id, "batch_antigo", {"x:gramatical": ({}, 1)})
+        async with SessionLocal() as db:
+            lote = await db.get(LoteAnalise, lote_id)
+        return batch_id, avancou, lote
+
+    batch_id, avancou, lote = rodar(cenario())
+    assert batch_id in servidor.batches
+    assert avancou is False
+    assert lote.resultados == {}
+    assert lote.fase == FaseLoteEnum.ETAPAS.value
+
+
+def test_envio_reivindicado_nao_e_repetido(banco, servidor, monkeypatch):
+    """Enquanto uma instância envia a fase, as outras não sobem o mesmo JSONL"""
+    async def cenario():
+        await _usuario_b2b_com_redacoes(1)
+        processador = ProcessadorLotes()
+        enviar_batch = processador._enviar_batch
+
+        async def enviar_com_concorrente(linhas):
+            # Outra instância tenta enviar a mesma fase durante o upload
+            assert await ProcessadorLotes()._enviar_fase(lote_id) is None
+            return await enviar_batch(linhas)
+        monkeypatch.setattr(processador, "_enviar_batch", enviar_com_concorrente)
+
+        async with SessionLocal() as db:
+            lote = LoteAnalise(redacao_ids=[], resultados={}, tokens_utilizados={})
+            db.add(lote)
+            await db.commit()
+            lote_id = lote.id
+        async with SessionLocal() as db:
+            redacao = await db.scalar(select(Redacao))
+            redacao.lote_id = lote_id
+            redacao.status = StatusRedacaoEnum.ANALISANDO
+            lote = await db.get(LoteAnalise, lote_id)
+            lote.redacao_ids = [redacao.id]
+            await db.commit()
+
+        batch_id = await processador._enviar_fase(lote_id)
+        async with SessionLocal() as db:
+            return batch_id, await db.get(LoteAnalise, lote_id)
+
+    batch_id, lote = rodar(cenario())
+    assert len(servidor.batches) == 1
+    assert lote.provider_batch_id == batch_id
+    assert lote.enviando_desde is None
+
+
+def test_sem_chave_falha_na_inicializacao(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEYS", [])
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "")
+    with pytest.raises(RuntimeError, match="OPENAI_API_KEY"):
+        ProcessadorLotes().start()
@@ -0,0 +1,144 @@
+"""
+Worker: estacionamento por cota, conclusão condicionada à lease e recuperação de leases
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app.agents.orquestrador import orquestrador
+from app.config import settings
+from app.database import SessionLocal
+from app.models.analise import Analise
+from app.models.redacao import Redacao, StatusRedacaoEnum
+from app.models.usuario import Usuario
+from app.services.analise_service import criar_analise
+from app.services.redacao_worker import worker
+from tests.conftest import analise_falsa, nova_redacao, novo_usuario, rodar
+
+
+def test_estacionar_por_cota_nao_gasta_tentativa(banco):
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario(correcoes_realizadas_hoje=5, limite_diario=5, data_contador=datetime.utcnow().date())
+            db.add(usuario)
+            await db.flush()
+            db.add(nova_redacao(usuario.id))
+            await db.commit()
+
+        # Reivindicar e estacionar várias vezes (uma por "dia")
+        for _ in range(5):
+            ids = await worker._reivindicar_lote(1)
+            assert len(ids) == 1
+            async with SessionLocal() as db:
+                redacao = await db.scalar(select(Redacao).where(Redacao.id == ids[0]))
+                await worker.processar_redacao_pendente(redacao, db)
+            async with SessionLocal() as db:
+                redacao = await db.scalar(select(Redacao).where(Redacao.id == ids[0]))
+                redacao.agendado_para = None  # A cota "renovou"
+                await db.commit()
+
+        async with SessionLocal() as db:
+            return (await db.execute(select(Redacao.status, Redacao.tentativas))).one()
+
+    status, tentativas = rodar(cenario())
+    assert status == StatusRedacaoEnum.PENDENTE
+    assert tentativas == 0
+
+
+def test_conclusao_exige_lease_propria(banco, monkeypatch):
+    """Lease recuperada durante a análise: a conclusão não sobrescreve o novo dono"""
+    async def analisar(redacao, plano_usuario, redacao_id, **kwargs):
+        # Enquanto a análise roda, o reaper devolve a redação e outro worker a reivindica
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Redacao).where(Redacao.id == redacao_id).values(processado_por="outro-worker")
+            )
+            await db.commit()
+        return analise_falsa(redacao_id)
+    monkeypatch.setattr(orquestrador, "analisar_redacao", analisar)
+
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario()
+            db.add(usuario)
+            await db.flush()
+            db.add(nova_redacao(usuario.id))
+            await db.commit()
+
+        redacao_id, = await worker._reivindicar_lote(1)
+        async with SessionLocal() as db:
+            redacao = await db.scalar(select(Redacao).where(Redacao.id == redacao_id))
+            await worker.processar_redacao_pendente(redacao, db)
+
+        async with SessionLocal() as db:
+            return (
+                await db.scalar(select(func.count(Analise.id))),
+                (await db.execute(select(Redacao.status, Redacao.processado_por))).one(),
+                await db.scalar(select(Usuario.correcoes_realizadas_hoje))
+            )
+
+    analises, (status, dono), correcoes = rodar(cenario())
+    assert analises == 0
+    assert status == StatusRedacaoEnum.ANALISANDO
+    assert dono == "outro-worker"
+    assert correcoes == 0
+
+
+def test_reaper_recupera_analise_sincrona_abandonada(banco):
+    """Redações das rotas síncronas não têm lease: são recuperadas após o tempo máximo da análise"""
+    async def cenario():
+        antiga = datetime.utcnow() - timedelta(
+            seconds=settings.ANALYSIS_TIMEOUT_SECONDS + settings.WORKER_LEASE_SECONDS + 60
+        )
+        async with SessionLocal() as db:
+            usuario = novo_usuario()
+            db.add(usuario)
+            await db.flush()
+            abandonada = nova_redacao(usuario.id, status=StatusRedacaoEnum.ANALISANDO, data_atualizacao=antiga)
+            em_andamento = nova_redacao(usuario.id, status=StatusRedacaoEnum.ANALISANDO)
+            db.add_all([abandonada, em_andamento])
+            await db.commit()
+
+        recuperadas = await worker._recuperar_leases_expiradas()
+        async with SessionLocal() as db:
+            status = dict((await db.execute(select(Redacao.id, Redacao.status))).all())
+        return recuperadas, status[abandonada.id], status[em_andamento.id]
+
+    recuperadas, abandonada, em_andamento = rodar(cenario())
+    assert recuperadas == 1
+    assert abandonada == StatusRedacaoEnum.PENDENTE
+    assert em_andamento == StatusRedacaoEnum.ANALISANDO
+
+
+def test_sessao_livre_durante_a_analise(banco, monkeypatch):
+    """A sessão da preparação não fica com transação aberta enquanto o LLM roda (revisão carrega a base)"""
+    transacao_aberta = []
+
+    async def cenario():
+        async with SessionLocal() as db:
+            usuario = novo_usuario()
+            db.add(usuario)
+            await db.flush()
+            anterior = nova_redacao(usuario.id, status=StatusRedacaoEnum.CONCLUIDA)
+            db.add(anterior)
+            await db.flush()
+            db.add(criar_analise(analise_falsa(anterior.id)))
+            db.add(nova_redacao(usuario.id, revisao_de=anterior.id))
+            await db.commit()
+
+        redacao_id, = await worker._reivindicar_lote(1)
+        async with SessionLocal() as db:
+            async def analisar(redacao, plano_usuario, redacao_id, **kwargs):
+                transacao_aberta.append(db.in_transaction())
+                return analise_falsa(redacao_id)
+            monkeypatch.setattr(orquestrador, "analisar_redacao", analisar)
+
+            redacao = await db.scalar(select(Redacao).where(Redacao.id == redacao_id))
+            await worker.processar_redacao_pendente(redacao, db)
+
+        async with SessionLocal() as db:
+            return await db.scalar(select(Redacao.status))
+
+    assert rodar(cenario()) == StatusRedacaoEnum.CONCLUIDA
+    assert transacao_aberta == [False]